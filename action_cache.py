@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+import action_generation
+import metrics
+
+
+class LRUCache:
+    def __init__(self, maxsize=100_000, name="lru"):
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        metrics.watch_cache(name)
+
+    def get(self, key, compute):
+        """Returns the cached value for key, calling compute() to fill it on a miss."""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            value = compute()
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return value
+        self.hits += 1
+        metrics.CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        self._data.move_to_end(key)
+        return value
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class ActionCache:
+    """
+    Memoizes legal-action generation by state, evicting the least recently used
+    positions once maxsize entries are stored.
+
+    It has the same functions as action_generation, so a search can be handed either.
+    Results are returned as tuples because they are shared between callers.
+
+    Keys are the exact packed state (GameState.pack, which includes the merchant tiles)
+    with the player names, rather than a hash of it or its symmetry-canonical form, so
+    positions never share an entry by collision and the actions name concrete build
+    spaces. Coal and iron sourcing is cheaper than packing the state, so it is passed
+    straight through.
+    """
+
+    coal_options = staticmethod(action_generation.coal_options)
+    iron_options = staticmethod(action_generation.iron_options)
+
+    def __init__(self, maxsize=100_000):
+        self.actions = LRUCache(maxsize, "actions")
+
+    def legal_actions(self, game, player):
+        key = (tuple(game.players), game.pack(), player)
+        return self.actions.get(
+            key, lambda: tuple(action_generation.legal_actions(game, player))
+        )
+
+    def clear(self):
+        self.actions.clear()
+
+    def stats(self):
+        return {"actions": self.actions.stats()}
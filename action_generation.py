@@ -0,0 +1,788 @@
+import heapq
+from collections import deque, namedtuple
+from itertools import combinations, combinations_with_replacement, count
+
+import utils
+from game_entities import INDUSTRY_TYPES
+
+MERCHANT_MARKETS = ("Warrington", "Nottingham", "Shrewsbury", "Gloucester", "Oxford")
+SELLABLE_INDUSTRIES = ("Manufacturer", "Cotton Mill", "Pottery")
+
+# An action is the card discarded plus the GameState method to call with its arguments.
+# kwargs is stored as a tuple of (name, value) pairs so that actions are hashable.
+Action = namedtuple("Action", ["card", "kind", "args", "kwargs"], defaults=((), ()))
+
+_connection_cache = {}
+
+
+def reset_connection_cache():
+    _connection_cache.clear()
+
+
+def _in_era(allowed, era):
+    return allowed == "both" or era in allowed
+
+
+def _connections(map_, extra_links=()):
+    """
+    Returns the adjacency of the built links (by any player) and the connected component
+    of every location, cached on which links are built.
+    """
+    built = tuple(data["player"] is not None for _, _, data in map_.edges(data=True))
+    key = (built, tuple(extra_links))
+    if key in _connection_cache:
+        return _connection_cache[key]
+
+    adjacency = {n: [] for n in map_.nodes}
+    for u, v, data in map_.edges(data=True):
+        if data["player"] is not None:
+            adjacency[u].append(v)
+            adjacency[v].append(u)
+    for u, v in extra_links:
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+
+    components = {}
+    for start in adjacency:
+        if start in components:
+            continue
+        components[start] = start
+        queue = deque([start])
+        while queue:
+            for n in adjacency[queue.popleft()]:
+                if n not in components:
+                    components[n] = start
+                    queue.append(n)
+
+    _connection_cache[key] = (adjacency, components)
+    return adjacency, components
+
+
+def link_distances(map_, starts, extra_links=()):
+    """Returns the number of built links from the nearest start to every reachable location."""
+    adjacency, _ = _connections(map_, extra_links)
+    distances = {start: 0 for start in starts}
+    queue = deque(starts)
+    while queue:
+        n = queue.popleft()
+        for m in adjacency[n]:
+            if m not in distances:
+                distances[m] = distances[n] + 1
+                queue.append(m)
+    return distances
+
+
+def is_connected(map_, loc1, loc2, extra_links=()):
+    if not extra_links:
+        return map_.is_connected(loc1, loc2)
+    _, components = _connections(map_, extra_links)
+    return components[loc1] == components[loc2]
+
+
+def connected_markets(map_, loc, extra_links=()):
+    if not extra_links:
+        return map_.connected_markets(loc)
+    _, components = _connections(map_, extra_links)
+    return [
+        n
+        for n, data in map_.nodes(data=True)
+        if data["type"] == "market" and components[n] == components[loc]
+    ]
+
+
+def connected_to_market(map_, loc, extra_links=()):
+    return bool(connected_markets(map_, loc, extra_links))
+
+
+def player_network(game, player):
+    """
+    Returns the locations in the player's network (those containing their industry tiles
+    or adjacent to their links), or None if they have nothing on the board yet.
+    """
+    network = set()
+    for u, v, data in game.map_.edges(data=True):
+        if data["player"] == player:
+            network.update((u, v))
+    for loc, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            if any(space.owned_by == player for space in data["build_spots"]):
+                network.add(loc)
+    return network or None
+
+
+def resource_spots(game, resource):
+    """Returns {(location, space): amount} for every tile holding the given resource."""
+    spots = {}
+    for loc, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            for i, space in enumerate(data["build_spots"]):
+                if space.resource_type == resource and space.resource_amount > 0:
+                    spots[(loc, i)] = space.resource_amount
+    return spots
+
+
+def coal_options(game, locations, amount, taken=(), extra_links=()):
+    """
+    Returns every way of sourcing the given amount of coal for an action at the given
+    locations. Coal must come from the closest connected coal mines, and only from the
+    coal market once no connected coal remains (which requires a market connection).
+    """
+    if amount == 0:
+        return [()]
+    distances = link_distances(game.map_, locations, extra_links)
+    available = {
+        k: n for k, n in resource_spots(game, "coal").items() if k[0] in distances
+    }
+    for k in taken:
+        if k in available:
+            available[k] -= 1
+    market = any(connected_to_market(game.map_, loc, extra_links) for loc in locations)
+
+    options = set()
+
+    def take(remaining, chosen):
+        if remaining == 0:
+            options.add(tuple(sorted(chosen, key=repr)))
+            return
+        candidates = [k for k, n in available.items() if n]
+        if not candidates:
+            if market:
+                options.add(
+                    tuple(sorted(chosen, key=repr))
+                    + (("coal market", None),) * remaining
+                )
+            return
+        closest = min(distances[k[0]] for k in candidates)
+        for k in candidates:
+            if distances[k[0]] == closest:
+                available[k] -= 1
+                take(remaining - 1, chosen + [k])
+                available[k] += 1
+
+    take(amount, [])
+    return sorted(options, key=repr)
+
+
+def iron_options(game, amount, taken=()):
+    """
+    Returns every way of sourcing the given amount of iron. Iron can come from any
+    ironworks (no connection needed), and from the iron market once none is left.
+    """
+    if amount == 0:
+        return [()]
+    available = resource_spots(game, "iron")
+    for k in taken:
+        if k in available:
+            available[k] -= 1
+    on_board = [k for k, n in available.items() for _ in range(n)]
+    if len(on_board) < amount:
+        return [
+            tuple(sorted(set(on_board), key=repr))
+            + (("iron market", None),) * (amount - len(on_board))
+        ]
+    return sorted(set(combinations(sorted(on_board, key=repr), amount)), key=repr)
+
+
+def cube_cost(game, sources):
+    """Returns the money needed to buy the market cubes among the given sources."""
+    cost, coal, iron = 0, game.coal_market, game.iron_market
+    for loc, _ in sources:
+        if loc == "coal market":
+            cost += utils.coal_cost(coal)
+            coal = max(0, coal - 1)
+        elif loc == "iron market":
+            cost += utils.iron_cost(iron)
+            iron = max(0, iron - 1)
+    return cost
+
+
+def cube_kwargs(names, sources):
+    kwargs = []
+    for name, (loc, space) in zip(names, sources):
+        kwargs.append((name, loc))
+        kwargs.append((f"{name}_space", space))
+    return tuple(kwargs)
+
+
+def card_industries(card):
+    if card == "Wild Industry":
+        return set(INDUSTRY_TYPES)
+    return {industry for industry in INDUSTRY_TYPES if industry in card}
+
+
+class BuildIndex:
+    """
+    Bitsets over every (location, space, industry) a build could fill, fixed by the board
+    data. Each card has a mask of the triples it allows, so the builds a hand allows are
+    found by ORing and ANDing masks instead of matching every card against every space.
+
+    Location cards and "Wild Location" allow their triples anywhere; industry cards and
+    "Wild Industry" only within the player's network, so their masks are ANDed with
+    network_mask() unless the player has nothing on the board yet.
+    """
+
+    def __init__(self, map_):
+        self.triples = []
+        self.location_masks = {}
+        self.industry_masks = {industry: 0 for industry in INDUSTRY_TYPES}
+        for loc, data in map_.nodes(data=True):
+            if data["type"] != "location":
+                continue
+            self.location_masks[loc] = 0
+            for i, space in enumerate(data["build_spots"]):
+                for industry in space.allowed_industries:
+                    bit = 1 << len(self.triples)
+                    self.triples.append((loc, i, industry))
+                    self.location_masks[loc] |= bit
+                    self.industry_masks[industry] |= bit
+        self.bits = {triple: 1 << i for i, triple in enumerate(self.triples)}
+        self.all = (1 << len(self.triples)) - 1
+        self._card_masks = {}
+
+    def card_mask(self, card):
+        """Returns the triples the card allows, before any network restriction."""
+        if card not in self._card_masks:
+            if card == "Wild Location":
+                mask = self.all
+            elif card in self.location_masks:
+                mask = self.location_masks[card]
+            else:
+                mask = 0
+                for industry in card_industries(card):
+                    mask |= self.industry_masks.get(industry, 0)
+            self._card_masks[card] = mask
+        return self._card_masks[card]
+
+    def network_mask(self, network):
+        mask = 0
+        for loc in network:
+            mask |= self.location_masks.get(loc, 0)
+        return mask
+
+    def hand_masks(self, cards, network):
+        """Returns {card: mask} of the triples each card allows the player to build."""
+        in_network = self.all if network is None else self.network_mask(network)
+        masks = {}
+        for card in cards:
+            mask = self.card_mask(card)
+            if card != "Wild Location" and card not in self.location_masks:
+                mask &= in_network
+            masks[card] = mask
+        return masks
+
+    def locations(self, mask):
+        """Returns the locations with any triple in the mask, in map order."""
+        return [loc for loc, m in self.location_masks.items() if m & mask]
+
+
+_build_indexes = {}
+
+
+def build_index(map_):
+    key = tuple(map_.nodes)
+    if key not in _build_indexes:
+        _build_indexes[key] = BuildIndex(map_)
+    return _build_indexes[key]
+
+
+def build_cards(game, industry, location, network, cards):
+    """Returns the cards in hand that allow building the industry at the location."""
+    map_ = game.map_
+    usable = []
+    for card in cards:
+        if card in ("Wild Location", location):
+            usable.append(card)
+        elif industry in card_industries(card) and card not in map_.nodes:
+            if network is None or location in network:
+                usable.append(card)
+    return usable
+
+
+def build_spaces(game, player, tile, locations=None):
+    """
+    Returns the (location, space) pairs where the player may place the given tile,
+    looking only at the given locations if any.
+    """
+    coal_left = game.coal_market or resource_spots(game, "coal")
+    iron_left = game.iron_market or resource_spots(game, "iron")
+    spaces = []
+    nodes = game.map_.nodes
+    if locations is None:
+        locations = [n for n, data in nodes(data=True) if data["type"] == "location"]
+    for loc in locations:
+        spots = nodes[loc]["build_spots"]
+        own = [i for i, s in enumerate(spots) if s.owned_by == player]
+        empty = [
+            i
+            for i, s in enumerate(spots)
+            if s.industry is None and tile.type in s.allowed_industries
+        ]
+        # Spaces showing only this industry must be used before shared spaces.
+        single = [i for i in empty if spots[i].allowed_industries == [tile.type]]
+        candidates = single or empty
+        if game.era == "canal" and own:
+            candidates = []
+        for i, space in enumerate(spots):
+            if space.industry is None or tile.type not in space.allowed_industries:
+                continue
+            current = game.industries[space.industry]
+            if current.type != tile.type or current.level >= tile.level:
+                continue
+            if game.era == "canal" and own and own != [i]:
+                continue
+            if space.owned_by == player:
+                candidates.append(i)
+            elif tile.type == "Coal Mine" and not coal_left:
+                candidates.append(i)
+            elif tile.type == "Ironworks" and not iron_left:
+                candidates.append(i)
+        spaces.extend((loc, i) for i in candidates)
+    return spaces
+
+
+def legal_builds(game, player, cards=None):
+    p = game.players[player]
+    cards = sorted(set(p.cards if cards is None else cards))
+    index = build_index(game.map_)
+    hand = index.hand_masks(cards, player_network(game, player))
+    reach = 0
+    for mask in hand.values():
+        reach |= mask
+    actions = []
+    for industry in INDUSTRY_TYPES:
+        if not p.industry_tiles[industry]:
+            continue
+        tile = game.industries[p.industry_tiles[industry][0]]
+        reachable = reach & index.industry_masks[industry]
+        if not reachable or not _in_era(tile.era, game.era):
+            continue
+        locations = index.locations(reachable)
+        for loc, space in build_spaces(game, player, tile, locations):
+            bit = index.bits[(loc, space, industry)]
+            usable = [card for card, mask in hand.items() if mask & bit]
+            if not usable:
+                continue
+            market_connection = industry == "Coal Mine" and connected_to_market(
+                game.map_, loc
+            )
+            for coal in coal_options(game, (loc,), tile.coal_cost):
+                for iron in iron_options(game, tile.iron_cost):
+                    cubes = coal + iron
+                    if len(cubes) > 2:  # GameState.build takes at most two cubes.
+                        continue
+                    if tile.cost + cube_cost(game, cubes) > p.money:
+                        continue
+                    kwargs = cube_kwargs(("cube1", "cube2"), cubes)
+                    if market_connection:
+                        kwargs += (("market_connection", True),)
+                    for card in usable:
+                        actions.append(
+                            Action(card, "build", (industry, loc, space), kwargs)
+                        )
+    return actions
+
+
+def _link_edges(game, network):
+    """Returns the unbuilt links that may be built this era next to the given network."""
+    edges = []
+    for u, v, data in game.map_.edges(data=True):
+        if data["player"] is not None or not _in_era(data["type"], game.era):
+            continue
+        # The links to Farm Brewery South are placed together with Kidderminster-Worcester,
+        # so only that link is offered.
+        if "Farm Brewery South" in (u, v):
+            continue
+        if network is None or _link_ends(u, v) & network:
+            edges.append((u, v))
+    return edges
+
+
+def _link_ends(u, v):
+    if {u, v} == {"Kidderminster", "Worcester"}:
+        return {u, v, "Farm Brewery South"}
+    return {u, v}
+
+
+def _beer_spots(game, player, locations, extra_links=()):
+    """Own breweries anywhere, plus other players' breweries connected to the locations."""
+    spots = resource_spots(game, "beer")
+    usable = []
+    for (loc, i), amount in spots.items():
+        space = game.map_.nodes[loc]["build_spots"][i]
+        if space.owned_by == player or any(
+            is_connected(game.map_, loc, end, extra_links) for end in locations
+        ):
+            usable.append(((loc, i), amount))
+    return usable
+
+
+def network_actions(game, player, edge1, edge2=None):
+    """
+    Yields the network actions placing the given link (or pair of rail links), one for each
+    way of sourcing the coal and beer the player can afford. Whether the links themselves
+    may be built is not checked here.
+    """
+    p = game.players[player]
+    if game.era == "canal":
+        if p.money >= 3:
+            yield Action(None, "network", edge1)
+        return
+
+    if edge2 is None:
+        for coal in coal_options(game, edge1, 1, extra_links=(edge1,)):
+            if 5 + cube_cost(game, coal) <= p.money:
+                yield Action(None, "network", edge1, cube_kwargs(("coal1",), coal))
+        return
+
+    links = (edge1, edge2)
+    for coal1 in coal_options(game, edge1, 1, extra_links=links):
+        for coal2 in coal_options(game, edge2, 1, coal1, extra_links=links):
+            coal = coal1 + coal2
+            if 15 + cube_cost(game, coal) > p.money:
+                continue
+            for beer, _ in _beer_spots(game, player, edge2, links):
+                kwargs = (
+                    ("link2_start", edge2[0]),
+                    ("link2_end", edge2[1]),
+                ) + cube_kwargs(("coal1", "coal2", "beer"), coal + (beer,))
+                yield Action(None, "network", edge1, kwargs)
+
+
+def double_links(game, player, edges=None):
+    """Returns the pairs of rail links the player may place with one network action."""
+    network = player_network(game, player)
+    if edges is None:
+        edges = _link_edges(game, network)
+    pairs = []
+    for i, edge1 in enumerate(edges):
+        # The second link only has to touch the network once the first has been placed.
+        extended = (network or set()) | _link_ends(*edge1)
+        for edge2 in _link_edges(game, extended):
+            if edge2 == edge1 or edge2 in edges[:i]:  # Same pair in the other order.
+                continue
+            pairs.append((edge1, edge2))
+    return pairs
+
+
+def legal_links(game, player):
+    """
+    Returns the links and the pairs of rail links the player may place, before checking
+    whether they can pay for them.
+    """
+    p = game.players[player]
+    if p.link_tiles < 1:
+        return [], []
+    edges = _link_edges(game, player_network(game, player))
+    pairs = []
+    if game.era == "rail" and p.link_tiles >= 2:
+        pairs = double_links(game, player, edges)
+    return edges, pairs
+
+
+def legal_networks(game, player):
+    edges, pairs = legal_links(game, player)
+    actions = []
+    for edge in edges:
+        actions.extend(network_actions(game, player, edge))
+    for edge1, edge2 in pairs:
+        actions.extend(network_actions(game, player, edge1, edge2))
+    return actions
+
+
+def legal_develops(game, player):
+    p = game.players[player]
+
+    def developable(industry, n):
+        tiles = p.industry_tiles[industry]
+        return len(tiles) > n and game.industries[tiles[n]].develop
+
+    actions = []
+    singles = [ind for ind in INDUSTRY_TYPES if developable(ind, 0)]
+    for industry in singles:
+        for iron in iron_options(game, 1):
+            if cube_cost(game, iron) <= p.money:
+                kwargs = cube_kwargs(("iron1",), iron)
+                actions.append(Action(None, "develop", (industry,), kwargs))
+    for industry1, industry2 in combinations_with_replacement(singles, 2):
+        if industry1 == industry2 and not developable(industry1, 1):
+            continue
+        for iron in iron_options(game, 2):
+            if cube_cost(game, iron) <= p.money:
+                kwargs = cube_kwargs(("iron1", "iron2"), iron)
+                actions.append(Action(None, "develop", (industry1, industry2), kwargs))
+    return actions
+
+
+def merchant_slots(game, loc, industry_type):
+    """Returns the (market, slot) pairs with a merchant buying the industry type from loc."""
+    slots = []
+    for market in connected_markets(game.map_, loc):
+        merchants = game.map_.nodes[market]["market"].merchants
+        for i, merchant in enumerate(merchants):
+            if merchant in (industry_type, "Wild"):
+                slots.append((market, i))
+    return slots
+
+
+def sellable_tiles(game, player):
+    tiles = []
+    for loc, data in game.map_.nodes(data=True):
+        if data["type"] != "location":
+            continue
+        for i, space in enumerate(data["build_spots"]):
+            if space.owned_by != player or space.flipped or space.industry is None:
+                continue
+            tile = game.industries[space.industry]
+            if tile.type in SELLABLE_INDUSTRIES and merchant_slots(
+                game, loc, tile.type
+            ):
+                tiles.append((loc, i))
+    return tiles
+
+
+# Rough values used to order sells: how much one unit of each merchant bonus is worth.
+BONUS_VALUES = {"vps": 1, "money": 0.5, "income": 1, "develop": 2}
+
+
+def _beer_sources(game, player, loc, tile, used):
+    """Returns the beer cubes (with repeats) usable to sell a tile, given beer already used."""
+    sources = []
+    for market, i in merchant_slots(game, loc, tile.type):
+        if game.map_.nodes[market]["market"].beer[i] and (market, i) not in used:
+            sources.append((market, i))
+    for k, amount in _beer_spots(game, player, (loc,)):
+        sources.extend([k] * (amount - used.count(k)))
+    return sources
+
+
+def _tile_class(game, tile):
+    loc, i = tile
+    space = game.map_.nodes[loc]["build_spots"][i]
+    return loc, space.industry, tuple(space.allowed_industries)
+
+
+def first_sell_tiles(game, player):
+    """
+    Returns the tiles that iter_sells can list first in a sell: those with enough beer to
+    be sold on their own, skipping copies of an identical tile earlier in the same location.
+    """
+    tiles, seen = [], set()
+    for loc, i in sellable_tiles(game, player):
+        tile = game.industries[game.map_.nodes[loc]["build_spots"][i].industry]
+        tile_class = _tile_class(game, (loc, i))
+        if tile_class in seen:
+            continue
+        seen.add(tile_class)
+        if len(_beer_sources(game, player, loc, tile, [])) >= tile.beers_to_sell:
+            tiles.append((loc, i))
+    return tiles
+
+
+def _beer_signature(game, player, source, k, used, dominance):
+    """
+    Returns what consuming k cubes from a beer source looks like. Sources with the same
+    signature lead to positions that only differ by which equivalent spot was used.
+
+    Spots in the same location with the same tile, owner, cubes and allowed industries are
+    always interchangeable. With dominance, cubes that do not flip a brewery are also
+    treated as interchangeable per owner, since taking them has the same immediate effect.
+    """
+    loc, i = source
+    if loc in MERCHANT_MARKETS:
+        market = game.map_.nodes[loc]["market"]
+        return ("merchant", loc, market.merchants[i])
+    space = game.map_.nodes[loc]["build_spots"][i]
+    remaining = space.resource_amount - used.count(source)
+    flips = k == remaining
+    if dominance and not flips:
+        return ("brewery", space.owned_by, k)
+    return (
+        "brewery",
+        loc,
+        space.owned_by,
+        space.industry,
+        tuple(space.allowed_industries),
+        remaining,
+        k,
+    )
+
+
+def _beer_value(game, player, source, flips):
+    loc, i = source
+    if loc in MERCHANT_MARKETS:
+        bonus = game.map_.nodes[loc]["market"].bonus
+        return BONUS_VALUES[bonus[0]] * (bonus[1] if len(bonus) > 1 else 1)
+    space = game.map_.nodes[loc]["build_spots"][i]
+    tile = game.industries[space.industry]
+    flip_value = tile.points + tile.income
+    if space.owned_by == player:
+        return flip_value if flips else -0.5
+    return -flip_value / 2 if flips else 0
+
+
+def _tile_beer_options(game, player, loc, tile, used, dominance):
+    """
+    Returns (value, beer) for every distinct way of supplying the beer to sell one tile,
+    keeping one representative per signature.
+    """
+    sources = _beer_sources(game, player, loc, tile, used)
+    options = {}
+    for beer in combinations(sorted(sources, key=repr), tile.beers_to_sell):
+        counts = {}
+        for source in beer:
+            counts[source] = counts.get(source, 0) + 1
+        signature, value = [], 0
+        for source, k in counts.items():
+            signature.append(_beer_signature(game, player, source, k, used, dominance))
+            flips = source[0] not in MERCHANT_MARKETS and k == (
+                game.map_.nodes[source[0]]["build_spots"][source[1]].resource_amount
+                - used.count(source)
+            )
+            value += _beer_value(game, player, source, flips) * (1 if flips else k)
+        options.setdefault(tuple(sorted(signature, key=repr)), (value, beer))
+    return sorted(options.values(), key=lambda option: -option[0])
+
+
+def _develop_bonus(game, used):
+    return any(
+        loc in MERCHANT_MARKETS and game.map_.nodes[loc]["market"].bonus[0] == "develop"
+        for loc, _ in used
+    )
+
+
+def _tile_value(tile):
+    return tile.points + tile.income + tile.link_points
+
+
+def iter_sells(game, player, dominance=True):
+    """
+    Lazily yields sell actions in descending order of a rough immediate value (flipped tile
+    points, income and merchant bonuses, less the cost of feeding opponents' breweries).
+
+    Sells are grown one tile at a time in a best-first search. Each partial sell is queued
+    with an optimistic bound on what adding more tiles could gain, so a sell is only yielded
+    once nothing still queued can beat it. Tiles and beer cubes that are interchangeable
+    are only tried once (see _beer_signature).
+    """
+    tiles = sellable_tiles(game, player)
+    p = game.players[player]
+    developable = [
+        ind
+        for ind in INDUSTRY_TYPES
+        if p.industry_tiles[ind] and game.industries[p.industry_tiles[ind][0]].develop
+    ]
+    tile_ids = [game.map_.nodes[loc]["build_spots"][i].industry for loc, i in tiles]
+    tile_classes = [_tile_class(game, tile) for tile in tiles]
+
+    # Optimistic value of each tile, using the best any beer cube could ever be worth.
+    best_beer = 0
+    for loc, i in tiles:
+        tile = game.industries[game.map_.nodes[loc]["build_spots"][i].industry]
+        for source in set(_beer_sources(game, player, loc, tile, [])):
+            best_beer = max(best_beer, _beer_value(game, player, source, True))
+    suffix = [0] * (len(tiles) + 1)
+    for j in range(len(tiles) - 1, -1, -1):
+        tile = game.industries[tile_ids[j]]
+        optimistic = _tile_value(tile) + tile.beers_to_sell * best_beer
+        suffix[j] = suffix[j + 1] + max(0, optimistic)
+
+    counter = count()
+    queue = [(-suffix[0], next(counter), False, 0, (), (), (), 0)]
+    while queue:
+        _, _, complete, value, sold, beers, used, start = heapq.heappop(queue)
+        if complete:
+            if _develop_bonus(game, used):
+                for industry in developable:
+                    yield Action(None, "sell", (sold, beers, industry))
+            else:
+                yield Action(None, "sell", (sold, beers, None))
+            continue
+        if sold:
+            heapq.heappush(
+                queue, (-value, next(counter), True, value, sold, beers, used, start)
+            )
+        for j in range(start, len(tiles)):
+            # Identical tiles in the same location are only sold in order.
+            if tile_classes[j] in tile_classes[start:j]:
+                continue
+            loc, i = tiles[j]
+            tile = game.industries[tile_ids[j]]
+            options = _tile_beer_options(game, player, loc, tile, list(used), dominance)
+            for beer_value, beer in options:
+                child_value = value + _tile_value(tile) + beer_value
+                heapq.heappush(
+                    queue,
+                    (
+                        -(child_value + suffix[j + 1]),
+                        next(counter),
+                        False,
+                        child_value,
+                        sold + ((loc, i),),
+                        beers + (beer,),
+                        used + beer,
+                        j + 1,
+                    ),
+                )
+
+
+def legal_sells(game, player):
+    # Only the exact symmetries are pruned here, so searches relying on this stay exact.
+    return list(iter_sells(game, player, dominance=False))
+
+
+def can_loan(game, player):
+    # Income may not drop below -10, and no loans once the rail era deck has run out.
+    deck_exhausted = game.era == "rail" and not game.deck
+    income = game.players[player].income
+    return utils.income_level(income) - 3 >= -10 and not deck_exhausted
+
+
+def can_scout(game, player):
+    p = game.players[player]
+    return (
+        game.wild_location_cards
+        and game.wild_industry_cards
+        and "Wild Location" not in p.cards
+        and "Wild Industry" not in p.cards
+    )
+
+
+def legal_scouts(game, player):
+    if not can_scout(game, player):
+        return []
+    p = game.players[player]
+    actions = []
+    for card in sorted(set(p.cards)):
+        rest = list(p.cards)
+        rest.remove(card)
+        for pair in sorted(set(combinations(sorted(rest), 2))):
+            actions.append(Action(card, "scout", pair))
+    return actions
+
+
+def legal_actions(game, player):
+    """
+    Returns every legal action for the player. Only builds depend on the card discarded,
+    so every other action is offered once per distinct card in hand.
+    """
+    p = game.players[player]
+    cards = sorted(set(p.cards))
+    actions = legal_builds(game, player)
+    others = legal_sells(game, player)
+    others += legal_networks(game, player)
+    others += legal_develops(game, player)
+    if can_loan(game, player):
+        others.append(Action(None, "loan"))
+    others.append(Action(None, "pass"))
+    scouts = legal_scouts(game, player)
+    for card in cards:
+        actions.extend(action._replace(card=card) for action in others)
+        actions.extend(action for action in scouts if action.card == card)
+    return actions
+
+
+def apply_action(game, player, action):
+    if action.card is not None:  # Actions without a card are applied as is.
+        game.discard(player, action.card)
+    if action.kind != "pass":
+        getattr(game, action.kind)(player, *action.args, **dict(action.kwargs))
@@ -0,0 +1,404 @@
+import csv
+import json
+from bisect import bisect_right
+from itertools import combinations_with_replacement
+
+import numpy as np
+
+import action_generation
+from action_cache import LRUCache
+from action_generation import Action
+from game_entities import INDUSTRY_TYPES
+
+WILD_CARDS = ("Wild Location", "Wild Industry")
+
+
+def _edge_key(u, v):
+    return frozenset((u, v))
+
+
+class ActionSpace:
+    """
+    Maps every action to a stable integer index, fixed by the board data, and computes
+    masks of the legal indices for a game state.
+
+    Layout:
+    - Builds: one block per (location, space, industry) and card that could allow it
+      (the location card, each industry card naming the industry and both wild cards).
+      Within a block there is one index per way of sourcing up to two coal/iron cubes.
+    - Everything else, repeated once per card in the card list as the discarded card:
+      single links, pairs of rail links, develops (one or two industries), sells (one
+      index per tile space, for the sells listing that tile first), loan, pass and
+      scouts (one index per pair of extra cards).
+
+    Where an index leaves a choice open (coal and beer for links, iron for develops, beer
+    and further tiles for sells), decode() resolves it with the first legal option, in the
+    order action_generation produces them.
+
+    Masks are memoized by position (GameState.pack) for the last cache_size positions,
+    so the mask and decode() calls of an environment step share one computation. Cached
+    masks are read-only.
+
+    A new position's mask is built up incrementally from sections (builds, links,
+    develops, first sells, scouts), each memoized on only the part of the state it reads,
+    so a step only recomputes the sections it touched; after an opponent's loan or pass
+    nothing is. Links and develops are checked for any affordable way of sourcing them
+    rather than listing every one.
+    """
+
+    def __init__(self, player_count=4, cache_size=10_000):
+        with open("inputs.json", "r", encoding="utf-8") as f:
+            self.industries = json.load(f)["categories"]["industries"]
+        with open("locations.json", "r", encoding="utf-8") as f:
+            locations = json.load(f)
+        with open("links.json", "r", encoding="utf-8") as f:
+            links = json.load(f)
+        with open("industry_tiles.json", "r", encoding="utf-8") as f:
+            tiles = json.load(f)
+        self.cards = []
+        with open("cards.csv", mode="r", encoding="utf-8") as file:
+            for row in csv.reader(file):
+                if int(row[player_count - 1]) and row[0] not in self.cards:
+                    self.cards.append(row[0])
+        self.cards.extend(WILD_CARDS)
+        self.card_index = {card: i for i, card in enumerate(self.cards)}
+
+        self.spaces = [
+            (loc["name"], i) for loc in locations for i in range(len(loc["industries"]))
+        ]
+        self.space_index = {space: i for i, space in enumerate(self.spaces)}
+        coal_spaces = [
+            (loc["name"], i)
+            for loc in locations
+            for i, allowed in enumerate(loc["industries"])
+            if "Coal Mine" in allowed
+        ]
+        iron_spaces = [
+            (loc["name"], i)
+            for loc in locations
+            for i, allowed in enumerate(loc["industries"])
+            if "Ironworks" in allowed
+        ]
+
+        # Cube patterns per industry, from the coal and iron each of its tiles needs.
+        self.patterns = {}
+        self.pattern_lists = {}
+        for industry in self.industries:
+            shapes = {
+                (tile["coal_cost"], tile["iron_cost"])
+                for tile in tiles
+                if tile["type"] == industry
+                and tile["coal_cost"] + tile["iron_cost"] <= 2
+            }
+            patterns = {}
+            for coal, iron in sorted(shapes):
+                coal_sources = [("coal market", None)] + coal_spaces
+                iron_sources = [("iron market", None)] + iron_spaces
+                for c in combinations_with_replacement(coal_sources, coal):
+                    for i in combinations_with_replacement(iron_sources, iron):
+                        patterns.setdefault(self._pattern_key(c + i), len(patterns))
+            self.patterns[industry] = patterns
+            self.pattern_lists[industry] = list(patterns)
+
+        location_names = {loc["name"] for loc in locations}
+        self.build_blocks = []
+        self.build_offsets = []
+        size = 0
+        for loc in locations:
+            for space, allowed in enumerate(loc["industries"]):
+                for industry in allowed:
+                    cards = [
+                        card
+                        for card in self.cards
+                        if card in (loc["name"], *WILD_CARDS)
+                        or (
+                            industry in action_generation.card_industries(card)
+                            and card not in location_names
+                        )
+                    ]
+                    for card in cards:
+                        self.build_blocks.append((loc["name"], space, industry, card))
+                        self.build_offsets.append(size)
+                        size += len(self.patterns[industry])
+        self.build_block_index = {block: i for i, block in enumerate(self.build_blocks)}
+        self.build_size = size
+
+        self.edges = []
+        for link in links:
+            u, v = link["locations"]
+            if "Farm Brewery South" not in (u, v):
+                self.edges.append((u, v))
+        self.edge_index = {_edge_key(*edge): i for i, edge in enumerate(self.edges)}
+        self.edge_pairs = [
+            (i, j)
+            for i in range(len(self.edges))
+            for j in range(i + 1, len(self.edges))
+        ]
+        self.edge_pair_index = {pair: i for i, pair in enumerate(self.edge_pairs)}
+        self.develops = [(industry,) for industry in self.industries]
+        self.develops += list(combinations_with_replacement(self.industries, 2))
+        self.develop_index = {develop: i for i, develop in enumerate(self.develops)}
+        self.scouts = list(combinations_with_replacement(range(len(self.cards)), 2))
+        self.scout_index = {pair: i for i, pair in enumerate(self.scouts)}
+
+        # Offsets of each action kind inside the block repeated for every card.
+        self.block_offsets = {}
+        self.block_kinds = []
+        offset = 0
+        for kind, n in (
+            ("network", len(self.edges)),
+            ("double network", len(self.edge_pairs)),
+            ("develop", len(self.develops)),
+            ("sell", len(self.spaces)),
+            ("loan", 1),
+            ("pass", 1),
+            ("scout", len(self.scouts)),
+        ):
+            self.block_offsets[kind] = offset
+            self.block_kinds.append((kind, offset, n))
+            offset += n
+        self.block_size = offset
+        self.size = self.build_size + len(self.cards) * self.block_size
+        self.positions = LRUCache(cache_size, "masks")
+        self.sections = LRUCache(cache_size, "mask sections")
+        self.orientation = None  # Each link as game.map_.edges() has it.
+
+    @staticmethod
+    def _pattern_key(sources):
+        return tuple(sorted(sources, key=repr))
+
+    def index(self, action):
+        """Returns the index of an action (with its card) from action_generation."""
+        if action.kind == "build":
+            kwargs = dict(action.kwargs)
+            industry, loc, space = action.args
+            block = self.build_block_index[(loc, space, industry, action.card)]
+            sources = [
+                (kwargs[name], kwargs[f"{name}_space"])
+                for name in ("cube1", "cube2")
+                if kwargs.get(name) is not None
+            ]
+            pattern = self.patterns[industry][self._pattern_key(sources)]
+            return self.build_offsets[block] + pattern
+
+        card = self.card_index[action.card]
+        return self.build_size + card * self.block_size + self._block_offset(action)
+
+    def _block_offset(self, action):
+        """Returns where a non-build action sits in the block repeated for each card."""
+        kwargs = dict(action.kwargs)
+        if action.kind == "network":
+            edge = self.edge_index[_edge_key(*action.args)]
+            if kwargs.get("link2_start") is None:
+                return self.block_offsets["network"] + edge
+            edge2 = _edge_key(kwargs["link2_start"], kwargs["link2_end"])
+            edge2 = self.edge_index[edge2]
+            pair = self.edge_pair_index[(min(edge, edge2), max(edge, edge2))]
+            return self.block_offsets["double network"] + pair
+        if action.kind == "develop":
+            develop = tuple(
+                sorted(
+                    (ind for ind in action.args if ind is not None),
+                    key=self.industries.index,
+                )
+            )
+            return self.block_offsets["develop"] + self.develop_index[develop]
+        if action.kind == "sell":
+            space = self.space_index[action.args[0][0]]
+            return self.block_offsets["sell"] + space
+        if action.kind == "scout":
+            pair = tuple(sorted(self.card_index[card] for card in action.args))
+            return self.block_offsets["scout"] + self.scout_index[pair]
+        return self.block_offsets[action.kind]
+
+    def _position(self, game, player):
+        key = (tuple(game.players), game.pack(), player)
+        return self.positions.get(key, lambda: self._compute(game, player))
+
+    def mask(self, game, player):
+        """Returns a boolean array with True at the index of every legal action."""
+        return self._position(game, player)["mask"]
+
+    def _compute(self, game, player):
+        mask = np.zeros(self.size, dtype=bool)
+        mask.flags.writeable = False
+        position = {"mask": mask, "sell_tiles": (), "sells": None}
+        p = game.players[player]
+        cards = np.array(sorted({self.card_index[card] for card in p.cards}), dtype=int)
+        if not len(cards):
+            return position
+        mask.flags.writeable = True
+
+        links, spaces, beer = self._board_state(game)
+        hand = tuple(sorted(p.cards))
+        stacks = tuple(tuple(p.industry_tiles[ind][:2]) for ind in INDUSTRY_TYPES)
+        markets = (game.coal_market, game.iron_market)
+        section = self.sections.get
+        builds = section(
+            ("builds", player, game.era, hand, p.money, stacks, links, spaces, markets),
+            lambda: self._builds(game, player),
+        )
+        mask[builds] = True
+
+        # Apart from scouting, the same actions are legal whichever card is discarded,
+        # so they are worked out once and written into every card's block together.
+        block = np.zeros(self.block_size, dtype=bool)
+        networks = section(
+            (
+                "links",
+                player,
+                game.era,
+                p.money,
+                p.link_tiles,
+                links,
+                spaces,
+                game.coal_market,
+            ),
+            lambda: self._networks(game, player),
+        )
+        block[networks] = True
+        develops = section(
+            ("develops", player, p.money, stacks, spaces, game.iron_market),
+            lambda: self._develops(game, player),
+        )
+        block[develops] = True
+        position["sell_tiles"] = section(
+            ("sells", player, links, spaces, beer),
+            lambda: tuple(action_generation.first_sell_tiles(game, player)),
+        )
+        for tile in position["sell_tiles"]:
+            block[self.block_offsets["sell"] + self.space_index[tile]] = True
+        if action_generation.can_loan(game, player):
+            block[self.block_offsets["loan"]] = True
+        block[self.block_offsets["pass"]] = True
+        blocks = mask[self.build_size :].reshape(len(self.cards), self.block_size)
+        blocks[cards] = block
+
+        scouts = section(
+            ("scouts", hand, bool(action_generation.can_scout(game, player))),
+            lambda: [
+                self.index(action)
+                for action in action_generation.legal_scouts(game, player)
+            ],
+        )
+        mask[scouts] = True
+        mask.flags.writeable = False
+        return position
+
+    @staticmethod
+    def _board_state(game):
+        """Returns the link owners, build space contents and merchant tiles and beer."""
+        links = tuple(data["player"] for _, _, data in game.map_.edges(data=True))
+        spaces, beer = [], []
+        for _, data in game.map_.nodes(data=True):
+            if data["type"] == "location":
+                spaces.extend(
+                    (s.industry, s.owned_by, s.flipped, s.resource_amount)
+                    for s in data["build_spots"]
+                )
+            else:
+                market = data["market"]
+                beer.append((tuple(market.merchants), tuple(market.beer)))
+        return links, tuple(spaces), tuple(beer)
+
+    def _builds(self, game, player):
+        return [
+            self.index(action)
+            for action in action_generation.legal_builds(game, player)
+        ]
+
+    def _networks(self, game, player):
+        """Returns the block offsets of the links the player can place and pay for."""
+        offsets = []
+        edges, pairs = action_generation.legal_links(game, player)
+        for edge in edges:
+            if next(action_generation.network_actions(game, player, edge), None):
+                offsets.append(
+                    self.block_offsets["network"] + self.edge_index[_edge_key(*edge)]
+                )
+        for edge1, edge2 in pairs:
+            if next(
+                action_generation.network_actions(game, player, edge1, edge2), None
+            ):
+                pair = sorted(
+                    self.edge_index[_edge_key(*edge)] for edge in (edge1, edge2)
+                )
+                offsets.append(
+                    self.block_offsets["double network"]
+                    + self.edge_pair_index[tuple(pair)]
+                )
+        return offsets
+
+    def _develops(self, game, player):
+        return [
+            self._block_offset(action)
+            for action in action_generation.legal_develops(game, player)
+        ]
+
+    def _first_sell(self, game, player, tile):
+        """Returns the first sell listing tile first, from one pass over iter_sells."""
+        position = self._position(game, player)
+        if position["sells"] is None:
+            sells = {}
+            wanted = set(position["sell_tiles"])
+            for sell in action_generation.iter_sells(game, player):
+                sells.setdefault(sell.args[0][0], sell)
+                if wanted <= sells.keys():
+                    break
+            position["sells"] = sells
+        return position["sells"].get(tile)
+
+    def decode(self, index, game, player):
+        """Returns the Action for an index, resolving any choices it leaves open."""
+        if index < self.build_size:
+            block = bisect_right(self.build_offsets, index) - 1
+            loc, space, industry, card = self.build_blocks[block]
+            pattern = self.pattern_lists[industry][index - self.build_offsets[block]]
+            kwargs = action_generation.cube_kwargs(("cube1", "cube2"), pattern)
+            if industry == "Coal Mine" and action_generation.connected_to_market(
+                game.map_, loc
+            ):
+                kwargs += (("market_connection", True),)
+            return Action(card, "build", (industry, loc, space), kwargs)
+
+        card, offset = divmod(index - self.build_size, self.block_size)
+        card = self.cards[card]
+        kind, start = next(
+            (kind, start)
+            for kind, start, n in self.block_kinds
+            if start <= offset < start + n
+        )
+        i = offset - start
+        if kind == "network":
+            if self.orientation is None:
+                self.orientation = {
+                    _edge_key(*edge): edge for edge in game.map_.edges()
+                }
+            edge = self.orientation[_edge_key(*self.edges[i])]
+            action = next(action_generation.network_actions(game, player, edge))
+        elif kind == "double network":
+            # Try the links in whichever order the player is allowed to place them.
+            target = {_edge_key(*self.edges[j]) for j in self.edge_pairs[i]}
+            action = next(
+                action
+                for edge1, edge2 in action_generation.double_links(game, player)
+                if {_edge_key(*edge1), _edge_key(*edge2)} == target
+                for action in action_generation.network_actions(
+                    game, player, edge1, edge2
+                )
+            )
+        elif kind == "develop":
+            develop = tuple(sorted(self.develops[i], key=INDUSTRY_TYPES.index))
+            iron = action_generation.iron_options(game, len(develop))[0]
+            names = ("iron1", "iron2")[: len(develop)]
+            kwargs = action_generation.cube_kwargs(names, iron)
+            action = Action(None, "develop", develop, kwargs)
+        elif kind == "sell":
+            action = self._first_sell(game, player, self.spaces[i])
+        elif kind == "scout":
+            action = Action(
+                None, "scout", tuple(sorted(self.cards[j] for j in self.scouts[i]))
+            )
+        else:
+            action = Action(None, kind)
+        return action._replace(card=card)
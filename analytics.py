@@ -0,0 +1,308 @@
+import csv
+import glob
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from game_entities import INDUSTRY_TYPES, MERCHANTS, STARTING_TILES
+
+VP_CATEGORIES = tuple(
+    f"vps_{era}_{category}"
+    for era in ("canal", "rail")
+    for category in ("merchants", "links", "industries", "penalties")
+)
+MAX_LEVEL = 8
+# 2-player eras have 10 rounds, with income taken after all but the last.
+INCOME_PHASES = 18
+
+GAME_COLUMNS = ("game", "path", "players", "winner", "winning_vps")
+PLAYER_COLUMNS = (
+    ("game", "seat", "name", "won", "vps")
+    + VP_CATEGORIES
+    + ("money", "income", "loans", "links", "flipped")
+    + tuple(f"used_{ind.lower().replace(' ', '_')}" for ind in INDUSTRY_TYPES)
+    + tuple(f"board_level_{level}" for level in range(1, MAX_LEVEL + 1))
+    + tuple(f"income_{i}" for i in range(1, INCOME_PHASES + 1))
+)
+
+
+def game_facts(game):
+    """
+    Returns (game row, player rows) for a finished game, as dicts keyed by the columns
+    in GAME_COLUMNS and PLAYER_COLUMNS, without the game id and path. The game row also
+    has a merchant_<market>_<slot> column per merchant slot, holding the index of its
+    merchant in MERCHANTS.
+
+    seat is the player's position in game.players, which is the first round's turn order
+    in tournament games. won is 1 for the winner, shared out between tied winners. The
+    used_ columns count the tiles gone from each industry stack (built or developed),
+    board_level_ the player's tiles on the board at the end by level, and income_ the
+    income track space at each income phase, -1 after the last. loans and the income
+    curve are -1 for games saved before they were recorded.
+    """
+    totals = {name: sum(p.vps) for name, p in game.players.items()}
+    best = max(totals.values())
+    winners = [name for name, total in totals.items() if total == best]
+    row = {"players": len(game.players), "winner": winners[0], "winning_vps": best}
+    for n, data in game.map_.nodes(data=True):
+        if data["type"] == "market":
+            for i, merchant in enumerate(data["market"].merchants):
+                row[f"merchant_{n}_{i + 1}"] = MERCHANTS.index(merchant)
+
+    links = dict.fromkeys(game.players, 0)
+    for _, _, data in game.map_.edges(data=True):
+        if data["player"] is not None:
+            links[data["player"]] += 1
+    board = {name: [0] * MAX_LEVEL for name in game.players}
+    flipped = dict.fromkeys(game.players, 0)
+    for _, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            for space in data["build_spots"]:
+                if space.owned_by is not None:
+                    level = game.industries[space.industry].level
+                    board[space.owned_by][level - 1] += 1
+                    flipped[space.owned_by] += space.flipped
+
+    players = []
+    for seat, (name, p) in enumerate(game.players.items()):
+        history = p.income_history
+        if history is None:
+            history = ()
+            loans = -1
+        else:
+            loans = p.loans
+        player = {
+            "seat": seat,
+            "name": name,
+            "won": 1 / len(winners) if name in winners else 0.0,
+            "vps": totals[name],
+            "money": p.money,
+            "income": p.income,
+            "loans": loans,
+            "links": links[name],
+            "flipped": flipped[name],
+        }
+        player.update(zip(VP_CATEGORIES, p.vps))
+        for ind in INDUSTRY_TYPES:
+            used = len(STARTING_TILES[ind]) - len(p.industry_tiles[ind])
+            player[f"used_{ind.lower().replace(' ', '_')}"] = used
+        for level, count in enumerate(board[name], 1):
+            player[f"board_level_{level}"] = count
+        for i in range(INCOME_PHASES):
+            player[f"income_{i + 1}"] = history[i] if i < len(history) else -1
+        players.append(player)
+    return row, players
+
+
+def _extract(path):
+    try:
+        with open(path, "rb") as f:
+            game = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if getattr(game, "era", None) != "end":
+        return None
+    return game_facts(game)
+
+
+def _columns(rows, names=None):
+    names = names or list(rows[0])
+    columns = {}
+    for name in names:
+        values = [row[name] for row in rows]
+        if isinstance(values[0], str):
+            columns[name] = np.array(values, dtype=str)
+        elif isinstance(values[0], float):
+            columns[name] = np.array(values, dtype=np.float64)
+        else:
+            columns[name] = np.array(values, dtype=np.int64)
+    return columns
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return {"games": 0, "files": {}, "parts": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def update(archive="saves", directory="analytics", workers=None, part_size=10_000):
+    """
+    Extracts the facts of every finished game in archive/*-end.pkl not yet in directory
+    and returns how many were added. Saves are unpickled in a process pool and written
+    part_size games at a time as a .npz part of columns, so an interrupted run keeps the
+    parts it finished. A save that has changed since it was read (the same players
+    finishing another game) is read again, and its old rows are dropped by load().
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = _read_manifest(directory)
+    pending = []
+    for path in sorted(glob.glob(os.path.join(archive, "*-end.pkl"))):
+        stat = os.stat(path)
+        seen = manifest["files"].get(path)
+        if seen is None or seen[:2] != [stat.st_mtime_ns, stat.st_size]:
+            pending.append((path, [stat.st_mtime_ns, stat.st_size]))
+    added = 0
+    with ProcessPoolExecutor(workers) as pool:
+        for start in range(0, len(pending), part_size):
+            chunk = pending[start : start + part_size]
+            results = pool.map(_extract, [path for path, _ in chunk], chunksize=64)
+            games, players = [], []
+            for (path, stat), facts in zip(chunk, results):
+                if facts is None:
+                    manifest["files"][path] = stat + [None]
+                    continue
+                game_id = manifest["games"]
+                manifest["games"] += 1
+                manifest["files"][path] = stat + [game_id]
+                row, rows = facts
+                games.append({"game": game_id, "path": path, **row})
+                players.extend({"game": game_id, **player} for player in rows)
+            if games:
+                _write_part(directory, manifest, games, players)
+                added += len(games)
+            _write_manifest(directory, manifest)
+    return added
+
+
+def _write_part(directory, manifest, games, players):
+    name = f"part_{len(manifest['parts']):05d}"
+    arrays = {}
+    for prefix, columns in (
+        ("games", _columns(games)),
+        ("players", _columns(players, PLAYER_COLUMNS)),
+    ):
+        for column, values in columns.items():
+            arrays[f"{prefix}/{column}"] = values
+    path = os.path.join(directory, f"{name}.npz")
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(path + ".tmp", path)
+    manifest["parts"].append(name)
+
+
+class GameTables:
+    """
+    The extracted facts as two column tables, games and players, each a dict of equal
+    length NumPy arrays. Player rows point at their game's row through game_row.
+    """
+
+    def __init__(self, games, players):
+        self.games = games
+        self.players = players
+        order = np.argsort(games["game"])
+        position = np.searchsorted(games["game"], players["game"], sorter=order)
+        self.game_row = order[position]
+
+    def __len__(self):
+        return len(self.games["game"])
+
+    def player_column(self, name):
+        """Returns a column of the players table, or of their game's row."""
+        if name in self.players:
+            return self.players[name]
+        return self.games[name][self.game_row]
+
+    def to_csv(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for table_name, table in (("games", self.games), ("players", self.players)):
+            with open(
+                os.path.join(directory, f"{table_name}.csv"),
+                "w",
+                newline="",
+                encoding="utf-8",
+            ) as f:
+                writer = csv.writer(f)
+                writer.writerow(table)
+                writer.writerows(zip(*(column.tolist() for column in table.values())))
+
+
+def load(directory="analytics"):
+    """Returns the GameTables of every game extracted into directory."""
+    manifest = _read_manifest(directory)
+    live = np.array(
+        sorted(seen[2] for seen in manifest["files"].values() if seen[2] is not None),
+        dtype=np.int64,
+    )
+    tables = {"games": {}, "players": {}}
+    for name in manifest["parts"]:
+        with np.load(os.path.join(directory, f"{name}.npz")) as part:
+            for key in part.files:
+                prefix, column = key.split("/", 1)
+                tables[prefix].setdefault(column, []).append(part[key])
+    for prefix, columns in tables.items():
+        if not columns:
+            tables[prefix] = {
+                name: np.zeros(0, dtype=np.int64)
+                for name in (GAME_COLUMNS if prefix == "games" else PLAYER_COLUMNS)
+            }
+            continue
+        merged = {name: np.concatenate(parts) for name, parts in columns.items()}
+        keep = np.isin(merged["game"], live)
+        tables[prefix] = {name: values[keep] for name, values in merged.items()}
+    return GameTables(tables["games"], tables["players"])
+
+
+def win_rate(tables, by, bins=None, where=None):
+    """
+    Returns rows of (value, players, wins, win rate) for the players grouped by a
+    column of the players or games table, e.g. "seat", "loans" or a merchant slot.
+    Numeric columns can be grouped into bins (edges, as for np.digitize; the value is
+    then the bin's lower edge). where is an optional boolean mask over the players.
+    """
+    values = tables.player_column(by)
+    won = tables.players["won"]
+    if where is not None:
+        values, won = values[where], won[where]
+    if bins is not None:
+        bins = np.asarray(bins)
+        index = np.clip(np.digitize(values, bins) - 1, 0, len(bins) - 1)
+        values = bins[index]
+    keys, inverse = np.unique(values, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(keys))
+    wins = np.bincount(inverse, weights=won, minlength=len(keys))
+    return [
+        (key.item(), int(n), float(w), float(w / n))
+        for key, n, w in zip(keys, counts, wins)
+    ]
+
+
+def mean_by(tables, column, by, where=None):
+    """Returns rows of (value, players, mean of column) for the players grouped by by."""
+    values = tables.player_column(by)
+    data = tables.player_column(column).astype(np.float64)
+    if where is not None:
+        values, data = values[where], data[where]
+    keys, inverse = np.unique(values, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(keys))
+    sums = np.bincount(inverse, weights=data, minlength=len(keys))
+    return [(key.item(), int(n), float(s / n)) for key, n, s in zip(keys, counts, sums)]
+
+
+def print_seat_win_rates(tables):
+    players = tables.player_column("players")
+    print(f"{'Players':<9}{'Seat':>5}{'Games':>8}{'Win rate':>10}")
+    for n in np.unique(players).tolist():
+        for seat, games, _, rate in win_rate(tables, "seat", where=players == n):
+            print(f"{n:<9}{seat + 1:>5}{games:>8}{rate:>10.3f}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python analytics.py [archive] [directory]
+    archive = sys.argv[1] if len(sys.argv) > 1 else "saves"
+    directory = sys.argv[2] if len(sys.argv) > 2 else "analytics"
+    print(f"Added {update(archive, directory)} games.")
+    print_seat_win_rates(load(directory))
@@ -0,0 +1,282 @@
+import contextlib
+import hashlib
+import os
+import pickle
+import random
+from collections import namedtuple
+
+import action_generation
+import game_entities
+import graph
+import self_play
+import utils
+from self_play import Turns
+
+Trace = namedtuple("Trace", ["seed", "players", "steps", "digests"])
+Divergence = namedtuple(
+    "Divergence",
+    ["seed", "step", "player", "action", "previous", "differences", "error"],
+)
+
+
+def state_digest(game):
+    """
+    Returns the state of a game as a dict of comparable components. An alternate engine
+    can provide its own digest() returning the same dict; otherwise it needs the same
+    attributes as GameState.
+    """
+    if hasattr(game, "digest"):
+        return game.digest()
+    spots, links, merchants = {}, {}, {}
+    for loc, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            spots[loc] = tuple(
+                (space.industry, space.owned_by, space.flipped, space.resource_amount)
+                for space in data["build_spots"]
+            )
+        else:
+            market = data["market"]
+            merchants[loc] = (tuple(market.merchants), tuple(market.beer))
+    for u, v, data in game.map_.edges(data=True):
+        if data["player"] is not None:
+            links[tuple(sorted((u, v)))] = data["player"]
+    players = game.players.values()
+    return {
+        "round": (game.era, game.current_turn),
+        "turn_order": tuple(game.turn_order),
+        "markets": (game.coal_market, game.iron_market),
+        "wild_cards": (game.wild_location_cards, game.wild_industry_cards),
+        "deck": tuple(game.deck),
+        "money": {p.name: p.money for p in players},
+        "spent": {p.name: p.spent_this_turn for p in players},
+        "income": {p.name: p.income for p in players},
+        "vps": {p.name: tuple(p.vps) for p in players},
+        "hands": {p.name: tuple(sorted(p.cards)) for p in players},
+        "discards": {p.name: tuple(p.discard_pile) for p in players},
+        "link_tiles": {p.name: p.link_tiles for p in players},
+        "industry_tiles": {
+            p.name: {ind: tuple(tiles) for ind, tiles in p.industry_tiles.items()}
+            for p in players
+        },
+        "build_spots": spots,
+        "links": dict(sorted(links.items())),
+        "merchants": merchants,
+    }
+
+
+def digest_hash(digest):
+    return hashlib.blake2b(repr(digest).encode(), digest_size=16).digest()
+
+
+# What the reference traces depend on, besides the seed and agent.
+REFERENCE_FILES = tuple(
+    module.__file__
+    for module in (game_entities, action_generation, graph, utils, self_play)
+) + (
+    "locations.json",
+    "links.json",
+    "markets.json",
+    "industry_tiles.json",
+    "cards.csv",
+)
+_fingerprint = None
+_traces = {}
+
+
+def reference_fingerprint():
+    """Returns a hash of the reference engine's code and board data."""
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.blake2b(digest_size=8)
+        for path in REFERENCE_FILES:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        _fingerprint = h.hexdigest()
+    return _fingerprint
+
+
+def _agent_name(agent):
+    if agent is None:
+        return "random"
+    return f"{agent.__module__}.{agent.__qualname__}"
+
+
+def reference_trace(players, seed, agent=None):
+    """
+    Plays a game on the reference GameState and returns the actions taken and the digest
+    hash after each of them. A step is (player, action), with action None when the
+    player had no cards left. Actions are chosen by agent(game, player, actions), or at
+    random from the legal ones.
+    """
+    random.seed(seed)
+    rng = random.Random(seed)
+    steps, digests = [], []
+    with contextlib.redirect_stdout(None):
+        game = game_entities.GameState(list(players))
+        action_generation.reset_connection_cache()
+        turns = Turns(game)
+        while turns.player is not None:
+            player = turns.player
+            actions = action_generation.legal_actions(game, player)
+            if not actions:
+                action = None
+            elif agent is None:
+                action = rng.choice(actions)
+            else:
+                action = agent(game, player, actions)
+            if action is not None:
+                action_generation.apply_action(game, player, action)
+            turns.advance()
+            steps.append((player, action))
+            digests.append(digest_hash(state_digest(game)))
+    return Trace(seed, tuple(players), steps, digests)
+
+
+def cached_trace(players, seed, agent=None, trace_dir=None):
+    """
+    Returns reference_trace(players, seed, agent), computing it only once per process
+    and, if trace_dir is given, only once per reference engine: traces are kept there
+    under reference_fingerprint(), so a change to the reference code or data makes new
+    ones.
+    """
+    key = (tuple(players), seed, _agent_name(agent))
+    if key in _traces:
+        return _traces[key]
+    path = None
+    if trace_dir is not None:
+        directory = os.path.join(trace_dir, reference_fingerprint())
+        path = os.path.join(directory, f"{'_'.join(key[0])}-{key[2]}-{seed}.pkl")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                _traces[key] = pickle.load(f)
+            return _traces[key]
+    trace = reference_trace(players, seed, agent)
+    if path is not None:
+        os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(trace, f)
+        os.replace(path + ".tmp", path)
+    _traces[key] = trace
+    return trace
+
+
+def _replay(factory, trace, n):
+    """Returns the engine made by factory after the first n steps of the trace."""
+    random.seed(trace.seed)
+    game = factory(list(trace.players))
+    action_generation.reset_connection_cache()
+    turns = Turns(game)
+    for player, action in trace.steps[:n]:
+        if action is not None:
+            action_generation.apply_action(game, player, action)
+        turns.advance()
+    return game, turns
+
+
+def _differences(reference, alternate):
+    return {
+        key: (reference.get(key), alternate.get(key))
+        for key in reference.keys() | alternate.keys()
+        if reference.get(key) != alternate.get(key)
+    }
+
+
+def _locate(factory, trace, start, end):
+    """Steps both engines from step start to end and returns the first divergence."""
+    ref_game, ref_turns = _replay(game_entities.GameState, trace, start)
+    alt_game, alt_turns = _replay(factory, trace, start)
+    for i in range(start, end + 1):
+        player, action = trace.steps[i]
+        previous = trace.steps[i - 1] if i else None
+        # A round end shuffles the deck, so both engines get the same random state.
+        state = random.getstate()
+        for game, turns in ((ref_game, ref_turns), (alt_game, alt_turns)):
+            random.setstate(state)
+            if action is not None:
+                action_generation.apply_action(game, player, action)
+            turns.advance()
+        differences = _differences(state_digest(ref_game), state_digest(alt_game))
+        if differences:
+            return Divergence(
+                trace.seed, i, player, action, previous, differences, None
+            )
+    return None
+
+
+def run_alternate(factory, trace, check_every=1):
+    """
+    Replays a reference trace on the engine made by factory(player_names), which is
+    called after seeding random with the trace's seed, so an engine that deals like
+    GameState starts from the same position. Digests are compared every check_every
+    steps; after a mismatch, both engines are stepped from the last matching check to
+    find the first divergent action. Returns a Divergence, or None if the engines agree.
+    """
+    last_match = 0
+    with contextlib.redirect_stdout(None):
+        random.seed(trace.seed)
+        try:
+            game = factory(list(trace.players))
+        except Exception as e:
+            return Divergence(trace.seed, None, None, None, None, {}, repr(e))
+        action_generation.reset_connection_cache()
+        turns = Turns(game)
+        for i, (player, action) in enumerate(trace.steps):
+            try:
+                if turns.player != player:
+                    raise ValueError(f"Expected {player} to act, not {turns.player}.")
+                if action is not None:
+                    action_generation.apply_action(game, player, action)
+                turns.advance()
+            except Exception as e:
+                previous = trace.steps[i - 1] if i else None
+                return Divergence(trace.seed, i, player, action, previous, {}, repr(e))
+            last = i == len(trace.steps) - 1
+            if (i + 1) % check_every and not last:
+                continue
+            if digest_hash(state_digest(game)) == trace.digests[i]:
+                last_match = i + 1
+                continue
+            return _locate(factory, trace, last_match, i)
+    return None
+
+
+def differential_test(
+    factory,
+    seeds,
+    players=("A", "B"),
+    check_every=16,
+    agent=None,
+    trace_dir="reference_traces",
+):
+    """
+    Runs run_alternate on a reference trace for each seed and returns the divergences.
+    The reference traces are stored in trace_dir (see cached_trace), so after the first
+    run only the alternate engine is played, apart from locating a divergence.
+    """
+    divergences = []
+    for seed in seeds:
+        trace = cached_trace(players, seed, agent, trace_dir)
+        divergence = run_alternate(factory, trace, check_every)
+        if divergence is not None:
+            divergences.append(divergence)
+    return divergences
+
+
+def report(divergence):
+    """Returns a readable description of a divergence."""
+    lines = [f"Seed {divergence.seed}, step {divergence.step}: {divergence.player}"]
+    lines.append(f"  action:   {divergence.action}")
+    lines.append(f"  previous: {divergence.previous}")
+    if divergence.error is not None:
+        lines.append(f"  alternate engine raised {divergence.error}")
+    for key, (reference, alternate) in sorted(divergence.differences.items()):
+        if isinstance(reference, dict) and isinstance(alternate, dict):
+            for k in reference.keys() | alternate.keys():
+                if reference.get(k) != alternate.get(k):
+                    lines.append(
+                        f"  {key}[{k}]: reference {reference.get(k)!r},"
+                        f" alternate {alternate.get(k)!r}"
+                    )
+        else:
+            lines.append(f"  {key}: reference {reference!r}, alternate {alternate!r}")
+    return "\n".join(lines)
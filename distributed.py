@@ -0,0 +1,289 @@
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from action_space import ActionSpace
+from self_play import play_game
+from tournament import Job, game_result, load_agent, new_game
+from trajectories import TrajectoryWriter
+
+
+class Coordinator:
+    """
+    Hands out games to workers over HTTP and collects their results and trajectory shards.
+
+    Each job is leased to one worker at a time. A lease that is not completed within
+    lease_timeout seconds (the worker died or lost its connection) or that the worker
+    reports as failed puts the job back in the queue, up to max_attempts times. When a
+    job is recorded, its shards are uploaded to a staging directory and only moved to
+    output_dir/game_<id> once the result arrives, so a retried game is never stored twice.
+
+    Endpoints (all JSON except uploads):
+    - POST /lease {"worker"}: returns {"job", "token"}, or {"job": null, "done"}.
+    - PUT /upload/<token>/<file name>: the bytes of one shard file.
+    - POST /result {"token", "result"} and POST /fail {"token", "error"}.
+    - GET /status: job counts.
+    """
+
+    def __init__(
+        self, jobs, agents, output_dir, record=False, lease_timeout=600, max_attempts=3
+    ):
+        self.jobs = {job.game_id: job for job in jobs}
+        self.agents = agents
+        self.output_dir = output_dir
+        self.record = record
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.queue = deque(self.jobs)
+        self.leases = {}  # token -> (game id, worker, expiry)
+        self.attempts = {game_id: 0 for game_id in self.jobs}
+        self.results = {}
+        self.failed = {}
+        self.lock = threading.Lock()
+        self.server = None
+        os.makedirs(os.path.join(output_dir, "staging"), exist_ok=True)
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.queue), queue="jobs")
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.leases), queue="leases")
+
+    def lease(self, worker):
+        with self.lock:
+            self._expire_leases()
+            if not self.queue:
+                return {"job": None, "done": self.done()}
+            game_id = self.queue.popleft()
+            self.attempts[game_id] += 1
+            token = uuid.uuid4().hex
+            expiry = time.monotonic() + self.lease_timeout
+            self.leases[token] = (game_id, worker, expiry)
+            job = self.jobs[game_id]
+            return {
+                "token": token,
+                "job": {
+                    "game_id": job.game_id,
+                    "seed": job.seed,
+                    "seats": list(job.seats),
+                    "agents": {name: self.agents[name] for name in job.seats},
+                    "record": self.record,
+                },
+            }
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for token, (game_id, _, expiry) in list(self.leases.items()):
+            if expiry < now:
+                self._release(token, "lease expired")
+
+    def _release(self, token, error):
+        game_id, _, _ = self.leases.pop(token)
+        shutil.rmtree(self._staging(token), ignore_errors=True)
+        if game_id in self.results:
+            return
+        if self.attempts[game_id] < self.max_attempts:
+            self.queue.append(game_id)
+        else:
+            self.failed[game_id] = error
+
+    def _staging(self, token):
+        return os.path.join(self.output_dir, "staging", token)
+
+    def upload(self, token, name, data):
+        if os.path.basename(name) != name or name.startswith("."):
+            return False
+        # The data is written outside the lock, but only moved into the lease's staging
+        # directory while the lease is known to be live, so an expired lease never gets
+        # its staging directory back.
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.output_dir, "staging"))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self.lock:
+            if token in self.leases:
+                os.makedirs(self._staging(token), exist_ok=True)
+                os.replace(tmp, os.path.join(self._staging(token), name))
+                return True
+        os.remove(tmp)
+        return False
+
+    def complete(self, token, result):
+        with self.lock:
+            if token not in self.leases:
+                return False
+            game_id, _, _ = self.leases.pop(token)
+            if game_id in self.results:
+                shutil.rmtree(self._staging(token), ignore_errors=True)
+                return False
+            if os.path.isdir(self._staging(token)):
+                target = os.path.join(self.output_dir, f"game_{game_id}")
+                shutil.rmtree(target, ignore_errors=True)
+                os.replace(self._staging(token), target)
+            self.results[game_id] = result
+            self.failed.pop(game_id, None)
+            return True
+
+    def fail(self, token, error):
+        with self.lock:
+            if token not in self.leases:
+                return False
+            self._release(token, error)
+            return True
+
+    def done(self):
+        return not self.queue and not self.leases
+
+    def status(self):
+        with self.lock:
+            return {
+                "jobs": len(self.jobs),
+                "queued": len(self.queue),
+                "leased": len(self.leases),
+                "completed": len(self.results),
+                "failed": len(self.failed),
+            }
+
+    def start(self, host="127.0.0.1", port=0):
+        """Starts serving in a background thread and returns the coordinator's URL."""
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wait(self, poll=1.0):
+        """Blocks until every job is completed or has failed, and returns the results."""
+        while True:
+            with self.lock:
+                self._expire_leases()
+                if self.done():
+                    return [self.results[i] for i in sorted(self.results)]
+            time.sleep(poll)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(self.server.coordinator.status())
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    def do_POST(self):
+        coordinator = self.server.coordinator
+        body = json.loads(self._body() or b"{}")
+        if self.path == "/lease":
+            self._reply(coordinator.lease(body.get("worker")))
+        elif self.path == "/result":
+            accepted = coordinator.complete(body["token"], body["result"])
+            self._reply({"accepted": accepted})
+        elif self.path == "/fail":
+            self._reply({"accepted": coordinator.fail(body["token"], body["error"])})
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    def do_PUT(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "upload":
+            self._reply({"error": "not found"}, 404)
+            return
+        accepted = self.server.coordinator.upload(parts[1], parts[2], self._body())
+        self._reply({"accepted": accepted}, 200 if accepted else 409)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Worker:
+    """
+    Leases games from a Coordinator, plays them and sends back the results (and the
+    trajectory shards, for recorded jobs) until the coordinator has no work left.
+    """
+
+    def __init__(self, url, name=None, poll=1.0):
+        self.url = url.rstrip("/")
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll = poll
+        self.action_spaces = {}
+
+    def _request(self, path, body=None, data=None, method="POST"):
+        if body is not None:
+            data = json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data=data, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            return json.load(e)
+
+    def run(self):
+        """Returns the number of games this worker completed."""
+        games = 0
+        while True:
+            reply = self._request("/lease", {"worker": self.name})
+            if reply["job"] is None:
+                if reply["done"]:
+                    return games
+                time.sleep(self.poll)
+                continue
+            token = reply["token"]
+            try:
+                with tempfile.TemporaryDirectory() as directory:
+                    result = self.play(reply["job"], directory)
+                    for name in sorted(os.listdir(directory)):
+                        with open(os.path.join(directory, name), "rb") as f:
+                            path = f"/upload/{token}/{name}"
+                            self._request(path, data=f.read(), method="PUT")
+            except Exception as e:
+                self._request("/fail", {"token": token, "error": repr(e)})
+                continue
+            if self._request("/result", {"token": token, "result": result})["accepted"]:
+                games += 1
+
+    def play(self, spec, directory):
+        job = Job(spec["game_id"], spec["seed"], tuple(spec["seats"]))
+        agents = {name: load_agent(*spec["agents"][name]) for name in job.seats}
+        game = new_game(job)
+        if not spec["record"]:
+            play_game(game, agents)
+            return game_result(job, game)
+
+        player_count = len(job.seats)
+        if player_count not in self.action_spaces:
+            self.action_spaces[player_count] = ActionSpace(player_count)
+        space = self.action_spaces[player_count]
+        writer = TrajectoryWriter(directory, space.size)
+
+        def record(game, player, action, actions):
+            writer.add_step(game, player, space.mask(game, player), space.index(action))
+
+        play_game(game, agents, on_action=record)
+        writer.end_game(game)
+        writer.close()
+        return game_result(job, game)
+
+
+if __name__ == "__main__":
+    # Usage: python distributed.py http://coordinator-host:port
+    print(f"Completed {Worker(sys.argv[1]).run()} games.")
@@ -0,0 +1,222 @@
+import contextlib
+import time
+from collections import namedtuple
+
+import action_generation
+import metrics
+import symmetry
+
+SolverResult = namedtuple(
+    "SolverResult", ["action", "scores", "exact", "depth", "nodes"]
+)
+
+KIND_ORDER = {
+    "sell": 0,
+    "build": 1,
+    "network": 2,
+    "develop": 3,
+    "loan": 4,
+    "scout": 5,
+    "pass": 6,
+}
+
+
+class _Timeout(Exception):
+    pass
+
+
+def remaining_plies(game, player, actions_taken=0):
+    """
+    Returns the (player, ends_turn) pairs still to be played in the current round, starting
+    with the given player who has already taken actions_taken of their two actions.
+    """
+    plies = []
+    start = game.turn_order.index(player)
+    for i, name in enumerate(game.turn_order[start:]):
+        actions = 2 - actions_taken if i == 0 else 2
+        plies.extend((name, n == actions - 1) for n in range(actions))
+    return plies
+
+
+def final_scores(game):
+    """
+    Returns each player's total vps if the game ended now, scoring links and industries
+    exactly as end_of_game does.
+    """
+    return {name: sum(vps) for name, vps in game.projected_vps().items()}
+
+
+class EndgameSolver:
+    """
+    Exhaustive search over the actions left in the final rail round.
+
+    Two-player games use alpha-beta on the score difference. Games with more players use
+    max^n, where every player maximises their own final score. Both use iterative deepening,
+    a transposition table and move ordering, and return the best move from the deepest
+    search completed within the time budget.
+    """
+
+    def __init__(self, time_budget=10.0, max_table_size=1_000_000, action_cache=None):
+        self.time_budget = time_budget
+        # Anything with a legal_actions(game, player) function, e.g. an ActionCache.
+        self.generator = action_cache or action_generation
+        self.max_table_size = max_table_size
+        self.table = {}
+        self.history = {}
+        self.nodes = 0
+        self._deadline = None
+
+    def solve(self, game, player, actions_taken=0):
+        plies = remaining_plies(game, player, actions_taken)
+        self.table.clear()
+        self.history.clear()
+        self.nodes = 0
+        self._deadline = time.perf_counter() + self.time_budget
+        result = SolverResult(None, final_scores(game), False, 0, 0)
+        with contextlib.redirect_stdout(None):
+            for depth in range(1, len(plies) + 1):
+                try:
+                    if not game.players[player].cards:
+                        action, scores = None, self._search(game, plies[1:], depth)
+                    elif len(game.players) == 2:
+                        action, scores = self._root_alphabeta(game, plies, depth)
+                    else:
+                        scores, action = self._maxn(game, plies, depth)
+                except _Timeout:
+                    break
+                result = SolverResult(
+                    action, scores, depth == len(plies), depth, self.nodes
+                )
+        metrics.SEARCH_NODES.inc(self.nodes, search="endgame")
+        return result
+
+    def _search(self, game, plies, depth):
+        if len(game.players) == 2:
+            root = next(iter(game.players))
+            inf = float("inf")
+            return self._alphabeta(game, plies, depth, root, -inf, inf)[1]
+        return self._maxn(game, plies, depth)[0]
+
+    def _check_time(self):
+        self.nodes += 1
+        if self.nodes % 64 == 0 and time.perf_counter() > self._deadline:
+            raise _Timeout
+
+    def _ordered_actions(self, game, player, best=None):
+        return sorted(
+            self.generator.legal_actions(game, player),
+            key=lambda a: (
+                a != best,
+                -self.history.get(a, 0),
+                KIND_ORDER[a.kind],
+            ),
+        )
+
+    @staticmethod
+    def _child(game, player, ends_turn, action):
+        child = game.copy()
+        action_generation.apply_action(child, player, action)
+        if ends_turn:
+            child.draw_cards(player, 2)
+        return child
+
+    def _store(self, key, entry):
+        if len(self.table) >= self.max_table_size:
+            self.table.clear()
+        self.table[key] = entry
+
+    def _maxn(self, game, plies, depth):
+        self._check_time()
+        if not plies or depth == 0:
+            return final_scores(game), None
+        player, ends_turn = plies[0]
+        if not game.players[player].cards:  # Nothing left to discard.
+            return self._maxn(game, plies[1:], depth)
+
+        key = (symmetry.canonical_form(game), len(plies))
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= min(depth, len(plies)):
+            return entry[1], entry[2]
+
+        best_scores, best_action = None, None
+        for action in self._ordered_actions(game, player, entry and entry[2]):
+            child = self._child(game, player, ends_turn, action)
+            scores, _ = self._maxn(child, plies[1:], depth - 1)
+            if best_scores is None or scores[player] > best_scores[player]:
+                best_scores, best_action = scores, action
+        self.history[best_action] = self.history.get(best_action, 0) + depth * depth
+        self._store(key, (min(depth, len(plies)), best_scores, best_action))
+        return best_scores, best_action
+
+    def _root_alphabeta(self, game, plies, depth):
+        root = plies[0][0]
+        best_value, best_action, best_scores = None, None, None
+        key = (symmetry.canonical_form(game), len(plies))
+        entry = self.table.get(key)
+        for action in self._ordered_actions(game, root, entry and entry[3]):
+            child = self._child(game, root, plies[0][1], action)
+            alpha = float("-inf") if best_value is None else best_value
+            value, scores = self._alphabeta(
+                child, plies[1:], depth - 1, root, alpha, float("inf")
+            )
+            if best_value is None or value > best_value:
+                best_value, best_action, best_scores = value, action, scores
+        self._store(
+            key, (min(depth, len(plies)), best_value, "exact", best_action, best_scores)
+        )
+        return best_action, best_scores
+
+    def _alphabeta(self, game, plies, depth, root, alpha, beta):
+        """Returns the root player's score margin and the final scores behind it."""
+        self._check_time()
+        if not plies or depth == 0:
+            scores = final_scores(game)
+            other = next(name for name in scores if name != root)
+            return scores[root] - scores[other], scores
+        player, ends_turn = plies[0]
+        if not game.players[player].cards:
+            return self._alphabeta(game, plies[1:], depth, root, alpha, beta)
+
+        key = (symmetry.canonical_form(game), len(plies))
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= min(depth, len(plies)):
+            _, value, bound, _, scores = entry
+            if bound == "exact":
+                return value, scores
+            if bound == "lower" and value >= beta:
+                return value, scores
+            if bound == "upper" and value <= alpha:
+                return value, scores
+
+        maximising = player == root
+        original_alpha, original_beta = alpha, beta
+        best_value, best_action, best_scores = None, None, None
+        for action in self._ordered_actions(game, player, entry and entry[3]):
+            child = self._child(game, player, ends_turn, action)
+            value, scores = self._alphabeta(
+                child, plies[1:], depth - 1, root, alpha, beta
+            )
+            if (
+                best_value is None
+                or (maximising and value > best_value)
+                or (not maximising and value < best_value)
+            ):
+                best_value, best_action, best_scores = value, action, scores
+            if maximising:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.history[action] = self.history.get(action, 0) + depth * depth
+                break
+
+        if best_value <= original_alpha:
+            bound = "upper"
+        elif best_value >= original_beta:
+            bound = "lower"
+        else:
+            bound = "exact"
+        self._store(
+            key, (min(depth, len(plies)), best_value, bound, best_action, best_scores)
+        )
+        return best_value, best_scores
@@ -0,0 +1,167 @@
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from game_entities import INDUSTRY_TYPES
+
+MAX_PLAYERS = 4
+
+
+def seat_order(game, player=None):
+    """
+    Returns the player names ordered starting from the given player (or the first player
+    in turn order), wrapping around in the order the players joined the game.
+    """
+    names = list(game.players)
+    if player is None:
+        player = game.turn_order[0]
+    start = names.index(player)
+    return names[start:] + names[:start]
+
+
+def encode_state(game, player=None):
+    """
+    Returns a flat float32 feature vector describing the game state from the point of view
+    of the given player. The layout only depends on the board data, so vectors from
+    different states of the same game can be stacked into a batch.
+    """
+    seats = {name: i for i, name in enumerate(seat_order(game, player))}
+    features = [
+        game.era == "canal",
+        game.era == "rail",
+        game.current_turn / 10,
+        game.coal_market / 14,
+        game.iron_market / 10,
+        len(game.deck) / 40,
+    ]
+
+    for _, data in game.map_.nodes(data=True):
+        if data["type"] == "market":
+            features.extend(data["market"].beer)
+            continue
+        for space in data["build_spots"]:
+            industry_type, level, owner = None, 0, None
+            if space.industry is not None:
+                tile = game.industries[space.industry]
+                industry_type, level, owner = tile.type, tile.level, space.owned_by
+            features.extend(industry_type == ind for ind in INDUSTRY_TYPES)
+            features.append(level / 8)
+            features.extend(seats.get(owner) == i for i in range(MAX_PLAYERS))
+            features.append(space.flipped)
+            features.append(space.resource_amount / 6)
+
+    for _, _, data in game.map_.edges(data=True):
+        features.extend(seats.get(data["player"]) == i for i in range(MAX_PLAYERS))
+
+    for name in seat_order(game, player) + [None] * (MAX_PLAYERS - len(seats)):
+        if name is None:
+            features.extend([0] * (6 + len(INDUSTRY_TYPES)))
+            continue
+        p = game.players[name]
+        features.extend(
+            [
+                p.money / 100,
+                p.spent_this_turn / 50,
+                p.income / 99,
+                sum(p.vps) / 100,
+                p.link_tiles / 14,
+                len(p.cards) / 8,
+            ]
+        )
+        features.extend(len(p.industry_tiles[ind]) / 11 for ind in INDUSTRY_TYPES)
+
+    return np.array(features, dtype=np.float32)
+
+
+class BatchEvaluator:
+    """
+    Collects leaf states from many searches and evaluates them with a single call to a
+    NumPy-based model per batch.
+
+    The model is called as model(batch) with a (n, features) float32 array and must return
+    (values, policies), where values has n rows and policies is either None or has n rows.
+    """
+
+    def __init__(self, model, batch_size=64, max_wait=0.005, encoder=encode_state):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.encoder = encoder
+        self._pending = []
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.states_evaluated = 0
+
+    def submit(self, game, player=None):
+        """
+        Queues a state for evaluation and returns a Future resolving to (value, policy).
+        The state is encoded immediately, so the caller is free to mutate it afterwards.
+        """
+        future = Future()
+        features = self.encoder(game, player)
+        with self._lock:
+            self._pending.append((features, future))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+        return future
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        batch = np.stack([features for features, _ in pending])
+        try:
+            values, policies = self.model(batch)
+        except Exception as e:  # Hand the failure to every waiting search.
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.states_evaluated += len(pending)
+        for i, (_, future) in enumerate(pending):
+            future.set_result((values[i], None if policies is None else policies[i]))
+
+    def evaluate(self, game, player=None):
+        """
+        Blocking evaluation for searches running in separate threads. The state waits up to
+        max_wait seconds for the batch to fill before the caller flushes it.
+        """
+        future = self.submit(game, player)
+        try:
+            return future.result(timeout=self.max_wait)
+        except FutureTimeoutError:
+            self.flush()
+            return future.result()
+
+    def run(self, searches):
+        """
+        Drives generator-based searches in a single thread and returns their results.
+        Each search yields (game, player) leaves and is sent back (value, policy) once
+        the batch containing that leaf has been evaluated.
+        """
+        results = [None] * len(searches)
+        active = {}
+        for i, search in enumerate(searches):
+            self._advance(i, search, None, active, results)
+        while active:
+            self.flush()
+            for i, (search, future) in list(active.items()):
+                del active[i]
+                self._advance(i, search, future.result(), active, results)
+        return results
+
+    def _advance(self, i, search, evaluation, active, results):
+        try:
+            leaf = search.send(evaluation)
+        except StopIteration as stop:
+            results[i] = stop.value
+            return
+        active[i] = (search, self.submit(*leaf))
+
+    @property
+    def mean_batch_size(self):
+        return self.states_evaluated / self.batches if self.batches else 0.0
@@ -3,11 +3,63 @@ import copy
 import json
 import pickle
 import random
+import struct
 from dataclasses import dataclass
 
-import networkx as nx
-
+import metrics
 import utils
+from graph import Graph
+
+INDUSTRY_TYPES = (
+    "Manufacturer",
+    "Cotton Mill",
+    "Brewery",
+    "Ironworks",
+    "Coal Mine",
+    "Pottery",
+)
+
+# Each player's industry tiles at the start of the game, taken from the front.
+STARTING_TILES = {
+    "Manufacturer": [
+        "manu1",
+        "manu2",
+        "manu2",
+        "manu3",
+        "manu4",
+        "manu5",
+        "manu5",
+        "manu6",
+        "manu7",
+        "manu8",
+        "manu8",
+    ],
+    "Cotton Mill": [
+        "cott1",
+        "cott1",
+        "cott1",
+        "cott2",
+        "cott2",
+        "cott3",
+        "cott3",
+        "cott3",
+        "cott4",
+        "cott4",
+        "cott4",
+    ],
+    "Brewery": ["brew1", "brew1", "brew2", "brew2", "brew3", "brew3", "brew4"],
+    "Ironworks": ["iron1", "iron2", "iron3", "iron4"],
+    "Coal Mine": [
+        "coal1",
+        "coal2",
+        "coal2",
+        "coal3",
+        "coal3",
+        "coal4",
+        "coal4",
+    ],
+    "Pottery": ["ptry1", "ptry2", "ptry3", "ptry4", "ptry5"],
+}
 
 
 @dataclass
@@ -60,6 +112,10 @@ class BuildSpot:
             and self.resource_amount == other.resource_amount
         )
 
+    def copy(self):
+        # allowed_industries never changes, so the copy shares it.
+        return copy.copy(self)
+
     def consume_resource(self):
         self.resource_amount -= 1
         if self.resource_amount == 0:
@@ -118,6 +174,12 @@ class Market:
         self.beer = [0] * int(merchants)
         self.bonus = bonus  # List like ["vps", 4] or ["develop"]
 
+    def copy(self):
+        market = copy.copy(self)
+        market.merchants = list(self.merchants)
+        market.beer = list(self.beer)
+        return market
+
     def add_merchant(self, merchant, i):
         self.merchants[i] = merchant
         print(f"{self.name} has a {merchant} merchant!")
@@ -147,44 +209,7 @@ class Player:
         self.spent_this_turn = 0
         self.link_tiles = 14
         self.industry_tiles = {
-            "Manufacturer": [
-                "manu1",
-                "manu2",
-                "manu2",
-                "manu3",
-                "manu4",
-                "manu5",
-                "manu5",
-                "manu6",
-                "manu7",
-                "manu8",
-                "manu8",
-            ],
-            "Cotton Mill": [
-                "cott1",
-                "cott1",
-                "cott1",
-                "cott2",
-                "cott2",
-                "cott3",
-                "cott3",
-                "cott3",
-                "cott4",
-                "cott4",
-                "cott4",
-            ],
-            "Brewery": ["brew1", "brew1", "brew2", "brew2", "brew3", "brew3", "brew4"],
-            "Ironworks": ["iron1", "iron2", "iron3", "iron4"],
-            "Coal Mine": [
-                "coal1",
-                "coal2",
-                "coal2",
-                "coal3",
-                "coal3",
-                "coal4",
-                "coal4",
-            ],
-            "Pottery": ["ptry1", "ptry2", "ptry3", "ptry4", "ptry5"],
+            industry: list(tiles) for industry, tiles in STARTING_TILES.items()
         }
         self.discard_pile = [cards.pop()]
         self.cards = cards
@@ -193,9 +218,30 @@ class Player:
         # The first four are canal era scores. The second four are rail era scores.
         # Within each four: merchants, links, industries, penalties.
         self.vps = [0, 0, 0, 0, 0, 0, 0, 0]
+        # Kept for analysing finished games; neither is part of state_key or pack.
+        self.loans = 0
+        self.income_history = ()  # Income track space at each income phase.
+
+    def __setstate__(self, state):
+        # Players saved before loans and income were recorded have them as None.
+        state.setdefault("loans", None)
+        state.setdefault("income_history", None)
+        self.__dict__.update(state)
+
+    def copy(self):
+        player = copy.copy(self)
+        player.industry_tiles = {
+            industry: list(tiles) for industry, tiles in self.industry_tiles.items()
+        }
+        player.discard_pile = list(self.discard_pile)
+        player.cards = list(self.cards)
+        player.vps = list(self.vps)
+        return player
 
     def take_income(self):
         self.spent_this_turn = 0
+        if self.income_history is not None:
+            self.income_history += (self.income,)
 
         income = utils.income_level(self.income)
         self.money += income
@@ -231,6 +277,8 @@ class Player:
 
     def loan(self):
         self.money += 30
+        if self.loans is not None:
+            self.loans += 1
         self.income = utils.inverse_income_level(utils.income_level(self.income) - 3)
         print(
             f"{self.name} took a loan. They gained £30 (£{self.money}) "
@@ -299,6 +347,71 @@ Industry tiles remaining: {self.industry_tiles}
 """
 
 
+ERAS = ("canal", "rail", "end")
+RESOURCES = (None, "coal", "iron", "beer")
+MERCHANTS = (None, "Manufacturer", "Cotton Mill", "Pottery", "Wild")
+WILD_CARDS = ("Wild Location", "Wild Industry")
+
+_pack_layouts = {}
+
+
+def _pack_layout(game):
+    """
+    Returns the names behind the numbers in packed states of this game setup: cards,
+    tiles, players, locations with build spots, market slots and links.
+    """
+    key = (tuple(game.players), tuple(game.map_.nodes))
+    if key not in _pack_layouts:
+        cards = []
+        with open("cards.csv", mode="r", encoding="utf-8") as file:
+            for row in csv.reader(file):
+                if row[0] not in cards:
+                    cards.append(row[0])
+        cards.extend(WILD_CARDS)
+        nodes = game.map_.nodes
+        locations = [n for n, data in nodes(data=True) if data["type"] == "location"]
+        markets = [n for n, data in nodes(data=True) if data["type"] == "market"]
+        _pack_layouts[key] = {
+            "cards": cards,
+            "card_index": {card: i for i, card in enumerate(cards)},
+            "tiles": list(game.industries),
+            "tile_index": {tile: i + 1 for i, tile in enumerate(game.industries)},
+            "players": list(game.players),
+            "locations": locations,
+            "spot_counts": [len(nodes[loc]["build_spots"]) for loc in locations],
+            "markets": markets,
+            "slot_counts": [len(nodes[m]["market"].merchants) for m in markets],
+            "edges": list(game.map_.edges),
+        }
+    return _pack_layouts[key]
+
+
+def _pack_nibbles(values):
+    values = list(values)
+    if len(values) % 2:
+        values.append(0)
+    return bytes(values[i] << 4 | values[i + 1] for i in range(0, len(values), 2))
+
+
+def _unpack_nibbles(data, n):
+    values = []
+    for byte in data:
+        values.append(byte >> 4)
+        values.append(byte & 15)
+    return values[:n]
+
+
+def _card_counts(cards, layout):
+    counts = [0] * len(layout["cards"])
+    for card in cards:
+        counts[layout["card_index"][card]] += 1
+    return _pack_nibbles(counts)
+
+
+def _counted_cards(counts, layout):
+    return [card for card, n in zip(layout["cards"], counts) for _ in range(n)]
+
+
 class GameState:
     def __init__(self, player_names):
         player_count = len(player_names)
@@ -365,14 +478,19 @@ class GameState:
         self.era = "end"
 
     def live_scores(self):
-        backup_scores = copy.deepcopy(
-            {name: player.vps for name, player in self.players.items()}
-        )
+        utils.print_scoreboard(self.projected_vps())
+
+    def projected_vps(self):
+        """Returns everyone's vps as they would stand if the era ended now."""
+        backup_scores = {
+            name: list(player.vps) for name, player in self.players.items()
+        }
         self._score_links()
         self._score_industries()
-        self.scoreboard()
+        projected = {name: player.vps for name, player in self.players.items()}
         for name, player in self.players.items():
             player.vps = backup_scores[name]
+        return projected
 
     def _score_links(self):
         i = 1 if self.era == "canal" else 5
@@ -656,8 +774,207 @@ class GameState:
             industries[ind["id"]] = industry_instance
         return industries
 
+    def copy(self):
+        # Only the parts that change during a game are copied. The industry tiles are shared.
+        game = copy.copy(self)
+        game.deck = list(self.deck)
+        game.players = {name: player.copy() for name, player in self.players.items()}
+        game.turn_order = list(self.turn_order)
+        game.map_ = self.map_.copy()
+        return game
+
+    def state_key(self):
+        """Returns a hashable snapshot of everything that can change during a game."""
+        players = tuple(
+            (
+                name,
+                p.money,
+                p.spent_this_turn,
+                p.link_tiles,
+                p.income,
+                tuple(p.vps),
+                tuple(sorted(p.cards)),
+                tuple(sorted(p.discard_pile)),
+                tuple(len(p.industry_tiles[ind]) for ind in INDUSTRY_TYPES),
+            )
+            for name, p in self.players.items()
+        )
+        spots = tuple(
+            (s.industry, s.owned_by, s.flipped, s.resource_amount)
+            for _, data in self.map_.nodes(data=True)
+            if data["type"] == "location"
+            for s in data["build_spots"]
+        )
+        links = tuple(data["player"] for _, _, data in self.map_.edges(data=True))
+        merchant_beer = tuple(
+            tuple(data["market"].beer)
+            for _, data in self.map_.nodes(data=True)
+            if data["type"] == "market"
+        )
+        return (
+            self.era,
+            self.current_turn,
+            self.coal_market,
+            self.iron_market,
+            self.wild_location_cards,
+            self.wild_industry_cards,
+            tuple(self.turn_order),
+            tuple(self.deck),
+            players,
+            spots,
+            links,
+            merchant_beer,
+        )
+
+    def pack(self):
+        """
+        Returns the state as a compact byte string, for exact comparisons and hashing in
+        transposition tables and visited sets. Everything in state_key is included, plus
+        the merchant tiles and spot resource types. Card names, tiles and players are
+        numbered by the setup (see _pack_layout), so only states of games with the same
+        players and board should be compared.
+
+        Layout: era, round, coal and iron markets, wild cards and turn order (a byte
+        each), then per player money, spent, link tiles, income, the eight vps and the
+        tile stack sizes, with hand and discard pile as 4-bit counts of each card. Then a
+        tile byte and a 16-bit owner/flipped/resource/amount word per build spot, 4-bit
+        link owners, a merchant/beer byte per market slot and the deck, length first.
+        """
+        layout = _pack_layout(self)
+        players = {name: i + 1 for i, name in enumerate(layout["players"])}
+        parts = [
+            struct.pack(
+                "<6B",
+                ERAS.index(self.era),
+                self.current_turn,
+                self.coal_market,
+                self.iron_market,
+                self.wild_location_cards,
+                self.wild_industry_cards,
+            ),
+            bytes(players[name] - 1 for name in self.turn_order),
+        ]
+        for name in layout["players"]:
+            p = self.players[name]
+            parts.append(
+                struct.pack(
+                    "<hhBB8h6B",
+                    p.money,
+                    p.spent_this_turn,
+                    p.link_tiles,
+                    p.income,
+                    *p.vps,
+                    *(len(p.industry_tiles[ind]) for ind in INDUSTRY_TYPES),
+                )
+            )
+            parts.append(_card_counts(p.cards, layout))
+            parts.append(_card_counts(p.discard_pile, layout))
+        tiles, words = [], []
+        nodes = self.map_.nodes
+        for loc in layout["locations"]:
+            for space in nodes[loc]["build_spots"]:
+                tiles.append(layout["tile_index"].get(space.industry, 0))
+                words.append(
+                    players.get(space.owned_by, 0) << 7
+                    | space.flipped << 6
+                    | RESOURCES.index(space.resource_type) << 4
+                    | space.resource_amount
+                )
+        parts.append(bytes(tiles))
+        parts.append(struct.pack(f"<{len(words)}H", *words))
+        edges = self.map_.edges
+        parts.append(
+            _pack_nibbles(players.get(edges[e]["player"], 0) for e in layout["edges"])
+        )
+        for loc in layout["markets"]:
+            market = nodes[loc]["market"]
+            parts.append(
+                bytes(
+                    MERCHANTS.index(merchant) << 4 | beer
+                    for merchant, beer in zip(market.merchants, market.beer)
+                )
+            )
+        parts.append(bytes([len(self.deck)]))
+        parts.append(bytes(layout["card_index"][card] for card in self.deck))
+        return b"".join(parts)
+
+    def unpack(self, data):
+        """
+        Returns the state packed in data as a new GameState, using this game (one with
+        the same players and board) for the board and the industry tiles. Hands and
+        discard piles come back sorted in card order.
+        """
+        layout = _pack_layout(self)
+        names = layout["players"]
+        game = self.copy()
+        era, turn, coal, iron, wild_location, wild_industry = struct.unpack_from(
+            "<6B", data
+        )
+        game.era = ERAS[era]
+        game.current_turn = turn
+        game.coal_market = coal
+        game.iron_market = iron
+        game.wild_location_cards = wild_location
+        game.wild_industry_cards = wild_industry
+        offset = 6
+        game.turn_order = [names[i] for i in data[offset : offset + len(names)]]
+        offset += len(names)
+        player_format = struct.Struct("<hhBB8h6B")
+        card_bytes = (len(layout["cards"]) + 1) // 2
+        for name in names:
+            values = player_format.unpack_from(data, offset)
+            offset += player_format.size
+            p = game.players[name]
+            p.money, p.spent_this_turn, p.link_tiles, p.income = values[:4]
+            p.vps = list(values[4:12])
+            p.industry_tiles = {
+                ind: STARTING_TILES[ind][len(STARTING_TILES[ind]) - n :]
+                for ind, n in zip(INDUSTRY_TYPES, values[12:])
+            }
+            for attr in ("cards", "discard_pile"):
+                counts = _unpack_nibbles(
+                    data[offset : offset + card_bytes], card_bytes * 2
+                )
+                setattr(p, attr, _counted_cards(counts, layout))
+                offset += card_bytes
+        spot_count = sum(layout["spot_counts"])
+        tiles = data[offset : offset + spot_count]
+        offset += spot_count
+        words = struct.unpack_from(f"<{spot_count}H", data, offset)
+        offset += 2 * spot_count
+        nodes = game.map_.nodes
+        i = 0
+        for loc in layout["locations"]:
+            for space in nodes[loc]["build_spots"]:
+                space.industry = layout["tiles"][tiles[i] - 1] if tiles[i] else None
+                owner = words[i] >> 7
+                space.owned_by = names[owner - 1] if owner else None
+                space.flipped = bool(words[i] >> 6 & 1)
+                space.resource_type = RESOURCES[words[i] >> 4 & 3]
+                space.resource_amount = words[i] & 15
+                i += 1
+        edges = game.map_.edges
+        link_bytes = (len(layout["edges"]) + 1) // 2
+        owners = _unpack_nibbles(data[offset : offset + link_bytes], link_bytes * 2)
+        offset += link_bytes
+        for edge, owner in zip(layout["edges"], owners):
+            edges[edge]["player"] = names[owner - 1] if owner else None
+        for loc, slots in zip(layout["markets"], layout["slot_counts"]):
+            market = nodes[loc]["market"]
+            market.merchants = [
+                MERCHANTS[b >> 4] for b in data[offset : offset + slots]
+            ]
+            market.beer = [b & 15 for b in data[offset : offset + slots]]
+            offset += slots
+        deck_size = data[offset]
+        game.deck = [
+            layout["cards"][i] for i in data[offset + 1 : offset + 1 + deck_size]
+        ]
+        game.map_.reset_link_index()
+        return game
+
     def save_game(self, filename):
-        with open(filename, "wb") as f:
+        with metrics.SAVE_SECONDS.time(), open(filename, "wb") as f:
             pickle.dump(self, f)
         print(f"Saved game as {filename}.\n")
 
@@ -667,12 +984,13 @@ class GameState:
             return pickle.load(f)
 
 
-class GameMap(nx.Graph):
+class GameMap(Graph):
     def __init__(self, player_count):
         super().__init__()
         self._add_locations()
         self._add_markets(player_count)
         self._add_links()
+        self.reset_link_index()
         print("Map loaded.")
 
     def _add_locations(self):
@@ -724,6 +1042,31 @@ class GameMap(nx.Graph):
                 loc1_id, loc2_id, type=link["accepted_link_type"], player=None
             )
 
+    def copy(self):
+        # Graph.__init__ is used directly, as GameMap.__init__ would reload the board.
+        # Neighbour order is kept so edges are iterated in the same order.
+        game_map = GameMap.__new__(GameMap)
+        Graph.__init__(game_map)
+        game_map.graph.update(self.graph)
+        for n, data in self._node.items():
+            data = dict(data)
+            if data["type"] == "location":
+                data["build_spots"] = [space.copy() for space in data["build_spots"]]
+            else:
+                data["market"] = data["market"].copy()
+            game_map._node[n] = data
+        edge_data = {}
+        for u, neighbours in self._adj.items():
+            game_map._adj[u] = {}
+            for v, data in neighbours.items():
+                if id(data) not in edge_data:  # Both directions share one dict.
+                    edge_data[id(data)] = dict(data)
+                game_map._adj[u][v] = edge_data[id(data)]
+        link_parent = getattr(self, "_link_parent", None)
+        game_map._link_parent = None if link_parent is None else dict(link_parent)
+        game_map._market_nodes = getattr(self, "_market_nodes", None)
+        return game_map
+
     def place_link(self, player, link_start, link_end):
         if "Farm Brewery South" in (link_start, link_end) or {link_start, link_end} == {
             "Kidderminster",
@@ -732,11 +1075,62 @@ class GameMap(nx.Graph):
             self["Kidderminster"]["Farm Brewery South"]["player"] = player
             self["Worcester"]["Farm Brewery South"]["player"] = player
             self["Kidderminster"]["Worcester"]["player"] = player
+            self._join("Kidderminster", "Farm Brewery South")
+            self._join("Worcester", "Farm Brewery South")
         else:
             self[link_start][link_end]["player"] = player
+            self._join(link_start, link_end)
 
     def remove_links(self):
-        nx.set_edge_attributes(self, {(u, v): None for u, v in self.edges()}, "player")
+        for _, _, data in self.edges(data=True):
+            data["player"] = None
+        self.reset_link_index()
+
+    # The locations joined by built links are kept in a union-find structure, updated as
+    # links are placed, so connection checks do not need to search the map.
+    def reset_link_index(self):
+        """Rebuilds the connection index, for when links are set without place_link."""
+        self._link_parent = {n: n for n in self.nodes}
+        self._market_nodes = tuple(
+            n for n, data in self.nodes(data=True) if data["type"] == "market"
+        )
+        for u, v, data in self.edges(data=True):
+            if data["player"] is not None:
+                self._join(u, v)
+
+    def _find(self, n):
+        if getattr(self, "_link_parent", None) is None:  # E.g. games saved before it.
+            self.reset_link_index()
+        parent = self._link_parent
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    def _join(self, u, v):
+        root_u, root_v = self._find(u), self._find(v)
+        if root_u != root_v:
+            self._link_parent[root_u] = root_v
+
+    def is_connected(self, loc1, loc2):
+        return self._find(loc1) == self._find(loc2)
+
+    def connected_markets(self, loc):
+        """Returns the markets joined to loc by built links, in map order."""
+        root = self._find(loc)
+        return [n for n in self._market_nodes if self._find(n) == root]
+
+    def connected_to_market(self, loc):
+        return bool(self.connected_markets(loc))
+
+    def reachable_merchants(self, loc):
+        """Returns (market, slot, merchant) for every merchant loc is connected to."""
+        return [
+            (market, i, merchant)
+            for market in self.connected_markets(loc)
+            for i, merchant in enumerate(self.nodes[market]["market"].merchants)
+            if merchant is not None
+        ]
 
     def remove_obsolete_industries(self):
         for _, data in self.nodes(data=True):
@@ -765,7 +1159,13 @@ class GameMap(nx.Graph):
         if player is None:
             utils.draw_map(self)
             return
+        utils.draw_map(self, *self.player_layers(player))
 
+    def player_layers(self, player):
+        """
+        Returns the player's links, the locations on those links where they have no
+        tiles, and the locations where they have tiles.
+        """
         links = [
             (u, v) for u, v, link in self.edges(data=True) if link["player"] == player
         ]
@@ -781,4 +1181,4 @@ class GameMap(nx.Graph):
             network_locs.add(u)
             network_locs.add(v)
         network_locs -= occupied_locs
-        utils.draw_map(self, links, network_locs, occupied_locs)
+        return links, network_locs, occupied_locs
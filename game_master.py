@@ -6,6 +6,7 @@ import time
 
 import action_generation
 import game_entities
+from save_writer import SaveWriter
 
 
 class GameMaster:
@@ -21,6 +22,7 @@ class GameMaster:
             self.game = self.load_game()
 
         self.rounds_per_era = 12 - len(self.game.turn_order)
+        self.save_writer = None
 
     @staticmethod
     def list_save_files():
@@ -70,11 +72,23 @@ class GameMaster:
         return game_entities.GameState(player_names)
 
     def play_game(self):
+        # Saves are written in the background and flushed when the game ends or is quit.
+        self.save_writer = SaveWriter()
+        try:
+            self._play_rounds()
+        finally:
+            self.save_writer.close()
+
+    def write_save(self, filename):
+        self.save_writer.submit(self.game, filename)
+        print(f"Saving game as {filename}.\n")
+
+    def _play_rounds(self):
         print("\nStarting game.")
 
         # The first round of canal is different because each player gets one action.
         if self.game.era == "canal" and self.game.current_turn == 1:
-            self.game.save_game(
+            self.write_save(
                 os.path.join(
                     "saves", f"{"_".join(self.game.players.keys())}-canal-1.pkl"
                 )
@@ -93,7 +107,7 @@ class GameMaster:
 
         if self.game.era == "canal":
             for round_ in range(self.game.current_turn, self.rounds_per_era + 1):
-                self.game.save_game(
+                self.write_save(
                     os.path.join(
                         "saves",
                         f"{"_".join(self.game.players.keys())}-canal-{round_}.pkl",
@@ -117,7 +131,7 @@ class GameMaster:
 
         if self.game.era == "rail":
             for round_ in range(self.game.current_turn, self.rounds_per_era + 1):
-                self.game.save_game(
+                self.write_save(
                     os.path.join(
                         "saves",
                         f"{"_".join(self.game.players.keys())}-rail-{round_}.pkl",
@@ -137,7 +151,7 @@ class GameMaster:
                 if round_ != self.rounds_per_era:
                     self.next_turn()
             self.game.end_of_game()
-            self.game.save_game(
+            self.write_save(
                 os.path.join("saves", f"{"_".join(self.game.players.keys())}-end.pkl")
             )
 
@@ -317,12 +331,9 @@ class GameMaster:
             "Enter the location (id or name) of where you want to build:\n",
             *self.options_dict["locations"],
         )
-        market_connection = False
-        if industry == "Coal Mine":
-            market_connection = self.valid_input(
-                f"Does {loc} have a connection to a market (y/n)?\n", "y", "n"
-            )
-            market_connection = market_connection == "y"
+        market_connection = (
+            industry == "Coal Mine" and self.game.map_.connected_to_market(loc)
+        )
         space = int(self.valid_input(f"Which space in {loc}?\n", "0", "1", "2", "3"))
 
         cube1, cube1_space, cube2, cube2_space = None, None, None, None
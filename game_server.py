@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import pickle
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import action_generation
+import game_entities
+import metrics
+import utils
+from action_generation import Action
+from self_play import Turns
+
+
+class Session:
+    """A game on the server, with its turn position and cached legal actions."""
+
+    def __init__(self, game, seat=0, actions_left=None):
+        self.game = game
+        self.turns = Turns(game, seat, actions_left)
+        self.last_used = time.monotonic()
+        self._actions = None
+        # Held while the session is used or stored; evicted sessions are not used again.
+        self.lock = threading.Lock()
+        self.evicted = False
+
+    def actions(self):
+        if self._actions is None:
+            player = self.turns.player
+            if player is None:
+                self._actions = []
+            else:
+                self._actions = action_generation.legal_actions(self.game, player)
+        return self._actions
+
+    def play(self, player, action):
+        """Applies a legal action for the player to act and moves the game on."""
+        if player != self.turns.player:
+            raise ValueError(f"It is not {player}'s turn.")
+        if action not in self.actions():
+            raise ValueError("Illegal action.")
+        with metrics.ACTION_SECONDS.time():
+            action_generation.apply_action(self.game, player, action)
+        metrics.ACTIONS.inc()
+        self.turns.advance()
+        self._actions = None
+        # Players who have run out of cards lose their remaining actions.
+        while self.turns.player is not None and not self.actions():
+            self.turns.advance()
+            self._actions = None
+
+    def view(self, player=None):
+        """Returns the public state, plus the hand of player if one is given."""
+        game = self.game
+        view = {
+            "era": game.era,
+            "round": game.current_turn,
+            "turn_order": game.turn_order,
+            "to_act": self.turns.player,
+            "actions_left": self.turns.actions_left,
+            "coal_market": game.coal_market,
+            "iron_market": game.iron_market,
+            "players": {
+                name: {
+                    "money": p.money,
+                    "income": p.income,
+                    "vps": sum(p.vps),
+                    "spent_this_turn": p.spent_this_turn,
+                    "link_tiles": p.link_tiles,
+                    "cards": len(p.cards),
+                    "discard_pile": p.discard_pile,
+                }
+                for name, p in game.players.items()
+            },
+        }
+        if game.era == "canal":  # The first discard is face down until the rail era.
+            for name, p in view["players"].items():
+                if name != player and p["discard_pile"]:
+                    p["discard_pile"] = ["???"] + p["discard_pile"][1:]
+        if player in game.players:
+            view["players"][player]["cards"] = game.players[player].cards
+        return view
+
+    def __getstate__(self):
+        return {
+            "game": self.game,
+            "seat": self.turns.seat,
+            "actions_left": self.turns.actions_left,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["game"], state["seat"], state["actions_left"])
+
+
+def _to_tuples(value):
+    if isinstance(value, list):
+        return tuple(_to_tuples(v) for v in value)
+    return value
+
+
+def action_from_json(data):
+    return Action(*(_to_tuples(field) for field in data))
+
+
+class GameServer:
+    """
+    Hosts many games at once over a small JSON-over-HTTP API, for human clients and
+    agents alike. Games are played by choosing from the legal actions, so nothing ever
+    waits on input().
+
+    At most max_loaded sessions are kept in memory. The least recently used session is
+    pickled to session_dir when that limit is passed, as is any session idle for longer
+    than idle_timeout seconds, and it is loaded again on its next request.
+
+    Requests are handled on a pool of worker threads, so working out the legal actions
+    of one slow position, or pickling a session, does not hold up the event loop and the
+    other clients.
+
+    Endpoints:
+    - POST /sessions {"players": [...]}: starts a game and returns its "session" id.
+    - GET /sessions: lists the session ids.
+    - GET /sessions/<id>?player=<name>: the state, with that player's hand.
+    - GET /sessions/<id>/actions: the legal actions of the player to act.
+    - POST /sessions/<id>/actions {"player", "index" or "action"}: takes an action.
+    - DELETE /sessions/<id>: ends a session.
+    """
+
+    def __init__(
+        self, session_dir="sessions", max_loaded=32, idle_timeout=900, workers=None
+    ):
+        self.session_dir = session_dir
+        self.max_loaded = max_loaded
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()
+        self.evictions = 0
+        # Guards sessions and the session files.
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(workers, initializer=utils.quiet_thread)
+        os.makedirs(session_dir, exist_ok=True)
+        metrics.GAMES_IN_FLIGHT.set_function(
+            lambda: len(self.session_ids()), source="server"
+        )
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.sessions), queue="loaded")
+
+    def _path(self, session_id):
+        return os.path.join(self.session_dir, f"{session_id}.pkl")
+
+    def _evict(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id)
+            with session.lock:
+                self._store(session_id, session)
+            self.evictions += 1
+
+    def _store(self, session_id, session):
+        # Called holding the session's lock.
+        session.evicted = True
+        path = self._path(session_id)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(session, f)
+        os.replace(path + ".tmp", path)
+
+    def _get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None and session.evicted:
+                # Stored by evict_idle, which has not removed it yet.
+                del self.sessions[session_id]
+                self.evictions += 1
+            if session_id not in self.sessions:
+                path = self._path(session_id)
+                if not os.path.isfile(path):
+                    raise KeyError(session_id)
+                with open(path, "rb") as f:
+                    self.sessions[session_id] = pickle.load(f)
+                os.remove(path)
+            self.sessions.move_to_end(session_id)
+            session = self.sessions[session_id]
+            session.last_used = time.monotonic()
+            while len(self.sessions) > self.max_loaded:
+                self._evict(next(iter(self.sessions)))
+            return session
+
+    def _use(self, session_id, function):
+        """Returns function(session) for the live session, holding its lock."""
+        while True:
+            session = self._get(session_id)
+            with session.lock:
+                # It may have been evicted between being looked up and being locked.
+                if not session.evicted:
+                    return function(session)
+
+    def evict_idle(self):
+        """
+        Stores the sessions idle for longer than idle_timeout. The global lock is only
+        held to find them and to drop them once stored, and sessions busy with a request
+        are skipped, so other requests are not held up.
+        """
+        now = time.monotonic()
+        with self.lock:
+            idle = [
+                (session_id, session)
+                for session_id, session in self.sessions.items()
+                if now - session.last_used > self.idle_timeout
+            ]
+        for session_id, session in idle:
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                if session.evicted or now - session.last_used <= self.idle_timeout:
+                    continue
+                self._store(session_id, session)
+            finally:
+                session.lock.release()
+            with self.lock:
+                if self.sessions.get(session_id) is session:
+                    del self.sessions[session_id]
+                    self.evictions += 1
+
+    def session_ids(self):
+        with self.lock:
+            stored = [
+                f[:-4] for f in os.listdir(self.session_dir) if f.endswith(".pkl")
+            ]
+            return sorted(set(self.sessions) | set(stored))
+
+    def create(self, players):
+        if not 2 <= len(players) <= 4 or len(set(players)) != len(players):
+            raise ValueError("A game needs 2 to 4 players with different names.")
+        session_id = uuid.uuid4().hex
+        session = Session(game_entities.GameState(players))
+        with self.lock:
+            self.sessions[session_id] = session
+            self._get(session_id)
+        return session_id
+
+    def delete(self, session_id):
+        with self.lock:
+            path = self._path(session_id)
+            session = self.sessions.pop(session_id, None)
+            if session is not None:
+                with session.lock:
+                    session.evicted = True
+                    if os.path.isfile(path):  # Stored by evict_idle just before.
+                        os.remove(path)
+            elif os.path.isfile(path):
+                os.remove(path)
+            else:
+                raise KeyError(session_id)
+
+    def handle(self, method, path, query, body):
+        """Returns (status, response body) for a request."""
+        parts = path.strip("/").split("/")
+        if parts[0] != "sessions" or len(parts) > 3:
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+        if len(parts) > 1 and not parts[1].isalnum():  # Session ids are hex strings.
+            return HTTPStatus.NOT_FOUND, {"error": "not found"}
+        if len(parts) == 1:
+            if method == "GET":
+                return HTTPStatus.OK, {"sessions": self.session_ids()}
+            if method == "POST":
+                return HTTPStatus.CREATED, {"session": self.create(body["players"])}
+        elif len(parts) == 2:
+            if method == "GET":
+                view = self._use(parts[1], lambda s: s.view(query.get("player")))
+                return HTTPStatus.OK, view
+            if method == "DELETE":
+                self.delete(parts[1])
+                return HTTPStatus.OK, {}
+        elif parts[2] == "actions":
+            if method == "GET":
+                return HTTPStatus.OK, self._use(parts[1], self._actions)
+            if method == "POST":
+                return HTTPStatus.OK, self._use(
+                    parts[1], lambda session: self._play(session, body)
+                )
+        return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "method not allowed"}
+
+    @staticmethod
+    def _actions(session):
+        return {"player": session.turns.player, "actions": session.actions()}
+
+    @staticmethod
+    def _play(session, body):
+        if "index" in body:
+            action = session.actions()[body["index"]]
+        else:
+            action = action_from_json(body["action"])
+        session.play(body["player"], action)
+        return session.view(body["player"])
+
+    async def _serve_client(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode().split(" ", 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, value = line.decode().split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            data = await reader.readexactly(int(headers.get("content-length", 0)))
+            path, _, query_string = target.partition("?")
+            path = urllib.parse.unquote(path)
+            query = dict(urllib.parse.parse_qsl(query_string))
+            try:
+                status, body = await asyncio.get_running_loop().run_in_executor(
+                    self.executor,
+                    self.handle,
+                    method,
+                    path,
+                    query,
+                    json.loads(data or b"{}"),
+                )
+            except KeyError as e:
+                status, body = HTTPStatus.NOT_FOUND, {"error": f"unknown {e}"}
+            except (ValueError, IndexError, TypeError) as e:
+                status, body = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+            response = json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(response)}\r\n"
+                "Connection: close\r\n\r\n".encode() + response
+            )
+            await writer.drain()
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _evict_idle_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            await loop.run_in_executor(self.executor, self.evict_idle)
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self._serve_client, host, port)
+        evictor = asyncio.create_task(self._evict_idle_periodically())
+        # The engine prints as it goes, which a server has no use for, so the worker
+        # threads are quiet (see utils.quiet_thread).
+        utils.install_quiet_stdout()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evictor.cancel()
+            self.executor.shutdown()
+            for session_id in list(self.sessions):
+                self._evict(session_id)
+
+
+if __name__ == "__main__":
+    asyncio.run(GameServer().serve())
@@ -0,0 +1,138 @@
+from functools import cached_property
+
+
+class NodeView:
+    """The nodes of a Graph, used like networkx's G.nodes."""
+
+    __slots__ = ("_node",)
+
+    def __init__(self, graph):
+        self._node = graph._node
+
+    def __call__(self, data=False):
+        if data:
+            return self._node.items()
+        return self
+
+    def __getitem__(self, n):
+        return self._node[n]
+
+    def __iter__(self):
+        return iter(self._node)
+
+    def __contains__(self, n):
+        return n in self._node
+
+    def __len__(self):
+        return len(self._node)
+
+
+class EdgeView:
+    """The edges of a Graph, used like networkx's G.edges and in the same order."""
+
+    __slots__ = ("_adj",)
+
+    def __init__(self, graph):
+        self._adj = graph._adj
+
+    def __call__(self, data=False):
+        if data:
+            return self._edges(True)
+        return self
+
+    def _edges(self, data):
+        seen = set()
+        for u, neighbours in self._adj.items():
+            for v, attrs in neighbours.items():
+                if v not in seen:
+                    yield (u, v, attrs) if data else (u, v)
+            seen.add(u)
+
+    def __getitem__(self, edge):
+        u, v = edge
+        return self._adj[u][v]
+
+    def __iter__(self):
+        return self._edges(False)
+
+    def __contains__(self, edge):
+        u, v = edge
+        return u in self._adj and v in self._adj[u]
+
+    def __len__(self):
+        return sum(len(neighbours) for neighbours in self._adj.values()) // 2
+
+
+class Graph:
+    """
+    An undirected graph with node and edge attributes, keeping only the part of the
+    networkx.Graph interface the engine uses: graph, nodes, edges, G[u][v], add_node and
+    add_edge. Its data is stored in the same _node and _adj dicts, so networkx is only
+    needed to draw or analyse the board (see to_networkx).
+    """
+
+    def __init__(self):
+        self.graph = {}
+        self._node = {}
+        self._adj = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("nodes", None)
+        state.pop("edges", None)
+        return state
+
+    def __setstate__(self, state):
+        # Maps pickled as networkx graphs also hold networkx's cached views.
+        for key in ("nodes", "edges", "adj", "__networkx_cache__"):
+            state.pop(key, None)
+        self.__dict__.update(state)
+
+    # Like networkx, the views are made once and kept in the instance dict.
+    @cached_property
+    def nodes(self):
+        return NodeView(self)
+
+    @cached_property
+    def edges(self):
+        return EdgeView(self)
+
+    def __getitem__(self, n):
+        return self._adj[n]
+
+    def __iter__(self):
+        return iter(self._node)
+
+    def __contains__(self, n):
+        return n in self._node
+
+    def __len__(self):
+        return len(self._node)
+
+    def add_node(self, n, **attrs):
+        if n not in self._node:
+            self._adj[n] = {}
+            self._node[n] = {}
+        self._node[n].update(attrs)
+
+    def add_edge(self, u, v, **attrs):
+        for n in (u, v):
+            if n not in self._node:
+                self.add_node(n)
+        data = self._adj[u].get(v, {})
+        data.update(attrs)
+        self._adj[u][v] = data
+        self._adj[v][u] = data
+
+    def neighbors(self, n):
+        return iter(self._adj[n])
+
+    def to_networkx(self):
+        """Returns a networkx.Graph with the same nodes, edges and attributes."""
+        import networkx as nx
+
+        g = nx.Graph()
+        g.graph.update(self.graph)
+        g.add_nodes_from(self._node.items())
+        g.add_edges_from(self.edges(data=True))
+        return g
@@ -0,0 +1,243 @@
+import contextlib
+import math
+import random
+
+import action_generation
+import metrics
+import what_if
+from endgame_solver import KIND_ORDER
+from self_play import Turns
+
+WILD_CARDS = ("Wild Location", "Wild Industry")
+
+
+def macro_key(action):
+    """
+    Returns the decision an action belongs to, leaving out the choices that rarely change
+    its value: the card discarded, which build space and cube sources are used, where a
+    double link's coal and beer come from, the beer and develop bonus of a sell, the iron
+    for a develop and the cards taken by a scout.
+    """
+    if action.kind == "build":
+        industry, loc, _ = action.args
+        return ("build", industry, loc)
+    if action.kind == "network":
+        kwargs = dict(action.kwargs)
+        link2 = kwargs.get("link2_start"), kwargs.get("link2_end")
+        return ("network", tuple(action.args), link2)
+    if action.kind == "sell":
+        return ("sell", tuple(action.args[0]))
+    if action.kind == "develop":
+        return ("develop", tuple(action.args))
+    return (action.kind,)
+
+
+def group_actions(actions):
+    """Returns {macro key: raw actions} in the order the keys first appear."""
+    groups = {}
+    for action in actions:
+        groups.setdefault(macro_key(action), []).append(action)
+    return groups
+
+
+def resolve(game, player, actions):
+    """
+    Picks one raw action of a macro greedily: the best outcome by what_if.rank_actions,
+    preferring to keep wild cards when another card does as well.
+    """
+    if len(actions) == 1:
+        return actions[0]
+    actions = sorted(actions, key=lambda a: a.card in WILD_CARDS)
+    outcomes = what_if.rank_actions(game, player, actions)
+    return outcomes[0].action if outcomes else actions[0]
+
+
+def kind_prior(game, player, groups):
+    """Returns the macro keys ordered by kind only, as in KIND_ORDER (sells first)."""
+    return sorted(groups, key=lambda key: KIND_ORDER[key[0]])
+
+
+def rank_prior(game, player, groups):
+    """
+    Returns the macro keys best first by what_if.rank_actions, trying one action of each
+    macro (one without a wild card where there is one). Macros whose action fails
+    come last, by kind.
+    """
+    representatives = {
+        min(actions, key=lambda a: a.card in WILD_CARDS): key
+        for key, actions in groups.items()
+    }
+    outcomes = what_if.rank_actions(game, player, list(representatives))
+    ranked = [representatives[outcome.action] for outcome in outcomes]
+    failed = set(groups).difference(ranked)
+    return ranked + sorted(failed, key=lambda key: KIND_ORDER[key[0]])
+
+
+def widening_limit(visits, c=1.0, alpha=0.5):
+    """Returns how many children a node with the given visits may have expanded."""
+    return max(1, int(c * (visits + 1) ** alpha))
+
+
+def projected_margins(game):
+    """Returns each player's projected vps minus the average, as search values."""
+    scores = {name: sum(vps) for name, vps in game.projected_vps().items()}
+    mean = sum(scores.values()) / len(scores)
+    return {name: score - mean for name, score in scores.items()}
+
+
+class _Node:
+    __slots__ = ("player", "macros", "groups", "children", "visits", "totals")
+
+    def __init__(self):
+        self.player = None
+        self.macros = None
+        self.groups = None
+        self.children = []  # [macro key, raw action, _Node]
+        self.visits = 0
+        self.totals = {}
+
+
+class MacroSearch:
+    """
+    Monte Carlo tree search over macro decisions. Each node groups its legal actions with
+    macro_key and orders the macros with prior(game, player, groups), by default
+    rank_prior; a macro is only resolved to a raw action, with resolve(), when its child
+    is created.
+
+    Children are added by progressive widening, in the prior's order: a node with n
+    visits may have widening_limit(n, c, alpha) children, so visits go deeper into the
+    most promising macros instead of being spread over hundreds of near-identical moves. Every player picks
+    the child with the best UCB value for themselves. Playouts stop after horizon plies
+    (or at the end of the game) and are scored with evaluate(game), which returns
+    {player: value}.
+    """
+
+    def __init__(
+        self,
+        iterations=200,
+        horizon=4,
+        exploration=5.0,
+        widening_c=1.0,
+        widening_alpha=0.5,
+        evaluate=projected_margins,
+        prior=rank_prior,
+    ):
+        self.iterations = iterations
+        self.horizon = horizon
+        self.exploration = exploration
+        self.widening_c = widening_c
+        self.widening_alpha = widening_alpha
+        self.evaluate = evaluate
+        self.prior = prior
+        self.root = None
+
+    def search(self, game, player, actions_left=None):
+        """
+        Returns the raw action to play for the player, who has actions_left actions
+        left this turn (by default a whole turn).
+        """
+        seat = game.turn_order.index(player)
+        self.root = _Node()
+        state = random.getstate()
+        try:
+            with contextlib.redirect_stdout(None):
+                for _ in range(self.iterations):
+                    # Card draws and shuffles replay the same way in every iteration.
+                    random.setstate(state)
+                    self._iterate(game, seat, actions_left)
+        finally:
+            random.setstate(state)
+        metrics.SEARCH_NODES.inc(self.root.visits, search="macro")
+        if not self.root.children:
+            return None
+        _, action, _ = max(self.root.children, key=lambda child: child[2].visits)
+        return action
+
+    def _macros(self, node, game, player):
+        node.player = player
+        node.groups = group_actions(action_generation.legal_actions(game, player))
+        node.macros = self.prior(game, player, node.groups) if node.groups else []
+
+    def _select(self, node):
+        log_visits = math.log(node.visits)
+        best, best_value = None, None
+        for child in node.children:
+            stats = child[2]
+            value = stats.totals.get(node.player, 0) / stats.visits
+            value += self.exploration * math.sqrt(log_visits / stats.visits)
+            if best_value is None or value > best_value:
+                best, best_value = child, value
+        return best
+
+    def _iterate(self, game, seat, actions_left):
+        game = game.copy()
+        turns = Turns(game, seat, actions_left)
+        node = self.root
+        path = [node]
+        for _ in range(self.horizon):
+            player = turns.player
+            if player is None:
+                break
+            if node.macros is None:
+                self._macros(node, game, player)
+            if not node.macros:  # Out of cards, so the player skips the action.
+                if not node.children:
+                    node.children.append([None, None, _Node()])
+                child = node.children[0]
+            elif len(node.children) < min(
+                len(node.macros),
+                widening_limit(node.visits, self.widening_c, self.widening_alpha),
+            ):
+                key = node.macros[len(node.children)]
+                action = resolve(game, player, node.groups[key])
+                child = [key, action, _Node()]
+                node.children.append(child)
+            else:
+                child = self._select(node)
+            if child[1] is not None:
+                action_generation.apply_action(game, player, child[1])
+            turns.advance()
+            node = child[2]
+            path.append(node)
+        values = self.evaluate(game)
+        for node in path:
+            node.visits += 1
+            for name, value in values.items():
+                node.totals[name] = node.totals.get(name, 0) + value
+
+    def root_stats(self):
+        """Returns (macro key, raw action, visits, mean value) for each root child."""
+        return [
+            (
+                key,
+                action,
+                child.visits,
+                child.totals.get(self.root.player, 0) / max(child.visits, 1),
+            )
+            for key, action, child in self.root.children
+        ]
+
+
+def macro_agent(**kwargs):
+    """
+    Returns an agent that plays the action chosen by a MacroSearch.
+
+    Agents are not told how many actions the player has left, so unless actions_left is
+    given it is worked out from the previous call: a second call for the same game,
+    player and round is the player's second action.
+    """
+    searcher = MacroSearch(**kwargs)
+    previous = [None, 0]  # The last call's (game, player, era, round) and actions left.
+
+    def play(game, player, actions, actions_left=None):
+        turn = (id(game), player, game.era, game.current_turn)
+        if actions_left is None:
+            if turn == previous[0] and previous[1] > 1:
+                actions_left = previous[1] - 1
+            else:
+                actions_left = Turns(game).actions_left
+        previous[:] = [turn, actions_left]
+        action = searcher.search(game, player, actions_left)
+        return action if action in actions else actions[0]
+
+    return play
@@ -0,0 +1,215 @@
+import json
+import os
+from functools import lru_cache
+from itertools import chain
+
+import numpy as np
+from matplotlib.collections import LineCollection
+
+PLAYER_COLOURS = ("#FF2400", "#1CA3EC", "#2E8B57", "#DAA520")
+
+
+@lru_cache(maxsize=None)
+def load_coords(filename="coords.json"):
+    with open(filename, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class MapRenderer:
+    """
+    Draws the board once (edges, nodes and labels at the positions in coords.json) and
+    then only restyles the edge and node artists for each map drawn, instead of building
+    a new figure every time.
+
+    A headless renderer draws on an Agg canvas, for saving PNG or SVG frames without
+    opening a window. Otherwise the figure belongs to pyplot, and show() opens it.
+    """
+
+    def __init__(self, map_, headless=True, figsize=(12, 9)):
+        self.positions = load_coords()
+        self.nodes = list(map_.nodes)
+        self.edges = list(map_.edges)
+        self.headless = headless
+        self.figsize = figsize
+        self._build()
+
+    def _build(self):
+        if self.headless:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+
+            self.figure = Figure(figsize=self.figsize)
+            FigureCanvasAgg(self.figure)
+        else:
+            import matplotlib.pyplot as plt
+
+            self.figure = plt.figure(figsize=self.figsize)
+        ax = self.figure.add_axes((0, 0, 1, 1))
+        ax.set_axis_off()
+        segments = [(self.positions[u], self.positions[v]) for u, v in self.edges]
+        self.edge_artist = LineCollection(segments, zorder=1)
+        ax.add_collection(self.edge_artist)
+        xy = np.array([self.positions[n] for n in self.nodes])
+        self.node_artist = ax.scatter(xy[:, 0], xy[:, 1], zorder=2)
+        for n, (x, y) in zip(self.nodes, xy):
+            ax.text(
+                x,
+                y,
+                n,
+                fontsize=9,
+                fontweight="bold",
+                color="#000000",
+                ha="center",
+                va="center",
+                zorder=3,
+            )
+        margin = 0.05 * max(np.ptp(xy[:, 0]), np.ptp(xy[:, 1]), 1e-9)
+        ax.set_xlim(xy[:, 0].min() - margin, xy[:, 0].max() + margin)
+        ax.set_ylim(xy[:, 1].min() - margin, xy[:, 1].max() + margin)
+        self.last_drawn = (None, (), ())
+        self.draw()
+
+    def _style_nodes(self, colours, sizes):
+        self.node_artist.set_facecolors(colours)
+        self.node_artist.set_sizes(sizes)
+        self.node_artist.set_edgecolors(
+            ["#000000" if colour == "#FFFFFF" else colour for colour in colours]
+        )
+
+    def draw(self, links=None, network_locs=(), occupied_locs=()):
+        """
+        Styles the board like utils.draw_map: the given links in red and the others
+        dashed, with occupied and network locations highlighted. With no links, the
+        plain board is drawn.
+        """
+        self.last_drawn = (links, network_locs, occupied_locs)
+        if links is None:
+            self.edge_artist.set_color("#000000")
+            self.edge_artist.set_linewidths(1)
+            self.edge_artist.set_linestyles("solid")
+            self._style_nodes(["#FFFFFF"] * len(self.nodes), [800] * len(self.nodes))
+            return
+        built = {frozenset(link) for link in links}
+        is_built = [frozenset(edge) in built for edge in self.edges]
+        self.edge_artist.set_color(["#FF2400" if b else "#808080" for b in is_built])
+        self.edge_artist.set_linewidths([3 if b else 1 for b in is_built])
+        self.edge_artist.set_linestyles(["solid" if b else "dashed" for b in is_built])
+        colours, sizes = [], []
+        for n in self.nodes:
+            if n in occupied_locs:
+                colours.append("#FF2400")
+                sizes.append(1500)
+            elif n in network_locs:
+                colours.append("#82c8e5")
+                sizes.append(950)
+            else:
+                colours.append("#FFFFFF")
+                sizes.append(800)
+        self._style_nodes(colours, sizes)
+
+    def draw_state(self, game, player=None):
+        """
+        Styles the board for a game: one player's network as in GameMap.draw_map, or with
+        player None, every built link in its owner's colour and locations with tiles
+        enlarged.
+        """
+        map_ = game.map_
+        if player is not None:
+            self.draw(*map_.player_layers(player))
+            return
+        palette = {
+            name: PLAYER_COLOURS[i % len(PLAYER_COLOURS)]
+            for i, name in enumerate(game.players)
+        }
+        owners = [map_.edges[edge]["player"] for edge in self.edges]
+        self.edge_artist.set_color(
+            [palette[owner] if owner else "#808080" for owner in owners]
+        )
+        self.edge_artist.set_linewidths([3 if owner else 1 for owner in owners])
+        self.edge_artist.set_linestyles(
+            ["solid" if owner else "dashed" for owner in owners]
+        )
+        sizes = [
+            (
+                1100
+                if any(
+                    space.industry is not None
+                    for space in map_.nodes[n].get("build_spots", ())
+                )
+                else 800
+            )
+            for n in self.nodes
+        ]
+        self._style_nodes(["#FFFFFF"] * len(self.nodes), sizes)
+
+    def save(self, path, **kwargs):
+        """Saves the current frame; the format comes from the extension (.png, .svg)."""
+        self.figure.savefig(path, **kwargs)
+
+    def show(self):
+        import matplotlib.pyplot as plt
+
+        # Closing the window destroys a pyplot figure, so it is rebuilt for the next map.
+        if not plt.fignum_exists(self.figure.number):
+            last_drawn = self.last_drawn
+            self._build()
+            self.draw(*last_drawn)
+        plt.show()
+
+
+_shared_renderer = None
+
+
+def shared_renderer(map_):
+    """Returns the interactive renderer kept between map requests."""
+    global _shared_renderer
+    if _shared_renderer is None or _shared_renderer.nodes != list(map_.nodes):
+        _shared_renderer = MapRenderer(map_, headless=False)
+    return _shared_renderer
+
+
+def render_game(states, directory, player=None, fmt="png", renderer=None):
+    """
+    Saves a frame for each state of a game (GameStates, such as snapshots taken during
+    play) as directory/frame_0000.png and so on. Returns the paths.
+    """
+    states = iter(states)
+    first = next(states, None)
+    if first is None:
+        return []
+    os.makedirs(directory, exist_ok=True)
+    renderer = renderer or MapRenderer(first.map_)
+    paths = []
+    for i, game in enumerate(chain([first], states)):
+        renderer.draw_state(game, player)
+        path = os.path.join(directory, f"frame_{i:04d}.{fmt}")
+        renderer.save(path)
+        paths.append(path)
+    return paths
+
+
+def render_games(games, directory, player=None, fmt="png"):
+    """
+    Renders many games with one renderer. games maps a name to the game's states, and
+    each game's frames go in directory/<name>. Returns {name: paths}.
+    """
+    renderer = None
+    paths = {}
+    for name, states in games.items():
+        states = list(states)
+        if not states:
+            paths[name] = []
+            continue
+        if renderer is None or renderer.nodes != list(states[0].map_.nodes):
+            renderer = MapRenderer(states[0].map_)
+        paths[name] = render_game(
+            states, os.path.join(directory, name), player, fmt, renderer
+        )
+    return paths
+
+
+def load_states(save_files):
+    """Loads pickled GameStates (such as a game's per-round saves) in the given order."""
+    from game_entities import GameState
+
+    return [GameState.load_game(filename) for filename in save_files]
@@ -0,0 +1,263 @@
+import sys
+import types
+
+from game_entities import INDUSTRY_TYPES, GameState, Player
+
+_SKIP = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+
+def deep_size(obj, seen=None):
+    """
+    Returns the size in bytes of an object and everything it references, counting each
+    object once. Objects whose ids are in seen are skipped (and seen is updated), so a
+    series of calls sharing seen splits the memory between them without overlap.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size
+
+
+def footprint(game, shared=()):
+    """
+    Returns the deep size in bytes of a GameState by component, plus the total. Objects
+    in shared (such as the industries of a game the state was copied from) are left out.
+
+    Components are measured in the order listed, each leaving out what an earlier one
+    counted: "industries", "build_spots", "markets", "map" (the graph's own dicts and
+    link data), "player_tiles", "players", "deck" and "other".
+    """
+    seen = set()
+    for obj in shared:
+        deep_size(obj, seen)
+    spots, markets = [], []
+    for _, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            spots.extend(data["build_spots"])
+        else:
+            markets.append(data["market"])
+    sizes = {
+        "industries": deep_size(game.industries, seen),
+        "build_spots": deep_size(spots, seen) - sys.getsizeof(spots),
+        "markets": deep_size(markets, seen) - sys.getsizeof(markets),
+        "map": deep_size(game.map_, seen),
+        "player_tiles": sum(
+            deep_size(p.industry_tiles, seen) for p in game.players.values()
+        ),
+        "players": deep_size(game.players, seen),
+        "deck": deep_size(game.deck, seen),
+        "other": deep_size(game, seen),
+    }
+    sizes["total"] = sum(sizes.values())
+    return sizes
+
+
+def marginal_size(states):
+    """Returns the average bytes each state adds when all of them are kept together."""
+    states = list(states)
+    return deep_size(states) / len(states) if states else 0
+
+
+_interned = {}
+
+
+def _intern(value):
+    # Only spot contents, merchant contents and tile stacks are interned: each comes
+    # from a small fixed set, so the table stays small however many states are made.
+    # Whole-board values (links, vps) are not, as nearly every state has its own.
+    return _interned.setdefault(value, value)
+
+
+class Board:
+    """
+    The parts of a GameMap that never change: its nodes, links and build spot and market
+    layout. It keeps an empty map to copy when a compact state is expanded.
+    """
+
+    def __init__(self, map_):
+        self.template = map_.copy()
+        self.locations = []
+        self.markets = []
+        for loc, data in self.template.nodes(data=True):
+            if data["type"] == "location":
+                self.locations.append(loc)
+            else:
+                self.markets.append(loc)
+        self.edges = list(self.template.edges())
+
+
+_boards = {}
+
+
+def board(map_):
+    key = (tuple(map_.nodes), tuple(map_.edges))
+    if key not in _boards:
+        _boards[key] = Board(map_)
+    return _boards[key]
+
+
+class CompactState:
+    """
+    A GameState stored as tuples, keeping only what can change during a game. The
+    board and the industry tiles are shared by every compact state of the same game
+    setup, and repeated values (spot contents, tile stacks, card names) are shared too.
+    Use expand() to get a full GameState back.
+
+    The target is a state at least 5x smaller than a GameState.copy() kept alongside
+    others from the same game (as measured by marginal_size); in self-play games it is
+    about 8x smaller.
+    """
+
+    __slots__ = (
+        "board",
+        "industries",
+        "era",
+        "current_turn",
+        "coal_market",
+        "iron_market",
+        "wild_location_cards",
+        "wild_industry_cards",
+        "deck",
+        "turn_order",
+        "players",
+        "spots",
+        "merchants",
+        "links",
+    )
+
+    def __init__(self, game):
+        self.board = board(game.map_)
+        self.industries = game.industries
+        self.era = game.era
+        self.current_turn = game.current_turn
+        self.coal_market = game.coal_market
+        self.iron_market = game.iron_market
+        self.wild_location_cards = game.wild_location_cards
+        self.wild_industry_cards = game.wild_industry_cards
+        self.deck = tuple(sys.intern(card) for card in game.deck)
+        self.turn_order = tuple(game.turn_order)
+        self.players = tuple(
+            (
+                p.name,
+                p.money,
+                p.spent_this_turn,
+                p.link_tiles,
+                p.income,
+                tuple(p.vps),
+                tuple(sys.intern(card) for card in p.cards),
+                tuple(sys.intern(card) for card in p.discard_pile),
+                tuple(_intern(tuple(p.industry_tiles[ind])) for ind in INDUSTRY_TYPES),
+                p.loans,
+                p.income_history,
+            )
+            for p in game.players.values()
+        )
+        nodes = game.map_.nodes
+        self.spots = tuple(
+            _intern(
+                (
+                    space.industry,
+                    space.owned_by,
+                    space.flipped,
+                    space.resource_type,
+                    space.resource_amount,
+                )
+            )
+            for loc in self.board.locations
+            for space in nodes[loc]["build_spots"]
+        )
+        self.merchants = tuple(
+            _intern(
+                (
+                    tuple(nodes[loc]["market"].merchants),
+                    tuple(nodes[loc]["market"].beer),
+                )
+            )
+            for loc in self.board.markets
+        )
+        edges = game.map_.edges
+        self.links = tuple(edges[edge]["player"] for edge in self.board.edges)
+
+    def expand(self):
+        game = GameState.__new__(GameState)
+        game.era = self.era
+        game.current_turn = self.current_turn
+        game.deck = list(self.deck)
+        game.players = {}
+        for (
+            name,
+            money,
+            spent,
+            link_tiles,
+            income,
+            vps,
+            cards,
+            discards,
+            tiles,
+            loans,
+            income_history,
+        ) in self.players:
+            p = Player.__new__(Player)
+            p.name = name
+            p.money = money
+            p.spent_this_turn = spent
+            p.link_tiles = link_tiles
+            p.industry_tiles = {
+                ind: list(stack) for ind, stack in zip(INDUSTRY_TYPES, tiles)
+            }
+            p.discard_pile = list(discards)
+            p.cards = list(cards)
+            p.income = income
+            p.vps = list(vps)
+            p.loans = loans
+            p.income_history = income_history
+            game.players[name] = p
+        game.turn_order = list(self.turn_order)
+        game.industries = self.industries
+        game.map_ = self.board.template.copy()
+        game.coal_market = self.coal_market
+        game.iron_market = self.iron_market
+        game.wild_location_cards = self.wild_location_cards
+        game.wild_industry_cards = self.wild_industry_cards
+
+        nodes = game.map_.nodes
+        spots = iter(self.spots)
+        for loc in self.board.locations:
+            for space in nodes[loc]["build_spots"]:
+                (
+                    space.industry,
+                    space.owned_by,
+                    space.flipped,
+                    space.resource_type,
+                    space.resource_amount,
+                ) = next(spots)
+        for loc, (merchants, beer) in zip(self.board.markets, self.merchants):
+            nodes[loc]["market"].merchants = list(merchants)
+            nodes[loc]["market"].beer = list(beer)
+        edges = game.map_.edges
+        for edge, player in zip(self.board.edges, self.links):
+            edges[edge]["player"] = player
+        game.map_.reset_link_index()
+        return game
+
+
+def compact(game):
+    return CompactState(game)
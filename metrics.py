@@ -0,0 +1,274 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+class Counter:
+    """A value that only goes up, such as actions applied, per set of labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(_key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [(self.name, key, value) for key, value in values.items()]
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, such as games in flight. A gauge can also read its
+    value from a function when it is scraped, for sizes of queues and caches.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, description):
+        super().__init__(name, description)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Reads the value from function() at each scrape, replacing any earlier one."""
+        with self.lock:
+            self.functions[_key(labels)] = function
+
+    def samples(self):
+        samples = super().samples()
+        with self.lock:
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            samples.append((self.name, key, function()))
+        return samples
+
+
+class Histogram:
+    """Counts observations, such as latencies in seconds, into cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [count per bucket (last is +Inf), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts = self.values[key]
+            counts[i] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self, **labels):
+        """Returns (count, sum) of the observations with the given labels."""
+        counts = self.values.get(_key(labels))
+        if counts is None:
+            return 0, 0.0
+        return sum(counts[:-1]), counts[-1]
+
+    def samples(self):
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        samples = []
+        for key, counts in values.items():
+            total = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                total += n
+                samples.append((f"{self.name}_bucket", key + (("le", bound),), total))
+            samples.append((f"{self.name}_sum", key, counts[-1]))
+            samples.append((f"{self.name}_count", key, total))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+
+    def _add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description):
+        return self._add(Counter(name, description))
+
+    def gauge(self, name, description):
+        return self._add(Gauge(name, description))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, description, buckets))
+
+    def prometheus(self):
+        """Returns every metric in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Returns the metrics as a JSON-ready dict. Counters also get their average rate
+        per second since the registry was created, and histograms their mean.
+        """
+        uptime = time.time() - self.started
+        metrics = {}
+        for metric in self.metrics.values():
+            values = []
+            if metric.kind == "histogram":
+                for key in list(metric.values):
+                    count, total = metric.summary(**dict(key))
+                    values.append(
+                        {
+                            "labels": dict(key),
+                            "count": count,
+                            "sum": total,
+                            "mean": total / count if count else None,
+                        }
+                    )
+            else:
+                for _, key, value in metric.samples():
+                    entry = {"labels": dict(key), "value": value}
+                    if metric.kind == "counter":
+                        entry["per_second"] = value / uptime if uptime else 0.0
+                    values.append(entry)
+            metrics[metric.name] = {
+                "type": metric.kind,
+                "help": metric.description,
+                "values": values,
+            }
+        return {"uptime": uptime, "metrics": metrics}
+
+
+REGISTRY = Registry()
+
+GAMES_IN_FLIGHT = REGISTRY.gauge("brass_games_in_flight", "Games being played.")
+GAMES = REGISTRY.counter("brass_games_total", "Games played to the end.")
+ACTIONS = REGISTRY.counter("brass_actions_total", "Actions applied to games.")
+ACTION_SECONDS = REGISTRY.histogram(
+    "brass_action_seconds", "Time to apply one action to a GameState."
+)
+SEARCH_NODES = REGISTRY.counter(
+    "brass_search_nodes_total", "Positions or iterations searched."
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "brass_cache_lookups_total", "Cache lookups, by cache and hit or miss."
+)
+CACHE_HIT_RATE = REGISTRY.gauge(
+    "brass_cache_hit_rate", "Share of cache lookups that were hits."
+)
+SAVE_SECONDS = REGISTRY.histogram("brass_save_seconds", "Time to write a save file.")
+QUEUE_DEPTH = REGISTRY.gauge("brass_queue_depth", "Items waiting in a queue.")
+
+
+def cache_hit_rate(cache):
+    hits = CACHE_LOOKUPS.value(cache=cache, result="hit")
+    lookups = hits + CACHE_LOOKUPS.value(cache=cache, result="miss")
+    return hits / lookups if lookups else 0.0
+
+
+def watch_cache(cache):
+    """Publishes the hit rate of the caches with the given name."""
+    CACHE_HIT_RATE.set_function(lambda: cache_hit_rate(cache), cache=cache)
+
+
+def serve(port=9100, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serves the registry over HTTP on a background thread: GET /metrics in the
+    Prometheus text format, and GET /metrics.json (or /metrics?format=json) as a JSON
+    snapshot. Returns the server; its port is server.server_address[1].
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/metrics.json" or (
+                path == "/metrics" and "format=json" in query
+            ):
+                body = json.dumps(registry.snapshot()).encode()
+                content_type = "application/json"
+            elif path == "/metrics":
+                body = registry.prometheus().encode()
+                content_type = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,227 @@
+import contextlib
+import hashlib
+import os
+import pickle
+import random
+from collections import namedtuple
+
+import action_generation
+import what_if
+from game_entities import INDUSTRY_TYPES, GameState
+from self_play import Turns, random_agent
+
+BookMove = namedtuple("BookMove", ["action", "score", "playouts"])
+
+
+def in_opening(game):
+    return game.era == "canal" and game.current_turn == 1
+
+
+def opening_key(game, player):
+    """
+    Returns the book key of a first round position, as seen by the player: the merchant
+    setup, what the players before them did, and their own hand. Player names are
+    replaced by seats, merchants within a market are sorted, and the deck and the other
+    hands are left out since the player cannot see them.
+    """
+    seat = {name: i for i, name in enumerate(game.turn_order)}
+    players = tuple(
+        (
+            p.money,
+            p.spent_this_turn,
+            p.link_tiles,
+            p.income,
+            tuple(sorted(p.discard_pile)),
+            tuple(len(p.industry_tiles[ind]) for ind in INDUSTRY_TYPES),
+        )
+        for p in (game.players[name] for name in game.turn_order)
+    )
+    spots, markets = [], []
+    for loc, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            spots.append(
+                tuple(
+                    (space.industry, seat.get(space.owned_by, -1))
+                    for space in data["build_spots"]
+                )
+            )
+        else:
+            market = data["market"]
+            markets.append(tuple(sorted(zip(market.merchants, market.beer), key=repr)))
+    links = tuple(
+        seat.get(data["player"], -1) for _, _, data in game.map_.edges(data=True)
+    )
+    form = (
+        len(game.turn_order),
+        seat[player],
+        tuple(sorted(game.players[player].cards)),
+        players,
+        tuple(spots),
+        links,
+        tuple(markets),
+    )
+    digest = hashlib.blake2b(repr(form).encode(), digest_size=16)
+    return int.from_bytes(digest.digest(), "big")
+
+
+def _determinize(game, player, rng):
+    """Redeals the deck and the other players' hands, which the player cannot see."""
+    others = [p for name, p in game.players.items() if name != player]
+    pool = list(game.deck)
+    for p in others:
+        pool.extend(p.cards)
+    rng.shuffle(pool)
+    for p in others:
+        n = len(p.cards)
+        p.cards = pool[:n]
+        del pool[:n]
+    game.deck = pool
+
+
+def _margin(game, player):
+    scores = {name: sum(p.vps) for name, p in game.players.items()}
+    best_other = max(score for name, score in scores.items() if name != player)
+    return scores[player] - best_other
+
+
+def playout(game, player, action, agents, rng):
+    """
+    Plays a copy of a first round position to the end of the game after the player takes
+    the action, with the hidden cards redealt, and returns the player's final vps minus
+    the best of the others'.
+    """
+    fork = game.copy()
+    _determinize(fork, player, rng)
+    random.seed(rng.getrandbits(64))
+    turns = Turns(fork, fork.turn_order.index(player))
+    action_generation.apply_action(fork, player, action)
+    turns.advance()
+    while turns.player is not None:
+        current = turns.player
+        actions = action_generation.legal_actions(fork, current)
+        if actions:  # Otherwise the player has run out of cards.
+            agent = agents.get(current, random_agent)
+            action_generation.apply_action(fork, current, agent(fork, current, actions))
+        turns.advance()
+    return _margin(fork, player)
+
+
+def search_opening(game, player, width=8, playouts=16, agents=None, seed=0):
+    """
+    Ranks the player's first round actions by the mean result of full-game playouts. The
+    width best actions by what_if.rank_actions are searched, each with the given number
+    of playouts (random play unless agents maps a player to another policy). Returns
+    BookMoves, best first.
+    """
+    agents = agents or {}
+    rng = random.Random(seed)
+    state = random.getstate()
+    candidates, seen = [], set()
+    for outcome in what_if.rank_actions(game, player):
+        action = outcome.action
+        # Only builds depend on the card, so other actions are searched with one card.
+        key = action if action.kind == "build" else action._replace(card=None)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(action)
+        if len(candidates) == width:
+            break
+    moves = []
+    try:
+        with contextlib.redirect_stdout(None):
+            for action in candidates:
+                total = sum(
+                    playout(game, player, action, agents, rng) for _ in range(playouts)
+                )
+                moves.append(BookMove(action, total / playouts, playouts))
+    finally:
+        random.setstate(state)
+    moves.sort(key=lambda move: move.score, reverse=True)
+    return moves
+
+
+class OpeningBook:
+    """
+    Search-backed rankings of first canal round actions, keyed by opening_key and kept
+    in a pickle file. Lookups are a single dict access, so games can take their first
+    action from the book instead of searching from the empty board every time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.entries = pickle.load(f)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, game, player):
+        """Returns the BookMoves for the position, or None if it is not in the book."""
+        if not in_opening(game):
+            return None
+        return self.entries.get(opening_key(game, player))
+
+    def add(self, game, player, moves):
+        self.entries[opening_key(game, player)] = list(moves)
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+    def agent(self, fallback=random_agent):
+        """
+        Returns an agent that plays the book's best legal action in the first round and
+        defers to fallback otherwise.
+        """
+
+        def play(game, player, actions):
+            for move in self.lookup(game, player) or ():
+                if move.action in actions:
+                    return move.action
+            return fallback(game, player, actions)
+
+        return play
+
+    def build(self, players, seeds, save_every=10, **search):
+        """
+        Fills the book from the openings dealt with the given seeds: every seat of each
+        game's first round is searched (unless already in the book), and the book's best
+        action is played to reach the next seat. search is passed to search_opening.
+        Returns the number of positions added.
+        """
+        added = 0
+        for seed in seeds:
+            random.seed(seed)
+            with contextlib.redirect_stdout(None):
+                game = GameState(list(players))
+            action_generation.reset_connection_cache()
+            for player in list(game.turn_order):
+                moves = self.lookup(game, player)
+                if moves is None:
+                    moves = search_opening(game, player, seed=seed, **search)
+                    self.add(game, player, moves)
+                    added += 1
+                    if added % save_every == 0:
+                        self.save()
+                if not moves:
+                    break
+                with contextlib.redirect_stdout(None):
+                    action_generation.apply_action(game, player, moves[0].action)
+                    game.draw_cards(player, 1)
+        self.save()
+        return added
+
+
+def book_agent(path, fallback="self_play:random_agent"):
+    """
+    Returns the agent of the book in path, deferring to the agent spec fallback (see
+    tournament.load_agent). For registering with a Tournament as
+    "opening_book:book_agent()".
+    """
+    from tournament import load_agent
+
+    return OpeningBook(path).agent(load_agent(fallback))
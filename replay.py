@@ -0,0 +1,181 @@
+import contextlib
+import random
+
+import action_generation
+from game_master import GameMaster
+from self_play import Turns
+
+# Answers to the discard prompt that only show information.
+INFO_OPTIONS = ("summary", "map", "scores", "markets")
+
+
+class ReplayError(Exception):
+    pass
+
+
+class ScriptedGameMaster(GameMaster):
+    """
+    A GameMaster that takes its answers from a recorded sequence of decisions instead of
+    input(), so archived games run through player_action, build, sell, network and
+    develop exactly as they did at the table, without prompts or pauses.
+
+    decisions are the strings typed at each prompt (location ids are accepted as
+    usual). Answers that only showed information are skipped, and a decision that is not
+    a valid answer, or running out of decisions, raises ReplayError. Unless save is True,
+    the round saves in the saves folder are not written.
+
+    Recordings made before GameMaster worked out coal mine market connections itself
+    have a y/n answer to that question after the build location; it is skipped, and
+    the connection comes from the board as in a new game.
+    """
+
+    def __init__(self, game, decisions, save=False):
+        self.decisions = iter(decisions)
+        self.consumed = 0
+        self.previous = ()  # The last two answers.
+        self.save = save
+        super().__init__(game)
+
+    def valid_input(self, prompt, *args):
+        while True:
+            try:
+                answer = next(self.decisions)
+            except StopIteration:
+                raise ReplayError(
+                    f"Ran out of decisions at prompt {prompt!r}."
+                ) from None
+            self.consumed += 1
+            answer = self.id_to_name.get(answer, answer)
+            if answer in INFO_OPTIONS and answer in args:
+                continue
+            if (
+                answer in ("y", "n")
+                and answer not in args
+                and prompt.startswith("Which space in")
+                and self.previous[:1] == ("Coal Mine",)
+            ):
+                continue
+            self.previous = self.previous[-1:] + (answer,)
+            if answer not in args or answer == "quit":
+                raise ReplayError(
+                    f"Decision {self.consumed} ({answer!r}) is not a valid answer"
+                    f" to {prompt!r}."
+                )
+            return answer
+
+    def write_save(self, filename):
+        if self.save:
+            super().write_save(filename)
+
+
+class RecordingGameMaster(GameMaster):
+    """
+    A GameMaster that keeps every valid answer given at its prompts in self.decisions,
+    leaving out the ones that only show information, for replaying with
+    ScriptedGameMaster.
+    """
+
+    def __init__(self, game=None):
+        self.decisions = []
+        super().__init__(game)
+
+    def valid_input(self, prompt, *args):
+        answer = super().valid_input(prompt, *args)
+        if answer not in INFO_OPTIONS:
+            self.decisions.append(answer)
+        return answer
+
+
+def action_inputs(action, era):
+    """
+    Returns the answers GameMaster would be given for an action from action_generation,
+    starting with the discarded card and the action name. Debts at the end of a round are
+    prompted for separately ("none" takes them as vps).
+    """
+    kwargs = dict(action.kwargs)
+    inputs = [action.card, action.kind]
+
+    def source(name, market):
+        if kwargs.get(name) is None:
+            return []
+        if kwargs[name] == market:
+            return [market]
+        return [kwargs[name], str(kwargs[f"{name}_space"])]
+
+    if action.kind == "scout":
+        inputs += action.args
+    elif action.kind == "build":
+        industry, loc, space = action.args
+        inputs += [industry, loc, str(space)]
+        for name in ("cube1", "cube2"):
+            if kwargs.get(name) is None:
+                inputs.append("n")
+                break
+            inputs.append("y")
+            inputs += [kwargs[name]]
+            if not kwargs[name].endswith("market"):
+                inputs.append(str(kwargs[f"{name}_space"]))
+    elif action.kind == "develop":
+        industry1, *rest = action.args
+        inputs += [industry1, *source("iron1", "iron market")]
+        if not rest or rest[0] is None:
+            inputs.append("skip")
+        else:
+            inputs += [rest[0], *source("iron2", "iron market")]
+    elif action.kind == "network":
+        inputs += action.args
+        if era != "canal":
+            inputs += source("coal1", "coal market")
+            if kwargs.get("link2_start") is None:
+                inputs.append("n")
+            else:
+                inputs += ["y", kwargs["link2_start"], kwargs["link2_end"]]
+                inputs += source("coal2", "coal market")
+                inputs += [kwargs["beer"], str(kwargs["beer_space"])]
+    elif action.kind == "sell":
+        tiles, beers, develop = action.args
+        for i, ((loc, space), tile_beers) in enumerate(zip(tiles, beers)):
+            inputs += [loc, str(space)]
+            for beer_loc, beer_space in tile_beers:
+                inputs.append(beer_loc)
+                if beer_loc == "Gloucester":
+                    # GameMaster always asks, though the answer is only used for a
+                    # develop bonus.
+                    inputs.append(develop or "Coal Mine")
+                inputs.append(str(beer_space))
+            inputs.append("done")
+            inputs.append("y" if i == len(tiles) - 1 else "n")
+    return inputs
+
+
+def self_play_decisions(game, agents):
+    """
+    Plays a game like self_play.play_game and returns the decisions that replay it
+    through GameMaster, including a "none" for each debt taken as vps.
+    """
+    decisions = []
+    turns = Turns(game)
+    with contextlib.redirect_stdout(None):
+        while turns.player is not None:
+            player = turns.player
+            actions = action_generation.legal_actions(game, player)
+            if actions:
+                action = agents[player](game, player, actions)
+                decisions += action_inputs(action, game.era)
+                action_generation.apply_action(game, player, action)
+            decisions += ["none"] * len(turns.advance())
+    return decisions
+
+
+def replay(game, decisions, seed=None):
+    """
+    Plays a game from its current round through ScriptedGameMaster and returns it.
+
+    The rail era deck is shuffled with the random module, so a game only replays exactly
+    if seed matches the one it was recorded with.
+    """
+    if seed is not None:
+        random.seed(seed)
+    with contextlib.redirect_stdout(None):
+        ScriptedGameMaster(game, decisions).play_game()
+    return game
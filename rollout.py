@@ -0,0 +1,871 @@
+import contextlib
+import random
+import sys
+import time
+
+import utils
+from action_generation import Action, card_industries
+from game_entities import INDUSTRY_TYPES, STARTING_TILES, GameState
+
+MANUFACTURER, COTTON_MILL, BREWERY, IRONWORKS, COAL_MINE, POTTERY = range(6)
+SELLABLE = (1 << MANUFACTURER) | (1 << COTTON_MILL) | (1 << POTTERY)
+MERCHANT_ACCEPTS = {
+    None: 0,
+    "Manufacturer": 1 << MANUFACTURER,
+    "Cotton Mill": 1 << COTTON_MILL,
+    "Pottery": 1 << POTTERY,
+    "Wild": SELLABLE,
+}
+ERAS = ("canal", "rail", "end")
+CANAL, RAIL, END = range(3)
+# Cube sources other than build spaces.
+COAL_MARKET, IRON_MARKET = -1, -2
+FARM = "Farm Brewery South"
+
+
+def _era_mask(allowed):
+    return 3 if allowed == "both" else sum(1 << i for i in (0, 1) if ERAS[i] in allowed)
+
+
+class _Board:
+    """
+    The fixed parts of a game numbered for PlayoutState: nodes, build spaces, market
+    slots, links and tiles. Cards are numbered as they are first seen.
+    """
+
+    def __init__(self, game):
+        map_ = game.map_
+        self.nodes = list(map_.nodes)
+        index = {n: i for i, n in enumerate(self.nodes)}
+        self.is_market = []
+        self.node_spaces = []
+        self.space_loc, self.space_allowed = [], []
+        self.space_single, self.space_key = [], []
+        self.slot_node, self.slot_bonus, self.slot_key = [], [], []
+        for n, data in map_.nodes(data=True):
+            self.is_market.append(data["type"] == "market")
+            spaces = []
+            if data["type"] == "location":
+                for i, spot in enumerate(data["build_spots"]):
+                    allowed = [INDUSTRY_TYPES.index(t) for t in spot.allowed_industries]
+                    spaces.append(len(self.space_loc))
+                    self.space_loc.append(index[n])
+                    self.space_allowed.append(sum(1 << t for t in allowed))
+                    self.space_single.append(allowed[0] if len(allowed) == 1 else -1)
+                    self.space_key.append((n, i))
+            else:
+                bonus = data["market"].bonus
+                for i in range(len(data["market"].merchants)):
+                    self.slot_node.append(index[n])
+                    self.slot_bonus.append(
+                        (bonus[0], bonus[1] if len(bonus) > 1 else 0)
+                    )
+                    self.slot_key.append((n, i))
+            self.node_spaces.append(spaces)
+
+        # Kidderminster-Worcester also places both links to Farm Brewery South, which are
+        # never offered on their own and only score through it.
+        self.edge_key, self.edge_ends, self.edge_era = [], [], []
+        self.node_edges = [[] for _ in self.nodes]
+        for u, v, data in map_.edges(data=True):
+            e = len(self.edge_key)
+            self.edge_key.append((u, v))
+            self.edge_ends.append((index[u], index[v]))
+            self.edge_era.append(_era_mask(data["type"]))
+            self.node_edges[index[u]].append((e, index[v]))
+            self.node_edges[index[v]].append((e, index[u]))
+        self.markets = [n for n, market in enumerate(self.is_market) if market]
+        # For each industry, (node, spaces allowing it, those allowing only it, all
+        # spaces) where it can go.
+        self.industry_nodes = [
+            [
+                (
+                    n,
+                    [s for s in spaces if self.space_allowed[s] >> ind & 1],
+                    [s for s in spaces if self.space_single[s] == ind],
+                    spaces,
+                )
+                for n, spaces in enumerate(self.node_spaces)
+                if any(self.space_allowed[s] >> ind & 1 for s in spaces)
+            ]
+            for ind in range(len(INDUSTRY_TYPES))
+        ]
+        self.industry_at = [
+            {entry[0]: i for i, entry in enumerate(entries)}
+            for entries in self.industry_nodes
+        ]
+        farm = index.get(FARM)
+        self.offered, self.edge_touch, self.edge_also = [], [], []
+        self.farm_edge = -1
+        self.farm_space = -1 if farm is None else self.node_spaces[farm][0]
+        for e, (u, v) in enumerate(self.edge_ends):
+            self.edge_touch.append((u, v))
+            self.edge_also.append(())
+            if farm in (u, v):
+                continue
+            self.offered.append(e)
+            if {self.nodes[u], self.nodes[v]} == {"Kidderminster", "Worcester"}:
+                self.edge_touch[e] = (u, v, farm)
+                self.edge_also[e] = tuple(f for f, _ in self.node_edges[farm])
+                self.farm_edge = e
+        self.scored = [farm not in ends for ends in self.edge_ends]
+
+        self.tiles = list(game.industries)
+        self.tile_index = {tile: i for i, tile in enumerate(self.tiles)}
+        tiles = [game.industries[tile] for tile in self.tiles]
+        self.t_type = [INDUSTRY_TYPES.index(t.type) for t in tiles]
+        self.t_level = [t.level for t in tiles]
+        self.t_production = [t.production for t in tiles]
+        self.t_beers = [t.beers_to_sell for t in tiles]
+        self.t_points = [t.points for t in tiles]
+        self.t_link_points = [t.link_points for t in tiles]
+        self.t_income = [t.income for t in tiles]
+        self.t_era = [_era_mask(t.era) for t in tiles]
+        self.t_cost = [t.cost for t in tiles]
+        self.t_coal = [t.coal_cost for t in tiles]
+        self.t_iron = [t.iron_cost for t in tiles]
+        self.t_develop = [t.develop for t in tiles]
+        self.t_obsolete = [tile[-1] == "1" for tile in self.tiles]
+        self.stacks = [
+            tuple(self.tile_index[tile] for tile in STARTING_TILES[ind])
+            for ind in INDUSTRY_TYPES
+        ]
+
+        self.cards, self.card_index, self.card_loc, self.card_inds = [], {}, [], []
+        self.wild_location = self.card("Wild Location")
+        self.wild_industry = self.card("Wild Industry")
+
+    def card(self, name):
+        if name not in self.card_index:
+            self.card_index[name] = len(self.cards)
+            self.cards.append(name)
+            if name in self.nodes:
+                self.card_loc.append(self.nodes.index(name))
+                self.card_inds.append(0)
+            else:
+                self.card_loc.append(-1)
+                self.card_inds.append(
+                    sum(1 << INDUSTRY_TYPES.index(t) for t in card_industries(name))
+                )
+        return self.card_index[name]
+
+
+_boards = {}
+
+
+def _board(game):
+    key = (tuple(game.map_.nodes), tuple(game.industries))
+    if key not in _boards:
+        _boards[key] = _Board(game)
+    return _boards[key]
+
+
+class PlayoutState:
+    """
+    A game reduced to lists of numbers for playouts, following the rules of GameState
+    and Turns without printing. Only the actions of the playout policy are implemented
+    (sells, builds, single links, loans and passes), and each is chosen already legal,
+    so nothing is validated or listed. copy() is cheap, so a search copies one state
+    made from its root for every playout.
+
+    Connected components, each player's network and spaces, the spaces holding each
+    industry and the open links are kept up to date as pieces are placed, rather than
+    found again by scanning the board for every action. Link distances to coal are only
+    worked out when coal in more than one place could be used.
+
+    If log is a list, each step is appended to it as (player, Action), with None for a
+    player who had no cards left, so a playout can be replayed on a GameState.
+    """
+
+    def __init__(self, game, seat=0, actions_left=None):
+        b = self.board = _board(game)
+        players = list(game.players.values())
+        self.names = list(game.players)
+        number = {name: i for i, name in enumerate(self.names)}
+        self.era = ERAS.index(game.era)
+        self.round = game.current_turn
+        self.rounds_per_era = 12 - len(game.turn_order)
+        self.order = [number[name] for name in game.turn_order]
+        self.seat = seat
+        self.actions_left = actions_left or self._actions_per_turn()
+        self.coal, self.iron = game.coal_market, game.iron_market
+        self.deck = [b.card(card) for card in game.deck]
+        self.money = [p.money for p in players]
+        self.spent = [p.spent_this_turn for p in players]
+        self.income = [p.income for p in players]
+        self.link_tiles = [p.link_tiles for p in players]
+        self.vps = [list(p.vps) for p in players]
+        self.used = [
+            [
+                len(STARTING_TILES[ind]) - len(p.industry_tiles[ind])
+                for ind in INDUSTRY_TYPES
+            ]
+            for p in players
+        ]
+        self.hands = [[b.card(card) for card in p.cards] for p in players]
+        self.discards = [[b.card(card) for card in p.discard_pile] for p in players]
+        self.tile, self.owner, self.flipped, self.cubes = [], [], [], []
+        for _, data in game.map_.nodes(data=True):
+            if data["type"] == "location":
+                for space in data["build_spots"]:
+                    self.tile.append(b.tile_index.get(space.industry, -1))
+                    self.owner.append(number.get(space.owned_by, -1))
+                    self.flipped.append(space.flipped)
+                    self.cubes.append(space.resource_amount)
+        self.edge_owner = [
+            number.get(data["player"], -1) for _, _, data in game.map_.edges(data=True)
+        ]
+        accepts, self.slot_beer = [], []
+        for _, data in game.map_.nodes(data=True):
+            if data["type"] == "market":
+                accepts.extend(MERCHANT_ACCEPTS[m] for m in data["market"].merchants)
+                self.slot_beer.extend(data["market"].beer)
+        self.slot_accepts = tuple(accepts)
+        self._track()
+        self.log = None
+
+    def copy(self):
+        state = PlayoutState.__new__(PlayoutState)
+        state.__dict__.update(self.__dict__)
+        for attr in (
+            "order",
+            "deck",
+            "money",
+            "spent",
+            "income",
+            "link_tiles",
+            "tile",
+            "owner",
+            "flipped",
+            "cubes",
+            "edge_owner",
+            "slot_beer",
+            "networks",
+            "spaces_of",
+            "sites",
+        ):
+            setattr(state, attr, list(getattr(self, attr)))
+        for attr in ("vps", "used", "hands", "discards"):
+            setattr(state, attr, [list(x) for x in getattr(self, attr)])
+        state.log = None
+        return state
+
+    def scores(self):
+        return {name: sum(vps) for name, vps in zip(self.names, self.vps)}
+
+    def play(self, rng, explore=0.25):
+        """Plays the game to the end with the playout policy and returns scores()."""
+        while self.era != END:
+            p = self.order[self.seat]
+            if self.hands[p]:
+                self._act(p, rng, explore)
+            elif self.log is not None:
+                self.log.append((self.names[p], None))
+            self._advance(rng)
+        return self.scores()
+
+    def _actions_per_turn(self):
+        return 1 if self.era == CANAL and self.round == 1 else 2
+
+    def _advance(self, rng):
+        self.actions_left -= 1
+        if self.actions_left:
+            return
+        n = self._actions_per_turn()
+        if n <= len(self.deck):
+            self.hands[self.order[self.seat]].extend(self.deck[:n])
+            del self.deck[:n]
+        self.seat += 1
+        if self.seat == len(self.order):
+            self.seat = 0
+            self._end_round(rng)
+        self.actions_left = self._actions_per_turn()
+
+    def _end_round(self, rng):
+        if self.era == RAIL and self.round == self.rounds_per_era:
+            self._score(5, 6)
+            self.era = END
+            return
+        self.round += 1
+        self.order.sort(key=self.spent.__getitem__)
+        for p in range(len(self.names)):
+            self.spent[p] = 0
+            self.money[p] += utils.income_level(self.income[p])
+            if self.money[p] < 0:
+                self._add_vps(p, self.money[p], 3 if self.era == CANAL else 7)
+                self.money[p] = 0
+        if self.era == CANAL and self.round > self.rounds_per_era:
+            self._end_canal(rng)
+
+    def _end_canal(self, rng):
+        self._score(1, 2)
+        b = self.board
+        for s, tile in enumerate(self.tile):
+            if tile >= 0 and b.t_obsolete[tile]:
+                self.tile[s] = self.owner[s] = -1
+                self.flipped[s] = False
+                self.cubes[s] = 0
+        self.edge_owner = [-1] * len(self.edge_owner)
+        self.slot_beer = [1 if accepts else 0 for accepts in self.slot_accepts]
+        for p in range(len(self.names)):
+            self.link_tiles[p] = 14
+            self.deck.extend(self.discards[p])
+            self.discards[p] = []
+        rng.shuffle(self.deck)
+        for p in range(len(self.names)):
+            self.hands[p].extend(self.deck[:8])
+            del self.deck[:8]
+        self.era = RAIL
+        self.round = 1
+        self._track()
+
+    def _score(self, links, industries):
+        """Scores links then industries, as GameState does at the end of an era."""
+        b = self.board
+        for e, player in enumerate(self.edge_owner):
+            if player < 0 or not b.scored[e]:
+                continue
+            points = 0
+            if e == b.farm_edge and self.flipped[b.farm_space]:
+                points += b.t_link_points[self.tile[b.farm_space]]
+            for n in b.edge_ends[e]:
+                if b.is_market[n]:
+                    points += 2
+                    continue
+                for s in b.node_spaces[n]:
+                    if self.flipped[s]:
+                        points += b.t_link_points[self.tile[s]]
+            self._add_vps(player, points, links)
+        for s, flipped in enumerate(self.flipped):
+            if flipped:
+                self._add_vps(self.owner[s], b.t_points[self.tile[s]], industries)
+
+    def _add_vps(self, p, points, i):
+        if points < 0:
+            points = max(-sum(self.vps[p]), points)
+        self.vps[p][i] += points
+
+    def _track(self):
+        """
+        Works out from scratch what is otherwise kept up to date as the board changes:
+        the connected component of every node through built links, each player's network
+        and spaces, the spaces holding each industry and the links open this era.
+        """
+        b = self.board
+        self.components = components = [-1] * len(b.nodes)
+        for start in range(len(components)):
+            if components[start] < 0:
+                for n in self._reach((start,)):
+                    components[n] = start
+        self.networks = [self._network(p) for p in range(len(self.names))]
+        self.spaces_of = [
+            tuple(s for s, player in enumerate(self.owner) if player == p)
+            for p in range(len(self.names))
+        ]
+        self.sites = [
+            tuple(
+                s
+                for s, tile in enumerate(self.tile)
+                if tile >= 0 and b.t_type[tile] == ind
+            )
+            for ind in range(6)
+        ]
+        self.open_edges = tuple(
+            e
+            for e in b.offered
+            if self.edge_owner[e] < 0 and b.edge_era[e] >> self.era & 1
+        )
+
+    def _join(self, u, v):
+        """Merges the components of u and v when a link is built between them."""
+        components = self.components
+        old, new = components[v], components[u]
+        if old != new:
+            self.components = [new if c == old else c for c in components]
+
+    def _reach(self, starts, extra=-1):
+        """
+        Returns the link distance from the nearest start to every node reached through
+        built links and the extra link.
+        """
+        node_edges = self.board.node_edges
+        owner = self.edge_owner
+        distances = dict.fromkeys(starts, 0)
+        queue = list(distances)
+        for n in queue:
+            for e, m in node_edges[n]:
+                if m not in distances and (owner[e] >= 0 or e == extra):
+                    distances[m] = distances[n] + 1
+                    queue.append(m)
+        return distances
+
+    def _network(self, p):
+        """Returns the nodes next to p's links or holding p's tiles, from scratch."""
+        b = self.board
+        network = set()
+        for e, player in enumerate(self.edge_owner):
+            if player == p:
+                network.update(b.edge_ends[e])
+        for s, player in enumerate(self.owner):
+            if player == p:
+                network.add(b.space_loc[s])
+        return frozenset(network)
+
+    def _coal(self, starts, amount, extra=-1):
+        """
+        Returns the cube sources for the given amount of coal used at the start nodes:
+        the closest connected coal first, then the market if connected to one. Returns
+        None if there is not enough.
+        """
+        if amount == 0:
+            return []
+        b = self.board
+        components, cubes = self.components, self.cubes
+        # The extra link is always between the starts, so it joins their components.
+        groups = {components[n] for n in starts}
+        mines = [
+            s
+            for s in self.sites[COAL_MINE]
+            if cubes[s] and components[b.space_loc[s]] in groups
+        ]
+        # Distances only matter when there is more coal than needed in several places.
+        distances = {}
+        if (
+            sum(cubes[s] for s in mines) > amount
+            and len({b.space_loc[s] for s in mines}) > 1
+        ):
+            distances = self._reach(starts, extra)
+        ranked = []
+        for s in mines:
+            ranked.extend([(distances.get(b.space_loc[s], 0), s)] * cubes[s])
+        ranked.sort()
+        # In the order coal_options lists them.
+        sources = sorted((s for _, s in ranked[:amount]), key=b.space_key.__getitem__)
+        if len(sources) < amount:
+            if not any(components[n] in groups for n in b.markets):
+                return None
+            sources += [COAL_MARKET] * (amount - len(sources))
+        return sources
+
+    def _iron(self, amount):
+        if amount == 0:
+            return []
+        b = self.board
+        sources = []
+        for s in self.sites[IRONWORKS]:
+            sources.extend([s] * self.cubes[s])
+        sources = sorted(sources[:amount], key=b.space_key.__getitem__)
+        return sources + [IRON_MARKET] * (amount - len(sources))
+
+    def _market_cost(self, sources):
+        cost, coal, iron = 0, self.coal, self.iron
+        for source in sources:
+            if source == COAL_MARKET:
+                cost += utils.coal_cost(coal)
+                coal = max(0, coal - 1)
+            elif source == IRON_MARKET:
+                cost += utils.iron_cost(iron)
+                iron = max(0, iron - 1)
+        return cost
+
+    def _take(self, source):
+        """Takes a cube from a source, flipping a tile it empties, and returns its cost."""
+        if source == COAL_MARKET:
+            cost = utils.coal_cost(self.coal)
+            self.coal = max(0, self.coal - 1)
+            return cost
+        if source == IRON_MARKET:
+            cost = utils.iron_cost(self.iron)
+            self.iron = max(0, self.iron - 1)
+            return cost
+        self.cubes[source] -= 1
+        if not self.cubes[source]:
+            self.flipped[source] = True
+            owner = self.owner[source]
+            income = self.board.t_income[self.tile[source]]
+            self.income[owner] = min(99, self.income[owner] + income)
+        return 0
+
+    def _discard(self, p, card):
+        self.hands[p].remove(card)
+        if card != self.board.wild_location and card != self.board.wild_industry:
+            self.discards[p].append(card)
+
+    def _source_names(self, prefix, sources):
+        names = {COAL_MARKET: "coal market", IRON_MARKET: "iron market"}
+        kwargs = []
+        for name, source in zip(prefix, sources):
+            if source < 0:
+                kwargs += [(name, names[source]), (f"{name}_space", None)]
+            else:
+                kwargs += [
+                    (name, self.board.space_key[source][0]),
+                    (f"{name}_space", self.board.space_key[source][1]),
+                ]
+        return tuple(kwargs)
+
+    def _act(self, p, rng, explore):
+        """
+        Takes one action for p: a sell of every tile that can be sold, else a build
+        favouring income and tiles that flip quickly, else a single link, else a loan
+        when short of money, else a pass. With probability explore a link is preferred
+        to the build, so playouts do not all follow the same line.
+        """
+        b = self.board
+        hand = self.hands[p]
+        cards = [c for c in hand if c != b.wild_location and c != b.wild_industry]
+        card = rng.choice(cards or hand)
+        if self._sell(p, card):
+            return
+        network = self.networks[p] or None
+        if (rng.random() >= explore or not self.link_tiles[p]) and self._build(
+            p, rng, network
+        ):
+            return
+        if self.link_tiles[p] and self._link(p, card, rng, network):
+            return
+        level = utils.income_level(self.income[p])
+        if (
+            self.money[p] < 10
+            and level - 3 >= -10
+            and not (self.era == RAIL and not self.deck)
+        ):
+            self._discard(p, card)
+            self.money[p] += 30
+            self.income[p] = utils.inverse_income_level(level - 3)
+            self._log(p, Action(b.cards[card], "loan"))
+            return
+        self._discard(p, card)
+        self._log(p, Action(b.cards[card], "pass"))
+
+    def _log(self, p, action):
+        if self.log is not None:
+            self.log.append((self.names[p], action))
+
+    def _sell(self, p, card):
+        """
+        Sells every tile of p that has enough beer, most valuable first. Merchant beer is
+        used first, then p's breweries, then other players' connected ones.
+        """
+        b = self.board
+        tiles = []
+        for s in self.spaces_of[p]:
+            if not self.flipped[s]:
+                tile = self.tile[s]
+                if SELLABLE >> b.t_type[tile] & 1:
+                    value = b.t_points[tile] + b.t_income[tile] + b.t_link_points[tile]
+                    tiles.append((-value, s))
+        if not tiles:
+            return False
+        tiles.sort()
+        component = self.components
+        used = self.used[p]
+        develop = next(
+            (
+                ind
+                for ind in range(6)
+                if used[ind] < len(b.stacks[ind])
+                and b.t_develop[b.stacks[ind][used[ind]]]
+            ),
+            None,
+        )
+        # GameState develops the same industry for every develop bonus in a sell.
+        stack = 0 if develop is None else len(b.stacks[develop])
+        sold, beers, income = [], [], 0
+        for _, s in tiles:
+            tile = self.tile[s]
+            group = component[b.space_loc[s]]
+            bit = 1 << b.t_type[tile]
+            slots = [
+                k
+                for k, accepts in enumerate(self.slot_accepts)
+                if accepts & bit and component[b.slot_node[k]] == group
+            ]
+            if not slots:
+                continue
+            sources = []
+            developments = 0 if develop is None else stack - used[develop]
+            for k in slots:
+                if self.slot_beer[k]:
+                    if b.slot_bonus[k][0] == "develop":
+                        if not developments:
+                            continue
+                        developments -= 1
+                    sources.append(k + len(self.tile))
+            others = []
+            for t in self.sites[BREWERY]:
+                beer = self.cubes[t]
+                if beer:
+                    if self.owner[t] == p:
+                        sources += [t] * beer
+                    elif component[b.space_loc[t]] == group:
+                        others += [t] * beer
+            sources += others
+            need = b.t_beers[tile]
+            if len(sources) < need:
+                continue
+            self.flipped[s] = True
+            income += b.t_income[tile]
+            sold.append(b.space_key[s])
+            beers.append(
+                tuple(self._beer(p, source, develop) for source in sources[:need])
+            )
+        if not sold:
+            return False
+        self.income[p] = min(99, self.income[p] + income)
+        self._discard(p, card)
+        if self.log is not None:
+            develop = None if develop is None else INDUSTRY_TYPES[develop]
+            args = (tuple(sold), tuple(beers), develop)
+            self._log(p, Action(b.cards[card], "sell", args))
+        return True
+
+    def _beer(self, p, source, develop):
+        """Consumes a beer for p, with its merchant bonus, and returns where it came from."""
+        b = self.board
+        k = source - len(self.tile)
+        if k < 0:
+            self._take(source)
+            return b.space_key[source]
+        self.slot_beer[k] -= 1
+        kind, amount = b.slot_bonus[k]
+        if kind == "vps":
+            self._add_vps(p, amount, 0 if self.era == CANAL else 4)
+        elif kind == "money":
+            self.money[p] += amount
+        elif kind == "income":
+            self.income[p] = min(99, self.income[p] + amount)
+        else:
+            self.used[p][develop] += 1
+        return b.slot_key[k]
+
+    def _build(self, p, rng, network):
+        """
+        Builds the tile with the best rough score: income, half the tile's points and a
+        bonus for tiles that flip quickly (mines and ironworks sell their cubes at once
+        when they can). Cube sources are only worked out for the builds tried, best first.
+        """
+        b = self.board
+        hand = self.hands[p]
+        anywhere = b.wild_location in hand
+        places, industries = set(), 0
+        for c in hand:
+            if b.card_loc[c] >= 0:
+                places.add(b.card_loc[c])
+            else:
+                industries |= b.card_inds[c]
+        coal_left = iron_left = None
+        component = self.components
+        market_groups = {component[m] for m in b.markets}
+        tiles, owner, canal = self.tile, self.owner, self.era == CANAL
+        types, levels = b.t_type, b.t_level
+        candidates = []
+        for ind in range(6):
+            position = self.used[p][ind]
+            if position == len(b.stacks[ind]):
+                continue
+            tile = b.stacks[ind][position]
+            if (
+                b.t_cost[tile] > self.money[p]
+                or not b.t_era[tile] >> self.era & 1
+                or b.t_coal[tile] + b.t_iron[tile] > 2
+            ):
+                continue
+            bit, level = 1 << ind, levels[tile]
+            base = b.t_income[tile] + b.t_points[tile] / 2
+            entries = b.industry_nodes[ind]
+            if not (anywhere or industries & bit and network is None):
+                at = b.industry_at[ind]
+                reach = places | network if industries & bit else places
+                entries = [entries[i] for i in sorted(at[n] for n in reach if n in at)]
+            for n, allowed, singles, spaces in entries:
+                if network is not None and n in network:
+                    own = [s for s in spaces if owner[s] == p]
+                else:
+                    own = []
+                if canal and own:
+                    candidates_here = []
+                else:
+                    candidates_here = [s for s in singles if tiles[s] < 0] or [
+                        s for s in allowed if tiles[s] < 0
+                    ]
+                for s in allowed:
+                    current = tiles[s]
+                    if current < 0 or types[current] != ind or levels[current] >= level:
+                        continue
+                    if canal and own and own != [s]:
+                        continue
+                    if owner[s] == p:
+                        candidates_here.append(s)
+                    elif ind == COAL_MINE:
+                        if coal_left is None:
+                            coal_left = self.coal or self._on_board(COAL_MINE)
+                        if not coal_left:
+                            candidates_here.append(s)
+                    elif ind == IRONWORKS:
+                        if iron_left is None:
+                            iron_left = self.iron or self._on_board(IRONWORKS)
+                        if not iron_left:
+                            candidates_here.append(s)
+                if not candidates_here:
+                    continue
+                market = ind == COAL_MINE and component[n] in market_groups
+                for s in candidates_here:
+                    score = base + rng.random()
+                    if ind == IRONWORKS or market:
+                        score += 3
+                    candidates.append((score, ind, n, s, tile, market))
+        candidates.sort(reverse=True)
+        coal_at = {}
+        for _, ind, n, s, tile, market in candidates:
+            key = (n, b.t_coal[tile])
+            if key not in coal_at:
+                coal_at[key] = self._coal((n,), b.t_coal[tile])
+            coal = coal_at[key]
+            if coal is None:
+                continue
+            sources = coal + self._iron(b.t_iron[tile])
+            if b.t_cost[tile] + self._market_cost(sources) > self.money[p]:
+                continue
+            usable = [
+                c
+                for c in hand
+                if c == b.wild_location
+                or b.card_loc[c] == n
+                or b.card_inds[c] & 1 << ind
+                and (network is None or n in network)
+            ]
+            plain = [c for c in usable if c != b.wild_location and c != b.wild_industry]
+            card = rng.choice(plain or usable)
+            self._place(p, ind, s, tile, sources, market)
+            self._discard(p, card)
+            if self.log is not None:
+                kwargs = self._source_names(("cube1", "cube2"), sources)
+                if market:
+                    kwargs += (("market_connection", True),)
+                args = (INDUSTRY_TYPES[ind],) + b.space_key[s]
+                self._log(p, Action(b.cards[card], "build", args, kwargs))
+            return True
+        return False
+
+    def _on_board(self, ind):
+        return any(self.cubes[s] for s in self.sites[ind])
+
+    def _place(self, p, ind, s, tile, sources, market):
+        b = self.board
+        cost = b.t_cost[tile]
+        for source in sources:
+            cost += self._take(source)
+        revenue, amount = 0, 0
+        if ind == IRONWORKS:
+            amount = b.t_production[tile]
+            moved = min(amount, 10 - self.iron)
+            amount -= moved
+            revenue = sum(
+                utils.iron_cost(i) for i in range(self.iron + 1, self.iron + 1 + moved)
+            )
+            self.iron += moved
+        elif ind == COAL_MINE:
+            amount = b.t_production[tile]
+            if market:
+                moved = min(amount, 14 - self.coal)
+                amount -= moved
+                revenue = sum(
+                    utils.coal_cost(i)
+                    for i in range(self.coal + 1, self.coal + 1 + moved)
+                )
+                self.coal += moved
+        elif ind == BREWERY:
+            amount = 1 if self.era == CANAL else 2
+        previous = self.owner[s]
+        if previous != p:
+            self.spaces_of[p] += (s,)
+            self.networks[p] |= {b.space_loc[s]}
+            if previous < 0:
+                self.sites[ind] = tuple(sorted(self.sites[ind] + (s,)))
+            else:
+                self.spaces_of[previous] = tuple(
+                    t for t in self.spaces_of[previous] if t != s
+                )
+                self.owner[s] = -1
+                self.networks[previous] = self._network(previous)
+        self.tile[s], self.owner[s], self.cubes[s] = tile, p, amount
+        self.flipped[s] = (ind == IRONWORKS or ind == COAL_MINE) and not amount
+        if self.flipped[s]:
+            self.income[p] = min(99, self.income[p] + b.t_income[tile])
+        self.used[p][ind] += 1
+        self.money[p] += revenue - cost
+        self.spent[p] += cost
+
+    def _link(self, p, card, rng, network):
+        """Places one of up to four random links next to p's network, if affordable."""
+        b = self.board
+        if network is None:
+            edges = list(self.open_edges)
+        else:
+            edges = [
+                e for e in self.open_edges if not network.isdisjoint(b.edge_touch[e])
+            ]
+        rng.shuffle(edges)
+        for e in edges[:4]:
+            coal = []
+            if self.era == CANAL:
+                cost = 3
+            else:
+                coal = self._coal(b.edge_ends[e], 1, e)
+                if coal is None:
+                    continue
+                cost = 5 + self._market_cost(coal)
+            if cost > self.money[p]:
+                continue
+            for source in coal:
+                self._take(source)
+            for edge in (e,) + b.edge_also[e]:
+                self.edge_owner[edge] = p
+                self.networks[p] = self.networks[p].union(b.edge_ends[edge])
+                self._join(*b.edge_ends[edge])
+            self.open_edges = tuple(edge for edge in self.open_edges if edge != e)
+            self.link_tiles[p] -= 1
+            self.money[p] -= cost
+            self.spent[p] += cost
+            self._discard(p, card)
+            if self.log is not None:
+                kwargs = self._source_names(("coal1",), coal)
+                self._log(p, Action(b.cards[card], "network", b.edge_key[e], kwargs))
+            return True
+        return False
+
+
+def rollout(game, rng=None, seat=0, actions_left=None, explore=0.25):
+    """
+    Plays the game to the end from the given seat and actions left with the playout
+    policy (see PlayoutState) and returns {player: final vps}. The game is not changed.
+    """
+    rng = rng or random.Random()
+    return PlayoutState(game, seat, actions_left).play(rng, explore)
+
+
+def benchmark(players=("A", "B"), seconds=5.0, seed=0):
+    """
+    Plays rollouts from a copy of one PlayoutState of a new game, as a search does, for
+    about the given time and returns (rollouts per second, rollouts played).
+    """
+    random.seed(seed)
+    rng = random.Random(seed)
+    with contextlib.redirect_stdout(None):
+        game = GameState(list(players))
+    root = PlayoutState(game)
+    rollouts = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        root.copy().play(rng)
+        rollouts += 1
+    return rollouts / (time.perf_counter() - start), rollouts
+
+
+if __name__ == "__main__":
+    # Usage: python rollout.py [player count] [seconds]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    rate, rollouts = benchmark("ABCD"[:count], seconds)
+    print(f"{rollouts} rollouts, {rate:.1f} rollouts/sec")
@@ -0,0 +1,109 @@
+import os
+import pickle
+import queue
+import threading
+import time
+
+import metrics
+
+_STOP = object()
+
+
+class SaveWriter:
+    """
+    Writes game saves on a background thread, so a slow disk does not hold up play.
+
+    submit() takes a copy of the game (cheap, as the industry tiles are shared) and
+    queues it. The thread takes whatever saves are queued as one batch, pickles each to
+    a temporary file next to its target and fsyncs it, and only then renames them over
+    their targets and syncs the directories, so a crash never leaves a half-written
+    save in place. At most max_pending saves wait in the queue; submit() blocks when it
+    is full.
+
+    An error while writing is raised by the next submit(), flush() or close().
+    """
+
+    def __init__(self, max_pending=8, fsync=True):
+        self.fsync = fsync
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        metrics.QUEUE_DEPTH.set_function(self.queue.qsize, queue="saves")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, game, filename):
+        self._check()
+        self.queue.put((game.copy(), filename))
+
+    def flush(self):
+        """Waits until every save submitted so far is on disk."""
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        self._check()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            # Whatever else is already queued is written in the same batch.
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            saves = [item for item in batch if item is not _STOP]
+            try:
+                self._write(saves)
+            except Exception as e:
+                self.error = e
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, saves):
+        start = time.perf_counter()
+        written = []
+        for game, filename in saves:
+            tmp = f"{filename}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(game, f)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            written.append((tmp, filename))
+        directories = set()
+        for tmp, filename in written:
+            os.replace(tmp, filename)
+            directories.add(os.path.dirname(os.path.abspath(filename)))
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            # The renames themselves are only durable once their directory is synced.
+            for directory in directories:
+                fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        self.written += len(written)
+        if written:
+            elapsed = time.perf_counter() - start
+            for _ in written:
+                metrics.SAVE_SECONDS.observe(elapsed / len(written))
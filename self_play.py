@@ -0,0 +1,96 @@
+import contextlib
+import random
+
+import action_generation
+import metrics
+
+
+def random_agent(game, player, actions):
+    return random.choice(actions)
+
+
+class Turns:
+    """
+    Tracks whose action it is, following the round structure of GameMaster.play_game:
+    one action each in the first canal round and two after that, cards drawn at the end
+    of each turn, and the end of round, era and game handled as the last turn finishes.
+
+    seat is the current player's index in game.turn_order, and actions_left how many
+    actions they still have this turn. Debts that income cannot cover are taken as vps,
+    as if the player had no tiles to remove.
+    """
+
+    def __init__(self, game, seat=0, actions_left=None):
+        self.game = game
+        self.rounds_per_era = 12 - len(game.turn_order)
+        self.seat = seat
+        self.actions_left = actions_left or self._actions_per_turn()
+
+    def _actions_per_turn(self):
+        return 1 if self.game.era == "canal" and self.game.current_turn == 1 else 2
+
+    @property
+    def player(self):
+        """Returns the player to act, or None once the game is over."""
+        if self.game.era == "end":
+            return None
+        return self.game.turn_order[self.seat]
+
+    def advance(self):
+        """
+        Moves on after the current player has taken (or had to skip) an action. Returns
+        the (player, debt) pairs taken as vps if this ended a round.
+        """
+        self.actions_left -= 1
+        if self.actions_left:
+            return []
+        self.game.draw_cards(self.player, self._actions_per_turn())
+        self.seat += 1
+        debts = []
+        if self.seat == len(self.game.turn_order):
+            self.seat = 0
+            debts = self._end_round()
+        self.actions_left = self._actions_per_turn()
+        return debts
+
+    def _end_round(self):
+        game = self.game
+        if game.era == "rail" and game.current_turn == self.rounds_per_era:
+            game.end_of_game()
+            return []
+        debts = game.next_turn()
+        for p, debt in debts:
+            p.increase_vps(-debt, 3 if game.era == "canal" else 7)
+        if game.era == "canal" and game.current_turn > self.rounds_per_era:
+            game.end_of_canal()
+            action_generation.reset_connection_cache()
+        return debts
+
+
+def play_game(game, agents, on_action=None):
+    """
+    Plays a game from the start of its current round to the end without any prompts.
+
+    agents maps each player name to a callable (game, player, actions) -> action, which
+    picks one of the legal actions. on_action(game, player, action, actions), if given, is
+    called before each action is applied. Returns the game.
+    """
+    turns = Turns(game)
+    metrics.GAMES_IN_FLIGHT.inc(source="self_play")
+    try:
+        with contextlib.redirect_stdout(None):
+            while turns.player is not None:
+                player = turns.player
+                actions = action_generation.legal_actions(game, player)
+                if actions:  # Otherwise the player has run out of cards.
+                    action = agents[player](game, player, actions)
+                    if on_action is not None:
+                        on_action(game, player, action, actions)
+                    with metrics.ACTION_SECONDS.time():
+                        action_generation.apply_action(game, player, action)
+                    metrics.ACTIONS.inc()
+                turns.advance()
+    finally:
+        metrics.GAMES_IN_FLIGHT.dec(source="self_play")
+    metrics.GAMES.inc()
+    return game
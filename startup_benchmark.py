@@ -0,0 +1,64 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# The rules engine and self-play, which only need the standard library.
+CORE_MODULES = ("game_entities", "action_generation", "self_play", "rollout")
+# Modules kept for visualisation, the CLI and learning.
+OTHER_MODULES = ("map_rendering", "evaluation", "game_master")
+HEAVY_DEPENDENCIES = ("networkx", "numpy", "matplotlib", "rich")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps([elapsed, heavy]))
+"""
+
+
+def measure(module, runs=5):
+    """
+    Imports the module in runs fresh interpreters and returns (median import seconds,
+    median process seconds, heavy dependencies it pulled in), or None if it failed.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = _PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)
+    imports, processes, heavy = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", probe], cwd=here, capture_output=True, text=True
+        )
+        processes.append(time.perf_counter() - start)
+        if result.returncode:
+            return None
+        elapsed, heavy = json.loads(result.stdout.splitlines()[-1])
+        imports.append(elapsed)
+    return statistics.median(imports), statistics.median(processes), heavy
+
+
+def report(modules=CORE_MODULES + OTHER_MODULES, runs=5):
+    lines = [f"{'module':<20}{'import ms':>10}{'process ms':>12}  heavy imports"]
+    baseline = measure("sys", runs)
+    lines.append(f"{'(interpreter)':<20}{'':>10}{baseline[1] * 1000:>12.1f}")
+    for module in modules:
+        result = measure(module, runs)
+        if result is None:
+            lines.append(f"{module:<20}  failed to import")
+            continue
+        elapsed, process, heavy = result
+        lines.append(
+            f"{module:<20}{elapsed * 1000:>10.1f}{process * 1000:>12.1f}"
+            f"  {', '.join(heavy) or '-'}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Usage: python startup_benchmark.py [runs]
+    print(report(runs=int(sys.argv[1]) if len(sys.argv) > 1 else 5))
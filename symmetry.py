@@ -0,0 +1,97 @@
+import hashlib
+
+from game_entities import INDUSTRY_TYPES
+
+
+def seats(game):
+    """Returns {player name: position in turn order}, the labels used in canonical forms."""
+    return {name: i for i, name in enumerate(game.turn_order)}
+
+
+def spot_order(game, loc):
+    """
+    Returns the build spot indices of a location in canonical order. Spots are grouped by
+    their allowed industries (in the order the groups first appear), and spots within a
+    group are sorted by their contents, so swapping tiles between identical spots does not
+    change the order of contents.
+    """
+    seat = seats(game)
+    spots = game.map_.nodes[loc]["build_spots"]
+    groups = {}
+    for i, space in enumerate(spots):
+        groups.setdefault(tuple(space.allowed_industries), []).append(i)
+    order = []
+    for indices in groups.values():
+        order.extend(
+            sorted(indices, key=lambda i: repr(_spot_contents(spots[i], seat)))
+        )
+    return order
+
+
+def _spot_contents(space, seat):
+    return (
+        space.industry,
+        seat.get(space.owned_by, -1),
+        space.flipped,
+        space.resource_amount,
+    )
+
+
+def canonical_form(game):
+    """
+    Returns a hashable form of the state that is identical for positions which only differ
+    by player names or by which of several identical build spots (same allowed industries
+    in the same location) holds a tile. Merchant slots in one market are treated the same
+    way. Players are labelled by their position in turn order.
+    """
+    seat = seats(game)
+    players = tuple(
+        (
+            p.money,
+            p.spent_this_turn,
+            p.link_tiles,
+            p.income,
+            tuple(p.vps),
+            tuple(sorted(p.cards)),
+            tuple(sorted(p.discard_pile)),
+            tuple(len(p.industry_tiles[ind]) for ind in INDUSTRY_TYPES),
+        )
+        for p in (game.players[name] for name in game.turn_order)
+    )
+    spots, markets = [], []
+    for loc, data in game.map_.nodes(data=True):
+        if data["type"] == "location":
+            group_contents = {}
+            for space in data["build_spots"]:
+                group = group_contents.setdefault(tuple(space.allowed_industries), [])
+                group.append(_spot_contents(space, seat))
+            for contents in group_contents.values():
+                spots.append(tuple(sorted(contents, key=repr)))
+        else:
+            market = data["market"]
+            markets.append(tuple(sorted(zip(market.merchants, market.beer), key=repr)))
+    links = tuple(
+        seat.get(data["player"], -1) for _, _, data in game.map_.edges(data=True)
+    )
+    return (
+        game.era,
+        game.current_turn,
+        game.coal_market,
+        game.iron_market,
+        game.wild_location_cards,
+        game.wild_industry_cards,
+        tuple(game.deck),
+        players,
+        tuple(spots),
+        links,
+        tuple(markets),
+    )
+
+
+def canonical_hash(game):
+    """
+    Returns a 128-bit hash of the canonical form. Unlike hash(), it is the same in every
+    process, so it can be stored in opening books and on disk.
+    """
+    digest = hashlib.blake2b(repr(canonical_form(game)).encode(), digest_size=16)
+    return int.from_bytes(digest.digest(), "big")
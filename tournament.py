@@ -0,0 +1,203 @@
+import contextlib
+import importlib
+import json
+import os
+import random
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import action_generation
+import game_entities
+from self_play import play_game
+
+Job = namedtuple("Job", ["game_id", "seed", "seats"])
+
+
+def load_agent(spec, kwargs=None):
+    """
+    Returns the agent named by spec. "module:function" is the agent itself, with kwargs
+    bound. "module:factory()" is a function that makes agents, such as
+    macro_actions:macro_agent(); it is called with kwargs and returns the agent.
+    """
+    module, name = spec.split(":")
+    factory = name.endswith("()")
+    agent = getattr(importlib.import_module(module), name.removesuffix("()"))
+    if factory:
+        return agent(**(kwargs or {}))
+    return partial(agent, **kwargs) if kwargs else agent
+
+
+def new_game(job):
+    """
+    Returns the starting state of a scheduled game. The seed fixes the deck, hands and
+    merchants, and the seats are the turn order for the first round.
+    """
+    random.seed(job.seed)
+    action_generation.reset_connection_cache()
+    with contextlib.redirect_stdout(None):
+        game = game_entities.GameState(list(job.seats))
+    game.turn_order = list(job.seats)
+    return game
+
+
+def game_result(job, game):
+    return {
+        "game_id": job.game_id,
+        "seed": job.seed,
+        "seats": list(job.seats),
+        "vps": {name: sum(p.vps) for name, p in game.players.items()},
+    }
+
+
+def run_game(agents, job):
+    """
+    Plays one scheduled game and returns its result. agents maps agent names to
+    (spec, kwargs) pairs.
+    """
+    game = new_game(job)
+    play_game(game, {name: load_agent(*agents[name]) for name in job.seats})
+    return game_result(job, game)
+
+
+class Tournament:
+    """
+    Schedules games among registered agents, plays them in a process pool and rates the
+    agents from the results.
+
+    An agent is a function (game, player, actions) -> action, registered by its import
+    path so that worker processes can load it, e.g.
+    tournament.register("random", "self_play:random_agent"). Agents made by a factory
+    are registered as a call, e.g.
+    tournament.register("macro", "macro_actions:macro_agent()", iterations=200); see
+    load_agent.
+
+    Each table of agents plays one game per rotation of the seats with the same seed, so
+    every agent meets the same hands, deck and merchant setup from every seat. Finished
+    games are appended to the checkpoint file, and a rerun only plays the games missing
+    from it.
+    """
+
+    def __init__(self, checkpoint="tournament.jsonl"):
+        self.agents = {}
+        self.checkpoint = checkpoint
+
+    def register(self, name, spec, **kwargs):
+        self.agents[name] = (spec, kwargs)
+
+    def schedule(self, player_counts=(2, 3, 4), tables=10, seed=0):
+        """
+        Returns the jobs for the given number of tables at each player count. Each table
+        is filled with the agents that have played the fewest games so far.
+        """
+        rng = random.Random(seed)
+        played = Counter()
+        jobs = []
+        for n in player_counts:
+            if n > len(self.agents):
+                raise ValueError(f"{n}-player games need {n} registered agents.")
+            for _ in range(tables):
+                names = sorted(self.agents, key=lambda a: (played[a], rng.random()))
+                names = names[:n]
+                table_seed = rng.getrandbits(32)
+                for r in range(n):
+                    seats = tuple(names[r:] + names[:r])
+                    jobs.append(Job(len(jobs), table_seed, seats))
+                played.update(names)
+        return jobs
+
+    def completed(self):
+        """Returns the results in the checkpoint file, by game id."""
+        results = {}
+        if os.path.exists(self.checkpoint):
+            with open(self.checkpoint, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result["game_id"]] = result
+        return results
+
+    def run(self, jobs, workers=None):
+        """Plays every job not already in the checkpoint and returns all the results."""
+        results = self.completed()
+        pending = [
+            job
+            for job in jobs
+            if job.game_id not in results
+            or results[job.game_id]["seed"] != job.seed
+            or results[job.game_id]["seats"] != list(job.seats)
+        ]
+        with (
+            ProcessPoolExecutor(workers) as pool,
+            open(self.checkpoint, "a", encoding="utf-8") as f,
+        ):
+            futures = [pool.submit(run_game, self.agents, job) for job in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                results[result["game_id"]] = result
+        return [results[job.game_id] for job in jobs]
+
+
+def elo_ratings(results, k=32, initial=1500):
+    """
+    Returns {agent: rating}. A game between n players counts as a match between every
+    pair of them, won by whoever scored more vps, with k shared out over the n - 1
+    matches each player has. Games are taken in game id order.
+    """
+    ratings = defaultdict(lambda: float(initial))
+    for result in sorted(results, key=lambda r: r["game_id"]):
+        vps = result["vps"]
+        names = list(vps)
+        step = k / (len(names) - 1)
+        changes = Counter()
+        for i, a in enumerate(names):
+            for b in names[i + 1 :]:
+                expected = 1 / (1 + 10 ** ((ratings[b] - ratings[a]) / 400))
+                actual = 1.0 if vps[a] > vps[b] else 0.5 if vps[a] == vps[b] else 0.0
+                changes[a] += step * (actual - expected)
+                changes[b] -= step * (actual - expected)
+        for name in names:
+            ratings[name] += changes[name]
+    return dict(ratings)
+
+
+def standings(results, k=32):
+    """
+    Returns a row per agent, best rated first: rating, games, wins (shared between tied
+    winners), mean vps and mean vps by seat.
+    """
+    ratings = elo_ratings(results, k)
+    rows = {
+        name: {"agent": name, "rating": rating, "games": 0, "wins": 0.0, "vps": 0}
+        for name, rating in ratings.items()
+    }
+    seat_vps = defaultdict(list)
+    for result in results:
+        vps = result["vps"]
+        best = max(vps.values())
+        winners = [name for name in vps if vps[name] == best]
+        for seat, name in enumerate(result["seats"]):
+            rows[name]["games"] += 1
+            rows[name]["vps"] += vps[name]
+            if name in winners:
+                rows[name]["wins"] += 1 / len(winners)
+            seat_vps[name, seat].append(vps[name])
+    for name, row in rows.items():
+        row["vps"] /= row["games"]
+        row["seat_vps"] = {
+            seat: sum(v) / len(v)
+            for (n, seat), v in sorted(seat_vps.items())
+            if n == name
+        }
+    return sorted(rows.values(), key=lambda row: -row["rating"])
+
+
+def print_standings(rows):
+    print(f"{'Agent':<20}{'Rating':>8}{'Games':>7}{'Wins':>7}{'Mean VP':>9}")
+    for row in rows:
+        print(
+            f"{row['agent']:<20}{row['rating']:>8.0f}{row['games']:>7}"
+            f"{row['wins']:>7.1f}{row['vps']:>9.1f}"
+        )
@@ -0,0 +1,210 @@
+import json
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+from evaluation import MAX_PLAYERS, encode_state, seat_order
+
+FIELDS = (
+    "observations",
+    "masks",
+    "actions",
+    "policy_indices",
+    "policy_probs",
+    "outcomes",
+    "game_ids",
+)
+
+
+class TrajectoryWriter:
+    """
+    Streams self-play steps into fixed-size shards of .npy files in a directory.
+
+    Each step stores the encoded observation, the legal mask (bit-packed), the chosen
+    action index, the search policy as its top_k (index, probability) pairs, and the
+    final total vps of every player, ordered from the acting player's seat. Steps are held
+    until their game ends (when the outcome is known) and shards are written with a
+    temporary name and renamed, so a reader never sees a partial shard.
+    """
+
+    def __init__(self, directory, mask_size, shard_size=65_536, top_k=32):
+        self.directory = directory
+        self.mask_size = mask_size
+        self.shard_size = shard_size
+        self.top_k = top_k
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = _read_manifest(directory) or {
+            "mask_size": mask_size,
+            "top_k": top_k,
+            "shards": [],
+        }
+        if (self.manifest["mask_size"], self.manifest["top_k"]) != (mask_size, top_k):
+            raise ValueError(
+                f"{directory} holds shards with mask_size {self.manifest['mask_size']}"
+                f" and top_k {self.manifest['top_k']}."
+            )
+        self._rows = {field: [] for field in FIELDS}
+        self._game = []
+        self._game_id = sum(shard["games"] for shard in self.manifest["shards"])
+        # Row counts at which each buffered game ends.
+        self._game_ends = []
+
+    def add_step(self, game, player, mask, action, policy=None):
+        """
+        Records one decision. policy maps action indices to probabilities (or is None
+        for a one-hot policy on the chosen action).
+        """
+        if policy is None:
+            policy = {action: 1.0}
+        top = sorted(policy.items(), key=lambda item: -item[1])[: self.top_k]
+        indices = np.full(self.top_k, -1, dtype=np.int32)
+        probs = np.zeros(self.top_k, dtype=np.float32)
+        indices[: len(top)] = [index for index, _ in top]
+        probs[: len(top)] = [prob for _, prob in top]
+        self._game.append(
+            (
+                seat_order(game, player),
+                encode_state(game, player),
+                np.packbits(mask),
+                action,
+                indices,
+                probs,
+            )
+        )
+
+    def end_game(self, game):
+        """Attaches the final vps to the game's steps and queues them for writing."""
+        totals = {name: sum(player.vps) for name, player in game.players.items()}
+        for seats, observation, mask, action, indices, probs in self._game:
+            outcome = np.zeros(MAX_PLAYERS, dtype=np.float32)
+            outcome[: len(seats)] = [totals[name] for name in seats]
+            for field, value in zip(
+                FIELDS,
+                (observation, mask, action, indices, probs, outcome, self._game_id),
+            ):
+                self._rows[field].append(value)
+        self._game = []
+        self._game_id += 1
+        self._game_ends.append(len(self._rows["actions"]))
+        while len(self._rows["actions"]) >= self.shard_size:
+            self._write_shard(self.shard_size)
+
+    def close(self):
+        """Writes any remaining steps as a final, smaller shard."""
+        if self._rows["actions"]:
+            self._write_shard(len(self._rows["actions"]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_shard(self, n):
+        name = f"shard_{len(self.manifest['shards']):05d}"
+        dtypes = {"actions": np.int32, "game_ids": np.int64}
+        for field in FIELDS:
+            rows, self._rows[field] = self._rows[field][:n], self._rows[field][n:]
+            array = np.asarray(rows, dtype=dtypes.get(field))
+            path = os.path.join(self.directory, f"{name}_{field}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+        self.manifest["shards"].append(
+            {"name": name, "rows": n, "games": self._games_ended(n)}
+        )
+        _write_manifest(self.directory, self.manifest)
+
+    def _games_ended(self, n):
+        """Returns how many games end in the first n buffered rows, and forgets them."""
+        games = bisect_right(self._game_ends, n)
+        self._game_ends = [end - n for end in self._game_ends[games:]]
+        return games
+
+
+def _read_manifest(directory):
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, "manifest.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+class TrajectoryDataset:
+    """
+    Random access to the shards written by TrajectoryWriter. The .npy files are
+    memory-mapped, so only the rows a batch touches are read from disk.
+    """
+
+    def __init__(self, directory):
+        self.manifest = _read_manifest(directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No manifest.json in {directory}.")
+        self.mask_size = self.manifest["mask_size"]
+        self.shards = [
+            {
+                field: np.load(
+                    os.path.join(directory, f"{shard['name']}_{field}.npy"),
+                    mmap_mode="r",
+                )
+                for field in FIELDS
+            }
+            for shard in self.manifest["shards"]
+        ]
+        self.starts = []
+        total = 0
+        for shard in self.manifest["shards"]:
+            self.starts.append(total)
+            total += shard["rows"]
+        self.size = total
+
+    def __len__(self):
+        return self.size
+
+    def batch(self, indices):
+        """Returns a dict of arrays for the given rows, with the masks unpacked."""
+        if not self.size:
+            raise ValueError("The dataset has no rows.")
+        indices = np.asarray(indices)
+        order = np.argsort(indices, kind="stable")
+        sorted_indices = indices[order]
+        parts = {field: [] for field in FIELDS}
+        # Group the rows by shard so each shard is indexed once.
+        bounds = self.starts[1:] + [self.size]
+        for shard, start, end in zip(self.shards, self.starts, bounds):
+            lo, hi = np.searchsorted(sorted_indices, (start, end))
+            if lo == hi:
+                continue
+            rows = sorted_indices[lo:hi] - start
+            for field in FIELDS:
+                parts[field].append(shard[field][rows])
+        batch = {}
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(len(order))
+        for field in FIELDS:
+            batch[field] = np.concatenate(parts[field])[inverse]
+        batch["masks"] = np.unpackbits(
+            batch["masks"], axis=1, count=self.mask_size
+        ).astype(bool)
+        return batch
+
+    def sample(self, batch_size, rng=None):
+        if not self.size:
+            raise ValueError("The dataset has no rows.")
+        rng = rng or np.random.default_rng()
+        return self.batch(rng.integers(0, self.size, batch_size))
+
+    def row(self, index):
+        shard = bisect_right(self.starts, index) - 1
+        return {
+            field: self.shards[shard][field][index - self.starts[shard]]
+            for field in FIELDS
+        }
@@ -1,3 +1,8 @@
+import contextlib
+import sys
+import threading
+
+
 def iron_cost(iron_cubes: int) -> int:
     """Returns the cost of an iron cube given the number of iron cubes in the market."""
     return (12 - iron_cubes) // 2
@@ -40,58 +45,12 @@ def inverse_income_level(inc_level: int) -> int:
 
 
 def draw_map(map_, links=None, network_locs=None, occupied_locs=None):
-    import json
-    import networkx as nx
-    import matplotlib.pyplot as plt
-
-    with open("coords.json", "r", encoding="utf-8") as f:
-        fixed_pos = json.load(f)
-
-    if links is not None:
-        nx.draw_networkx_edges(
-            map_, fixed_pos, edgelist=links, edge_color="#FF2400", width=3
-        )
-        nx.draw_networkx_edges(
-            map_,
-            fixed_pos,
-            edgelist=set(map_.edges) - set(links),
-            edge_color="#808080",
-            style="dashed",
-        )
-        nx.draw_networkx_nodes(
-            map_,
-            fixed_pos,
-            nodelist=set(map_.nodes) - network_locs - occupied_locs,
-            node_color="#FFFFFF",
-            edgecolors="#000000",
-            node_size=800,
-        )
-        nx.draw_networkx_nodes(
-            map_, fixed_pos, nodelist=network_locs, node_color="#82c8e5", node_size=950
-        )
-        nx.draw_networkx_nodes(
-            map_,
-            fixed_pos,
-            nodelist=occupied_locs,
-            node_color="#FF2400",
-            node_size=1500,
-        )
-        nx.draw_networkx_labels(
-            map_, fixed_pos, font_color="#000000", font_size=9, font_weight="bold"
-        )
-    else:
-        nx.draw(
-            map_,
-            fixed_pos,
-            with_labels=True,
-            node_color="#FFFFFF",
-            edgecolors="#000000",
-            node_size=800,
-            font_color="#000000",
-            font_size=9,
-            font_weight="bold",
-        )
-    plt.show()
+    import map_rendering
+
+    # The board layout is drawn once and kept; only the link and node styles change.
+    renderer = map_rendering.shared_renderer(map_)
+    renderer.draw(links, network_locs, occupied_locs)
+    renderer.show()
 
 
 def print_scoreboard(scoreboard):
@@ -173,3 +132,48 @@ def print_scoreboard(scoreboard):
         table.add_row(*row)
 
     console.print(table)
+
+
+# Threads that are quiet drop what they print, through QuietStdout; unlike
+# contextlib.redirect_stdout(None), this leaves the output of other threads alone.
+_quiet = threading.local()
+_install_lock = threading.Lock()
+
+
+class QuietStdout:
+    """Stands in for stdout, dropping what quiet threads print."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        if getattr(_quiet, "depth", 0):
+            return len(text)
+        return self.stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def install_quiet_stdout():
+    with _install_lock:
+        # None is left alone: inside contextlib.redirect_stdout(None) all is dropped.
+        if sys.stdout is not None and not isinstance(sys.stdout, QuietStdout):
+            sys.stdout = QuietStdout(sys.stdout)
+
+
+def quiet_thread():
+    """Makes the current thread quiet for good, e.g. a server's worker threads."""
+    install_quiet_stdout()
+    _quiet.depth = 1
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silences what the current thread prints inside the block."""
+    install_quiet_stdout()
+    _quiet.depth = getattr(_quiet, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _quiet.depth -= 1
@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+import action_generation
+import utils
+
+Outcome = namedtuple(
+    "Outcome",
+    [
+        "action",
+        "money",
+        "income",
+        "income_level",
+        "vps",
+        "projected_vps",
+        "coal_market",
+        "iron_market",
+        "error",
+    ],
+)
+
+
+def evaluate_actions(game, player, actions):
+    """
+    Returns an Outcome for each candidate action, showing where the player would stand
+    after taking it. Each action is tried on a copy, so the game itself is never changed
+    and nothing is printed.
+
+    projected_vps is the player's total if the era ended straight after the action. An
+    action the engine cannot carry out gets an Outcome with only the error filled in.
+    """
+    outcomes = []
+    with utils.quiet():
+        for action in actions:
+            fork = game.copy()
+            try:
+                action_generation.apply_action(fork, player, action)
+            except (KeyError, IndexError, ValueError, TypeError) as e:
+                outcomes.append(Outcome(action, *[None] * 7, error=repr(e)))
+                continue
+            p = fork.players[player]
+            outcomes.append(
+                Outcome(
+                    action,
+                    p.money,
+                    p.income,
+                    utils.income_level(p.income),
+                    sum(p.vps),
+                    sum(fork.projected_vps()[player]),
+                    fork.coal_market,
+                    fork.iron_market,
+                    None,
+                )
+            )
+    return outcomes
+
+
+def rank_actions(game, player, actions=None, kinds=None):
+    """
+    Evaluates the given actions (or every legal action, optionally only of the given
+    kinds such as ("build",)) and returns the outcomes best first: highest projected vps,
+    then highest income, then most money left.
+    """
+    if actions is None:
+        actions = action_generation.legal_actions(game, player)
+    if kinds is not None:
+        actions = [action for action in actions if action.kind in kinds]
+    outcomes = [o for o in evaluate_actions(game, player, actions) if o.error is None]
+    outcomes.sort(key=lambda o: (o.projected_vps, o.income, o.money), reverse=True)
+    return outcomes